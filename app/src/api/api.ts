@@ -1,4 +1,4 @@
-import { AskRequest, AskResponse, ChatRequest, UploadRequest, UploadResponse } from "./models";
+import { AskRequest, AskResponse, ChatRequest, ChatStreamEvent, UploadRequest, UploadResponse } from "./models";
 
 export async function askApi(options: AskRequest): Promise<AskResponse> {
     const response = await fetch("/ask", {
@@ -61,6 +61,64 @@ export async function chatApi(options: ChatRequest): Promise<AskResponse> {
     return parsedResponse;
 }
 
+export async function chatStreamApi(options: ChatRequest, onUpdate: (partial: AskResponse) => void): Promise<AskResponse> {
+    const response = await fetch("/chat/stream", {
+        method: "POST",
+        headers: {
+            "Content-Type": "application/json"
+        },
+        body: JSON.stringify({
+            history: options.history,
+            approach: options.approach,
+            overrides: {
+                semantic_ranker: options.overrides?.semanticRanker,
+                semantic_captions: options.overrides?.semanticCaptions,
+                top: options.overrides?.top,
+                temperature: options.overrides?.temperature,
+                exclude_category: options.overrides?.excludeCategory,
+                suggest_followup_questions: options.overrides?.suggestFollowupQuestions
+            }
+        })
+    });
+    if (response.status > 299 || !response.ok || !response.body) {
+        throw Error("Unknown error");
+    }
+
+    const result: AskResponse = { answer: "", thoughts: null, data_points: [] };
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = "";
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += value;
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+        for (const raw of events) {
+            const event: ChatStreamEvent = { event: "", data: {} };
+            for (const line of raw.split("\n")) {
+                if (line.startsWith("event: ")) {
+                    event.event = line.slice(7);
+                } else if (line.startsWith("data: ")) {
+                    event.data = JSON.parse(line.slice(6));
+                }
+            }
+            if (event.event === "data_points") {
+                result.data_points = event.data.data_points;
+                result.thoughts = event.data.thoughts;
+            } else if (event.event === "answer") {
+                result.answer += event.data.content;
+            } else if (event.event === "error") {
+                throw Error(event.data.detail || "Unknown error");
+            }
+            onUpdate({ ...result });
+        }
+    }
+
+    return result;
+}
+
 export async function uploadApi(options: UploadRequest): Promise<UploadResponse> {
     const formData = new FormData();
     formData.append("uploaded_file", options.file);
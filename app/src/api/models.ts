@@ -29,6 +29,11 @@ export type AskResponse = {
     error?: string;
 };
 
+export type ChatStreamEvent = {
+    event: string;
+    data: any;
+};
+
 export type ChatTurn = {
     user: string;
     bot?: string;
@@ -47,5 +52,6 @@ export type UploadRequest = {
 
 export type UploadResponse = {
     status: string;
+    job_id?: string;
     error?: string;
 };
@@ -3,7 +3,7 @@ import { Checkbox, Panel, DefaultButton, TextField, SpinButton } from "@fluentui
 
 import styles from "./Chat.module.css";
 
-import { chatApi, Approaches, AskResponse, ChatRequest, ChatTurn } from "../../api";
+import { chatStreamApi, Approaches, AskResponse, ChatRequest, ChatTurn } from "../../api";
 import { Answer, AnswerError, AnswerLoading } from "../../components/Answer";
 import { QuestionInput } from "../../components/QuestionInput";
 import { UserChatMessage } from "../../components/UserChatMessage";
@@ -54,7 +54,10 @@ const Chat = () => {
                     suggestFollowupQuestions: useSuggestFollowupQuestions
                 }
             };
-            const result = await chatApi(request);
+            const result = await chatStreamApi(request, partial => {
+                setIsLoading(false);
+                setAnswers([...answers, [question, partial]]);
+            });
             setAnswers([...answers, [question, result]]);
         } catch (e) {
             setError(e);
@@ -0,0 +1,62 @@
+import sys
+import json
+import asyncio
+import logging
+import argparse
+
+from fastapi import FastAPI
+
+from athena.core.lifespan import azure_resource_connections
+from athena.libs.batch import run_batch
+from athena.routers.chat import answerer
+
+logger = logging.getLogger()
+
+
+async def run_batch_file(
+    input_path: str, output_path: str | None, concurrency: int
+) -> dict:
+    app = FastAPI()
+    source = sys.stdin if input_path == "-" else open(input_path, encoding="utf-8")
+    output = sys.stdout if output_path is None else open(output_path, "w")
+    summary = {}
+    try:
+        async with azure_resource_connections(app):
+            async for record in run_batch(
+                source, answer=answerer(app.state), concurrency=concurrency
+            ):
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                summary = record.get("summary", summary)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return summary
+
+
+def batch() -> None:
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of Chat payloads with bounded concurrency"
+    )
+    parser.add_argument("input", help="JSONL of Chat payloads, or - for stdin")
+    parser.add_argument(
+        "-o", "--output", help="where to write the answers, stdout by default"
+    )
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("concurrency must be at least 1")
+    # Answers go to stdout, so logs go to stderr.
+    logging.basicConfig(
+        stream=sys.stderr, level=logging.WARNING, format="%(asctime)s | %(message)s"
+    )
+    summary = asyncio.run(
+        run_batch_file(
+            input_path=args.input,
+            output_path=args.output,
+            concurrency=args.concurrency,
+        )
+    )
+    print(json.dumps(summary, indent=2), file=sys.stderr)
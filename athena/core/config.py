@@ -6,6 +6,11 @@ class ApiSettings(BaseSettings):
     env_state: Literal["dev", "prod"]
     logger_file: str
     cors_origin: str
+    log_level: str = "DEBUG"
+    log_levels: dict[str, str] = {}
+    log_format: Literal["text", "json"] = "text"
+    log_queue: bool = True
+    log_sample_rate: float = 1.0
 
     class Config:
         env_file = ".api.env"
@@ -32,3 +37,79 @@ class OpenAISettings(BaseSettings):
 
     class Config:
         env_file = ".openapi.env"
+
+
+class CacheSettings(BaseSettings):
+    query_cache_backend: Literal["memory", "disk", "none"] = "memory"
+    query_cache_size: int = 4096
+    query_cache_ttl: float | None = 24 * 60 * 60
+    query_cache_path: str = ".cache/query_cache.sqlite3"
+    search_cache_backend: Literal["memory", "disk", "none"] = "memory"
+    search_cache_size: int = 4096
+    search_cache_ttl: float | None = 15 * 60
+    search_cache_path: str = ".cache/search_cache.sqlite3"
+    file_list_ttl: float = 30.0
+    content_cache_dir: str = ".cache/content"
+    content_cache_size: int = 256 * 1024 * 1024
+    content_cache_max_item: int = 16 * 1024 * 1024
+
+    class Config:
+        env_file = ".cache.env"
+
+
+class IngestSettings(BaseSettings):
+    ingest_workers: int = 2
+    ingest_queue_size: int = 32
+    ingest_job_history: int = 1000
+    upload_workers: int = 8
+    upload_window: int = 16
+    upload_retries: int = 3
+    upload_retry_backoff: float = 0.5
+    upload_spool_dir: str | None = None
+    index_batch_size: int = 1000
+    index_batch_bytes: int = 15 * 1024 * 1024
+    index_workers: int = 4
+    index_retries: int = 3
+    index_retry_backoff: float = 0.5
+    ingest_manifest_path: str | None = ".cache/ingest_manifest.sqlite3"
+
+    class Config:
+        env_file = ".ingest.env"
+
+
+class PromptSettings(BaseSettings):
+    answer_tokens: int = 1024
+    history_tokens: int = 1000
+    context_windows: dict[str, int] = {}
+    duplicate_threshold: float = 0.8
+    followup_model: str | None = None
+    followup_tokens: int = 64
+
+    class Config:
+        env_file = ".prompt.env"
+
+
+class SearchSettings(BaseSettings):
+    search_backend: Literal["azure", "local"] = "azure"
+    local_index_dir: str = ".cache/search_index"
+    local_index_flush_every: int = 10000
+
+    class Config:
+        env_file = ".search.env"
+
+
+class VectorSettings(BaseSettings):
+    vector_search: bool = False
+    embedding_model: str = "text-embedding-ada-002"
+    embedding_batch_size: int = 16
+    embedding_cache_backend: Literal["memory", "disk", "none"] = "disk"
+    embedding_cache_size: int = 100000
+    embedding_cache_path: str = ".cache/embeddings.sqlite3"
+    vector_index_dir: str = ".cache/vector_index"
+    vector_dtype: Literal["float16", "float32"] = "float16"
+    vector_partitions: int = 0
+    vector_probes: int = 8
+    vector_flush_every: int = 10000
+
+    class Config:
+        env_file = ".vector.env"
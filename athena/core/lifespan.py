@@ -1,12 +1,32 @@
+import asyncio
 import logging
 
+from typing import Callable
+from pathlib import Path
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from athena.core.config import AzureSettings
+from athena.core.config import (
+    AzureSettings,
+    CacheSettings,
+    IngestSettings,
+    SearchSettings,
+    VectorSettings,
+)
+from athena.libs.cache import SearchResultCache, build_cache
+from athena.libs.jobs import IngestQueue
+from athena.libs.listing import FileListCache
+from athena.libs.content import ContentCache
+from athena.libs.ingest import BlobUploader
+from athena.libs.batch_indexer import BatchIndexer
+from athena.libs.manifest import IngestManifest
+from athena.libs.search import AsyncLocalSearchIndex, LocalSearchIndex
+from athena.libs.vectors import Embedder, VectorIndex, VectorStore
+from athena.routers.chat import chat_approaches
 from azure.storage.blob import BlobServiceClient, ContainerClient
 from azure.ai.formrecognizer import DocumentAnalysisClient
 from azure.core.credentials import AzureKeyCredential
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 
 logger = logging.getLogger()
 
@@ -42,13 +62,147 @@ def get_cognitive_search_connection(azure_config: AzureSettings) -> SearchClient
     return search_client
 
 
-@asynccontextmanager
-async def azure_resource_connections(app: FastAPI):
+def get_async_cognitive_search_connection(
+    azure_config: AzureSettings,
+) -> AsyncSearchClient:
+    search_client = AsyncSearchClient(
+        endpoint=f"https://{azure_config.search_service}.search.windows.net/",
+        index_name=azure_config.search_index,
+        credential=AzureKeyCredential(azure_config.search_keys),
+    )
+    logger.info("Created async azure cognitive search client")
+    return search_client
+
+
+def get_local_search_index(search_config: SearchSettings) -> LocalSearchIndex:
+    search_index = LocalSearchIndex(
+        directory=search_config.local_index_dir,
+        flush_every=search_config.local_index_flush_every,
+    )
+    logger.info(f"Opened local search index with {len(search_index)} documents")
+    return search_index
+
+
+def get_vector_store(vector_config: VectorSettings) -> VectorStore:
+    embedder = Embedder(
+        model=vector_config.embedding_model,
+        batch_size=vector_config.embedding_batch_size,
+        cache=build_cache(
+            backend=vector_config.embedding_cache_backend,
+            maxsize=vector_config.embedding_cache_size,
+            ttl=None,
+            path=vector_config.embedding_cache_path,
+        ),
+    )
+    index = VectorIndex(
+        directory=vector_config.vector_index_dir,
+        dtype=vector_config.vector_dtype,
+        partitions=vector_config.vector_partitions,
+        probes=vector_config.vector_probes,
+        flush_every=vector_config.vector_flush_every,
+    )
+    logger.info(f"Opened vector index with {len(index)} vectors")
+    return VectorStore(embedder=embedder, index=index)
+
+
+def connect_azure_services(app: FastAPI) -> None:
     config = AzureSettings()
     app.state.blob_container = get_blob_container_connection(config)
     app.state.formrecognizer = get_formrecognizer_connection(config)
-    app.state.cognitive_search = get_cognitive_search_connection(config)
+    search_config = SearchSettings()
+    if search_config.search_backend == "local":
+        app.state.cognitive_search = get_local_search_index(search_config)
+        app.state.async_cognitive_search = AsyncLocalSearchIndex(
+            app.state.cognitive_search
+        )
+    else:
+        app.state.cognitive_search = get_cognitive_search_connection(config)
+        app.state.async_cognitive_search = get_async_cognitive_search_connection(config)
+
+
+@asynccontextmanager
+async def azure_resource_connections(
+    app: FastAPI, connect: Callable[[FastAPI], None] = connect_azure_services
+):
+    # `connect` sets the blob container, form recognizer and search clients;
+    # benchmarks swap in local fakes here.
+    connect(app)
+    vector_config = VectorSettings()
+    app.state.vector_store = (
+        get_vector_store(vector_config) if vector_config.vector_search else None
+    )
+    cache_config = CacheSettings()
+    app.state.query_cache = build_cache(
+        backend=cache_config.query_cache_backend,
+        maxsize=cache_config.query_cache_size,
+        ttl=cache_config.query_cache_ttl,
+        path=cache_config.query_cache_path,
+    )
+    search_cache = build_cache(
+        backend=cache_config.search_cache_backend,
+        maxsize=cache_config.search_cache_size,
+        ttl=cache_config.search_cache_ttl,
+        path=cache_config.search_cache_path,
+    )
+    app.state.search_cache = (
+        SearchResultCache(search_cache) if search_cache is not None else None
+    )
+    app.state.file_list = FileListCache(ttl=cache_config.file_list_ttl)
+    app.state.content_cache = (
+        ContentCache(
+            directory=cache_config.content_cache_dir,
+            max_bytes=cache_config.content_cache_size,
+            max_item_bytes=cache_config.content_cache_max_item,
+        )
+        if cache_config.content_cache_size > 0
+        else None
+    )
+    ingest_config = IngestSettings()
+    app.state.ingest_queue = IngestQueue(
+        workers=ingest_config.ingest_workers,
+        queue_size=ingest_config.ingest_queue_size,
+        job_history=ingest_config.ingest_job_history,
+    )
+    app.state.upload_spool_dir = ingest_config.upload_spool_dir
+    if ingest_config.upload_spool_dir is not None:
+        Path(ingest_config.upload_spool_dir).mkdir(parents=True, exist_ok=True)
+    app.state.blob_uploader = BlobUploader(
+        workers=ingest_config.upload_workers,
+        window=ingest_config.upload_window,
+        retries=ingest_config.upload_retries,
+        backoff=ingest_config.upload_retry_backoff,
+    )
+    app.state.search_indexer = BatchIndexer(
+        max_documents=ingest_config.index_batch_size,
+        max_bytes=ingest_config.index_batch_bytes,
+        workers=ingest_config.index_workers,
+        retries=ingest_config.index_retries,
+        backoff=ingest_config.index_retry_backoff,
+    )
+    app.state.ingest_manifest = (
+        IngestManifest(ingest_config.ingest_manifest_path)
+        if ingest_config.ingest_manifest_path
+        else None
+    )
+    # Encodings may be downloaded; fetch them now, off the event loop, rather
+    # than in the first chat.
+    await asyncio.gather(
+        *(asyncio.to_thread(impl.load_tokenizers) for impl in chat_approaches.values())
+    )
+    await app.state.ingest_queue.start()
     yield
+    await app.state.ingest_queue.stop()
+    app.state.blob_uploader.close()
+    app.state.search_indexer.close()
+    if app.state.ingest_manifest is not None:
+        app.state.ingest_manifest.close()
+    if app.state.vector_store is not None:
+        app.state.vector_store.close()
     app.state.blob_container.close()
     app.state.formrecognizer.close()
     app.state.cognitive_search.close()
+    await app.state.async_cognitive_search.close()
+    if app.state.query_cache is not None:
+        app.state.query_cache.close()
+    if app.state.search_cache is not None:
+        app.state.search_cache.close()
@@ -1,8 +1,15 @@
 import sys
+import copy
+import json
+import queue
+import atexit
+import random
 import logging
 
 from pathlib import Path
+from datetime import datetime, timezone
 from functools import lru_cache
+from logging.handlers import QueueHandler, QueueListener
 from athena.core.config import ApiSettings
 from athena.core.models import LoggerConfig
 from rich.logging import RichHandler
@@ -13,41 +20,113 @@ LOGGER_FILE = Path(settings.logger_file)  # where log is stored
 DATE_FORMAT = "%d %b %Y | %H:%M:%S"
 LOGGER_FORMAT = "%(asctime)s | %(message)s"
 
+listener: QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a `rate` fraction of INFO and DEBUG records; warnings and errors
+    always pass."""
+
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.INFO or random.random() < self.rate
+
+
+class LogQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler, leave formatting to the listener's handlers and
+        # keep exc_info so Rich can still render the traceback there.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def file_handler(formatter: logging.Formatter) -> logging.Handler:
+    output_file_handler = logging.FileHandler(LOGGER_FILE)
+    output_file_handler.setFormatter(formatter)
+    return output_file_handler
+
 
 @lru_cache
 def get_logger_config():
-    if settings.env_state != "prod":
-        output_file_handler = logging.FileHandler(LOGGER_FILE)
-        handler_format = logging.Formatter(LOGGER_FORMAT, datefmt=DATE_FORMAT)
-        output_file_handler.setFormatter(handler_format)
+    level = logging.getLevelName(settings.log_level.upper())
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        stdout_handler.setFormatter(formatter)
+        return LoggerConfig(
+            handlers=[file_handler(formatter), stdout_handler],
+            format=None,
+            logger_file=LOGGER_FILE,
+            level=level,
+        )
 
+    handler_format = logging.Formatter(LOGGER_FORMAT, datefmt=DATE_FORMAT)
+    if settings.env_state != "prod":
         return LoggerConfig(
             handlers=[
                 RichHandler(
                     rich_tracebacks=True, tracebacks_show_locals=True, show_time=False
                 ),
-                output_file_handler,
+                file_handler(handler_format),
             ],
             format=None,
             date_format=DATE_FORMAT,
             logger_file=LOGGER_FILE,
+            level=level,
         )
 
-    output_file_handler = logging.FileHandler(LOGGER_FILE)
-    handler_format = logging.Formatter(LOGGER_FORMAT, datefmt=DATE_FORMAT)
-    output_file_handler.setFormatter(handler_format)
-
     stdout_handler = logging.StreamHandler(sys.stdout)
     stdout_handler.setFormatter(handler_format)
 
     return LoggerConfig(
-        handlers=[output_file_handler, stdout_handler],
+        handlers=[file_handler(handler_format), stdout_handler],
         format="%(levelname)s: %(asctime)s \t%(message)s",
         date_format="%d-%b-%y %H:%M:%S",
         logger_file=LOGGER_FILE,
+        level=level,
     )
 
 
+def start_queue_listener(handlers: list[logging.Handler]) -> LogQueueHandler:
+    """Move `handlers` onto a background thread and return the handler that
+    feeds it."""
+    global listener
+    stop_queue_listener()
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return LogQueueHandler(log_queue)
+
+
+def stop_queue_listener() -> None:
+    """Flush queued records and stop the listener thread."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+atexit.register(stop_queue_listener)
+
+
 def setup_rich_logger():
     for name in logging.root.manager.loggerDict.keys():
         logging.getLogger(name).handlers = []
@@ -55,9 +134,19 @@ def setup_rich_logger():
 
     logger_config = get_logger_config()
 
+    handlers = logger_config.handlers
+    if settings.log_queue:
+        handlers = [start_queue_listener(handlers)]
+    if settings.log_sample_rate < 1:
+        # Sample before queueing, so dropped records cost nothing more.
+        for handler in handlers:
+            handler.addFilter(SamplingFilter(settings.log_sample_rate))
+
     logging.basicConfig(
         level=logger_config.level,
         format=logger_config.format,
         datefmt=logger_config.date_format,
-        handlers=logger_config.handlers,
+        handlers=handlers,
     )
+    for name, level in settings.log_levels.items():
+        logging.getLogger(name).setLevel(level.upper())
@@ -1,8 +1,9 @@
 import logging
 
 from pathlib import Path
+from datetime import datetime
 from typing import Literal
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, root_validator
 
 
 class LoggerConfig(BaseModel):
@@ -20,6 +21,11 @@ class Overrides(BaseModel):
     top: int | None = 3
     temperature: float = 0.7
     suggest_followup_questions: bool = True
+    deduplicate_sources: bool = True
+    retrieval_mode: Literal["text", "vector", "hybrid"] = "text"
+    include_timings: bool = False
+    query_rewrite: Literal["always", "speculative"] = "always"
+    followup_mode: Literal["inline", "separate"] = "inline"
 
 
 class ChatHistory(BaseModel):
@@ -43,3 +49,89 @@ class MessageResponse(BaseModel):
     data_points: list[str]
     answer: str
     thoughts: str
+    followup_questions: list[str] = []
+
+
+class ChunkingOptions(BaseModel):
+    max_section_length: int = Field(1000, gt=0)
+    sentence_search_limit: int = Field(100, ge=0)
+    section_overlap: int = Field(100, ge=0)
+
+    @root_validator(skip_on_failure=True)
+    def overlap_shorter_than_section(cls, values):
+        if values["section_overlap"] >= values["max_section_length"]:
+            raise ValueError("section_overlap must be less than max_section_length")
+        return values
+
+
+class FileIndexingReport(BaseModel):
+    indexed: int = 0
+    failed: int = 0
+    errors: dict[str, str] = Field(default_factory=dict)
+
+
+class IndexingReport(BaseModel):
+    batches: int = 0
+    retries: int = 0
+    files: dict[str, FileIndexingReport] = Field(default_factory=dict)
+
+    @property
+    def failed(self) -> int:
+        return sum(f.failed for f in self.files.values())
+
+
+class StoredFile(BaseModel):
+    name: str
+    blobs: int = 0
+    size: int = 0
+    last_modified: datetime | None = None
+
+
+class FileList(BaseModel):
+    files: list[StoredFile]
+    continuation_token: str | None = None
+
+
+class BlobContent(BaseModel):
+    name: str
+    etag: str
+    size: int
+    content_type: str
+
+
+class FileManifest(BaseModel):
+    sourcefile: str
+    file_hash: str
+    pages: dict[str, str] = Field(default_factory=dict)
+    sections: list[str] = Field(default_factory=list)
+    complete: bool = True
+
+
+class IngestJob(BaseModel):
+    id: str
+    filename: str
+    category: str | None = None
+    stage: Literal[
+        "queued",
+        "uploading",
+        "analyzing",
+        "chunking",
+        "embedding",
+        "indexing",
+        "done",
+        "failed",
+    ] = "queued"
+    pages_total: int | None = None
+    pages_uploaded: int = 0
+    pages_skipped: int = 0
+    pages_analyzed: int = 0
+    sections_indexed: int = 0
+    sections_embedded: int = 0
+    sections_failed: int = 0
+    sections_unchanged: int = 0
+    sections_deleted: int = 0
+    indexing: IndexingReport | None = None
+    timings: dict[str, float] = Field(default_factory=dict)
+    error: str | None = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: datetime | None = None
@@ -0,0 +1,108 @@
+import math
+import time
+import asyncio
+import logging
+
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+
+from athena.core.models import Chat, MessageResponse
+
+logger = logging.getLogger()
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def latency_summary(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+    }
+
+
+class BatchSummary:
+    def __init__(self, concurrency: int) -> None:
+        self.concurrency = concurrency
+        self.started = time.perf_counter()
+        self.latencies: list[float] = []
+        self.failed = 0
+
+    def add(self, record: dict) -> None:
+        if "error" in record:
+            self.failed += 1
+        else:
+            self.latencies.append(record["latency"])
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        requests = len(self.latencies) + self.failed
+        return {
+            "requests": requests,
+            "succeeded": len(self.latencies),
+            "failed": self.failed,
+            "concurrency": self.concurrency,
+            "elapsed": elapsed,
+            "requests_per_second": requests / elapsed if elapsed else 0.0,
+            "latency": latency_summary(self.latencies),
+        }
+
+
+async def run_batch(
+    lines: Iterable[str],
+    answer: Callable[[Chat], Awaitable[MessageResponse]],
+    concurrency: int = 8,
+) -> AsyncIterator[dict]:
+    """Answer a JSONL stream of Chat payloads with at most `concurrency`
+    chats in flight, yielding one record per line in input order and a
+    summary record last.
+
+    Records carry the 1-based input line and either the MessageResponse
+    fields plus the latency in seconds, or an error.
+    """
+    summary = BatchSummary(concurrency=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    pending: deque[asyncio.Task] = deque()
+
+    async def run(number: int, line: str) -> dict:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await answer(Chat.parse_raw(line))
+            except Exception as e:
+                logger.warning(f"Batch line {number} failed: {e}")
+                return {"line": number, "error": str(e)}
+            return {
+                "line": number,
+                "latency": time.perf_counter() - start,
+                **response.dict(),
+            }
+
+    try:
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            pending.append(asyncio.ensure_future(run(number, line)))
+            # Keep a bounded number of answers buffered behind the slowest
+            # one, which has to be written first.
+            if len(pending) >= 2 * concurrency:
+                record = await pending.popleft()
+                summary.add(record)
+                yield record
+        while pending:
+            record = await pending.popleft()
+            summary.add(record)
+            yield record
+        yield {"summary": summary.report()}
+    finally:
+        for task in pending:
+            task.cancel()
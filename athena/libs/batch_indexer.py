@@ -0,0 +1,164 @@
+import json
+import time
+import logging
+
+from typing import Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from azure.core.exceptions import AzureError
+
+from athena.core.models import FileIndexingReport, IndexingReport
+from athena.libs.search import SearchBackend
+
+logger = logging.getLogger("indexer")
+
+# Azure Search rejects index requests over 16 MB; leave room for the envelope.
+MAX_BATCH_BYTES = 15 * 1024 * 1024
+# Per-document statuses the service documents as transient.
+RETRYABLE_STATUS_CODES = {409, 422, 503}
+
+
+class BatchIndexer:
+    def __init__(
+        self,
+        max_documents: int = 1000,
+        max_bytes: int = MAX_BATCH_BYTES,
+        workers: int = 4,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ) -> None:
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="search-index"
+        )
+
+    def batches(self, documents: Iterable[dict]) -> Iterator[list[dict]]:
+        batch = []
+        size = 0
+        for document in documents:
+            # Each action carries "@search.action" plus JSON separators.
+            document_size = len(json.dumps(document, default=str).encode("utf-8")) + 32
+            if batch and (
+                len(batch) >= self.max_documents
+                or size + document_size > self.max_bytes
+            ):
+                yield batch
+                batch = []
+                size = 0
+            batch.append(document)
+            size += document_size
+        if batch:
+            yield batch
+
+    def send(
+        self, client: SearchBackend, action: str, batch: list[dict]
+    ) -> tuple[dict[str, str | None], int]:
+        """Send a batch of upload or delete actions, retrying transient
+        failures of individual keys.
+
+        Returns the final error per key (None when indexed) and the number
+        of retries it took.
+        """
+        pending = {document["id"]: document for document in batch}
+        outcome = {}
+        retries = 0
+        for attempt in range(self.retries + 1):
+            if attempt:
+                retries += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                results = getattr(client, f"{action}_documents")(
+                    documents=list(pending.values())
+                )
+            except AzureError as e:
+                logger.warning(f"Indexing batch of {len(pending)} failed: {e}")
+                outcome.update({key: str(e) for key in pending})
+                continue
+            for result in results:
+                if result.succeeded:
+                    outcome[result.key] = None
+                    pending.pop(result.key, None)
+                else:
+                    outcome[
+                        result.key
+                    ] = f"{result.status_code}: {result.error_message}"
+                    if result.status_code not in RETRYABLE_STATUS_CODES:
+                        pending.pop(result.key, None)
+            if not pending:
+                break
+        return outcome, retries
+
+    def index(
+        self,
+        client: SearchBackend,
+        sections: Iterable[dict],
+        on_progress: Callable[[int, int], None] | None = None,
+    ) -> IndexingReport:
+        return self.run(
+            client=client, action="upload", documents=sections, on_progress=on_progress
+        )
+
+    def delete(
+        self, client: SearchBackend, keys: Iterable[str], sourcefile: str | None = None
+    ) -> IndexingReport:
+        return self.run(
+            client=client,
+            action="delete",
+            documents=({"id": key} for key in keys),
+            sourcefile=sourcefile,
+        )
+
+    def run(
+        self,
+        client: SearchBackend,
+        action: str,
+        documents: Iterable[dict],
+        on_progress: Callable[[int, int], None] | None = None,
+        sourcefile: str | None = None,
+    ) -> IndexingReport:
+        report = IndexingReport()
+        sourcefiles = {}
+        in_flight: set[Future] = set()
+
+        def collect(done: set[Future]) -> None:
+            for future in done:
+                outcome, retries = future.result()
+                report.retries += retries
+                succeeded = failed = 0
+                for key, error in outcome.items():
+                    file_report = report.files.setdefault(
+                        sourcefiles.pop(key, None), FileIndexingReport()
+                    )
+                    if error is None:
+                        file_report.indexed += 1
+                        succeeded += 1
+                    else:
+                        file_report.failed += 1
+                        file_report.errors[key] = error
+                        failed += 1
+                if on_progress is not None:
+                    on_progress(succeeded, failed)
+
+        try:
+            for batch in self.batches(documents):
+                for document in batch:
+                    sourcefiles[document["id"]] = document.get("sourcefile", sourcefile)
+                # Keep a bounded number of batches queued behind the workers.
+                if len(in_flight) >= 2 * self.workers:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(self._executor.submit(self.send, client, action, batch))
+                report.batches += 1
+            done, in_flight = wait(in_flight)
+            collect(done)
+        finally:
+            for future in in_flight:
+                future.cancel()
+        return report
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,341 @@
+import re
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable, Iterable
+from collections import OrderedDict, defaultdict
+
+logger = logging.getLogger()
+
+WHITESPACE = re.compile(r"\s+")
+# Hits whose access time is held in memory before one batched write.
+TOUCH_BATCH = 256
+
+
+def normalize_text(text: str) -> str:
+    """Fold case and whitespace, for keys on what a user typed. Filter values
+    are exact and must not go through this."""
+    return WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def make_key(*parts: Any) -> str:
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cache(ABC):
+    # Whether lookups do I/O, so async callers run them on a thread.
+    blocking = False
+
+    def __init__(self, maxsize: int, ttl: float | None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Called, outside the cache's lock, with each key it drops by itself.
+        self.on_evict: Callable[[str], None] | None = None
+
+    def get(self, key: str) -> Any | None:
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        self._set(key, value, expires)
+
+    async def aget(self, key: str) -> Any | None:
+        if self.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        if self.blocking:
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def evicted(self, keys: Iterable[str]) -> None:
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    @abstractmethod
+    def _get(self, key: str) -> Any | None:
+        ...
+
+    @abstractmethod
+    def _set(self, key: str, value: Any, expires: float | None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryCache(Cache):
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._data: OrderedDict[str, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is None or expires >= time.monotonic():
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+        self.evicted([key])
+        return None
+
+    def _set(self, key: str, value: Any, expires: float | None) -> None:
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[0])
+        self.evicted(evicted)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DiskCache(Cache):
+    blocking = True
+
+    def __init__(
+        self, path: str | Path, maxsize: int = 1024, ttl: float | None = None
+    ) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS accessed ON cache (accessed)")
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        # Access times of hits not yet written, so a hit is only a read.
+        self._touched: dict[str, float] = {}
+
+    def _get(self, key: str) -> Any | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires = row
+            if expires is None or expires >= now:
+                self._touched[key] = now
+                if len(self._touched) >= TOUCH_BATCH:
+                    self._flush_touched()
+                    self._db.commit()
+                return json.loads(value)
+            self._delete(key)
+            self._db.commit()
+        self.evicted([key])
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        # Expiry is stored as wall-clock time so it survives restarts.
+        self._set(key, value, time.time() + self.ttl if self.ttl else None)
+
+    def _set(self, key: str, value: Any, expires: float | None) -> None:
+        evicted = []
+        with self._lock:
+            exists = self._db.execute(
+                "SELECT 1 FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, time.time()),
+            )
+            self._touched.pop(key, None)
+            if not exists:
+                self._count += 1
+            if self._count > self.maxsize:
+                evicted = self._evict(self._count - self.maxsize)
+            self._db.commit()
+        self.evicted(evicted)
+
+    def _evict(self, count: int) -> list[str]:
+        # Pending access times decide what is least recently used.
+        self._flush_touched()
+        keys = [
+            key
+            for (key,) in self._db.execute(
+                "SELECT key FROM cache ORDER BY accessed LIMIT ?", (count,)
+            )
+        ]
+        self._db.executemany("DELETE FROM cache WHERE key = ?", ((k,) for k in keys))
+        self._count -= len(keys)
+        return keys
+
+    def _flush_touched(self) -> None:
+        if self._touched:
+            self._db.executemany(
+                "UPDATE cache SET accessed = ? WHERE key = ?",
+                ((accessed, key) for key, accessed in self._touched.items()),
+            )
+            self._touched.clear()
+
+    def _delete(self, key: str) -> None:
+        self._touched.pop(key, None)
+        cursor = self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        self._count -= cursor.rowcount
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._delete(key)
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+            self._touched.clear()
+            self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+
+
+class SearchResultCache:
+    def __init__(self, cache: Cache) -> None:
+        self.cache = cache
+        # Seeded from the clock so entries a disk backend kept from an earlier
+        # process are never served against an index that changed since.
+        self.generation = time.time_ns()
+        self.invalidations = 0
+        self._by_source: defaultdict[str, set[str]] = defaultdict(set)
+        self._sources: dict[str, set[str]] = {}
+        # Reentrant, as the cache reports its evictions from within set().
+        self._lock = threading.RLock()
+        cache.on_evict = self.forget
+
+    def key(self, *params: Any) -> tuple[int, str]:
+        return self.invalidations, make_key(self.generation, *params)
+
+    def get(self, key: tuple[int, str]) -> list[dict] | None:
+        return self.cache.get(key[1])
+
+    async def aget(self, key: tuple[int, str]) -> list[dict] | None:
+        return await self.cache.aget(key[1])
+
+    def set(
+        self, key: tuple[int, str], docs: list[dict], sourcefiles: Iterable[str]
+    ) -> None:
+        with self._lock:
+            # Drop results of searches that raced with an invalidation.
+            if key[0] != self.invalidations:
+                return
+            self.forget(key[1])
+            self._sources[key[1]] = set(sourcefiles)
+            for sourcefile in self._sources[key[1]]:
+                self._by_source[sourcefile].add(key[1])
+            self.cache.set(key[1], docs)
+
+    def forget(self, key: str) -> None:
+        """Drop `key` from the per-sourcefile index."""
+        with self._lock:
+            for sourcefile in self._sources.pop(key, ()):
+                keys = self._by_source[sourcefile]
+                keys.discard(key)
+                if not keys:
+                    del self._by_source[sourcefile]
+
+    async def aset(
+        self, key: tuple[int, str], docs: list[dict], sourcefiles: Iterable[str]
+    ) -> None:
+        if self.cache.blocking:
+            await asyncio.to_thread(self.set, key, docs, sourcefiles)
+        else:
+            self.set(key, docs, sourcefiles)
+
+    def invalidate(self, sourcefile: str | None = None) -> None:
+        with self._lock:
+            self.invalidations += 1
+            if sourcefile is None:
+                logger.info("Invalidating all cached search results")
+                self.generation += 1
+                self._by_source.clear()
+                self._sources.clear()
+                self.cache.clear()
+                return
+            keys = list(self._by_source.get(sourcefile, ()))
+            for key in keys:
+                self.forget(key)
+        logger.info(f"Invalidating {len(keys)} cached search results for {sourcefile}")
+        for key in keys:
+            self.cache.delete(key)
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "invalidations": self.invalidations}
+
+    def close(self) -> None:
+        self.cache.close()
+
+
+def build_cache(
+    backend: str, maxsize: int, ttl: float | None, path: str | None = None
+) -> Cache | None:
+    if backend == "memory":
+        return MemoryCache(maxsize=maxsize, ttl=ttl)
+    if backend == "disk":
+        return DiskCache(path=path, maxsize=maxsize, ttl=ttl)
+    return None
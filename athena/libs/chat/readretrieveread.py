@@ -1,16 +1,37 @@
+import re
+import time
 import openai
+import asyncio
 import logging
 
-from azure.search.documents import SearchClient
+from types import ModuleType
+from functools import partial
+from typing import AsyncIterator, Callable
 from azure.search.documents.models import QueryType
 
-from athena.libs.prompt import GPTPrompt, ChatGPTPrompt, FollowUpQuestionsPrompt
+from athena.libs.prompt import (
+    GPTPrompt,
+    ChatGPTPrompt,
+    FollowUpQuestionsChatPrompt,
+    FollowUpQuestionsPrompt,
+)
 from athena.core.models import Overrides, ChatHistory, MessageResponse
 from athena.core.config import AzureSettings
+from athena.libs.cache import Cache, SearchResultCache, make_key, normalize_text
+from athena.libs.tokens import TokenCounter, context_window
+from athena.libs.sources import deduplicate
+from athena.libs.search import AsyncSearchBackend, SearchBackend, tokenize
+from athena.libs.vectors import VectorStore, reciprocal_rank_fusion
+from athena.libs.coalesce import SingleFlight
+from athena.libs.metrics import CHAT_STAGE_SECONDS, count_tokens, span
 
 logger = logging.getLogger()
 settings = AzureSettings()
 
+# Prompt tokens for the sources and history a separate follow-up call sees.
+FOLLOWUP_CONTEXT_TOKENS = 1000
+FOLLOWUP_QUESTION = re.compile(r"<<([^<>]+)>>")
+
 
 class ReadRetrieveReadApproach:
     def __init__(
@@ -19,58 +40,650 @@ class ReadRetrieveReadApproach:
         content_field: str,
         gpt_model: str | None = "text-davinci-003",
         chatgpt_model: str | None = "gpt-3.5-turbo",
+        openai_client: ModuleType = openai,
+        sourcefile_field: str = "sourcefile",
+        answer_tokens: int = 1024,
+        history_tokens: int = 1000,
+        context_windows: dict[str, int] | None = None,
+        duplicate_threshold: float = 0.8,
+        followup_model: str | None = None,
+        followup_tokens: int = 64,
     ):
         self.gpt_model = gpt_model
         self.chatgpt_model = chatgpt_model
         self.sourcepage_field = sourcepage_field
         self.content_field = content_field
+        self.sourcefile_field = sourcefile_field
+        self.openai = openai_client
+        self.answer_tokens = answer_tokens
+        self.history_tokens = history_tokens
+        self.duplicate_threshold = duplicate_threshold
+        self.followup_model = followup_model or chatgpt_model
+        self.followup_tokens = followup_tokens
+        self.context_window = context_window(chatgpt_model, context_windows)
+        self.gpt_tokens = TokenCounter(gpt_model)
+        self.chat_flights = SingleFlight()
+        self.query_flights = SingleFlight()
+        self.search_flights = SingleFlight()
+        self.chatgpt_tokens = TokenCounter(chatgpt_model)
+
+    def load_tokenizers(self) -> None:
+        self.gpt_tokens.load()
+        self.chatgpt_tokens.load()
 
     def run(
         self,
-        search_client: SearchClient,
+        search_client: SearchBackend,
         history: list[ChatHistory],
         overrides: Overrides | None = None,
-    ) -> None:
-        logger.info("Building search query...")
-        query = self.build_search_query(history=history)
+        query_cache: Cache | None = None,
+        search_cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> MessageResponse:
+        overrides = overrides or Overrides()
+        timings = {}
+        with self.span("total", timings):
+            if self.skip_rewrite(history=history, overrides=overrides):
+                query = history[-1].user
+            else:
+                logger.info("Building search query...")
+                with self.span("query_rewrite", timings):
+                    query = self.build_search_query(history=history, cache=query_cache)
 
-        logger.info("Executing semantic search...")
-        search_result = self.cognitive_search(
-            query=query, client=search_client, overrides=overrides
+            logger.info("Executing semantic search...")
+            with self.span("search", timings):
+                docs = self.cognitive_search(
+                    query=query,
+                    client=search_client,
+                    overrides=overrides,
+                    cache=search_cache,
+                    vectors=vectors,
+                )
+            with self.span("prompt", timings):
+                search_result, saved = self.pack_sources(docs=docs, overrides=overrides)
+                chat_prompt = self.build_chat_prompt(
+                    search_result=search_result, history=history, overrides=overrides
+                )
+            logger.info("Running chatgpt on generated prompt...")
+            with self.span("completion", timings):
+                chat_completion = self.openai.ChatCompletion.create(
+                    **self.chat_completion_args(
+                        chat_prompt=chat_prompt, overrides=overrides
+                    )
+                )
+            followup_questions = (
+                self.followup_questions(
+                    history=history,
+                    search_result=search_result,
+                    overrides=overrides,
+                    timings=timings,
+                )
+                if self.separate_followups(overrides)
+                else []
+            )
+        answer = chat_completion.choices[0].message["content"]
+        self.count_chat_tokens(chat_completion, chat_prompt=chat_prompt, answer=answer)
+        return MessageResponse(
+            data_points=search_result,
+            answer=answer,
+            thoughts=self.thoughts(
+                query=query,
+                saved=saved,
+                timings=timings if overrides.include_timings else None,
+            ),
+            followup_questions=followup_questions,
         )
-        content = "\n".join(search_result)
-        follow_up_questions_prompt = (
-            FollowUpQuestionsPrompt() if overrides.suggest_followup_questions else ""
+
+    async def arun(
+        self,
+        search_client: AsyncSearchBackend,
+        history: list[ChatHistory],
+        overrides: Overrides | None = None,
+        query_cache: Cache | None = None,
+        search_cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> MessageResponse:
+        """Answer the conversation, sharing one answer between concurrent
+        identical requests."""
+        overrides = overrides or Overrides()
+        return await self.chat_flights.do(
+            self.chat_key(history=history, overrides=overrides),
+            partial(
+                self._arun,
+                search_client=search_client,
+                history=history,
+                overrides=overrides,
+                query_cache=query_cache,
+                search_cache=search_cache,
+                vectors=vectors,
+            ),
+        )
+
+    async def _arun(
+        self,
+        search_client: AsyncSearchBackend,
+        history: list[ChatHistory],
+        overrides: Overrides,
+        query_cache: Cache | None = None,
+        search_cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> MessageResponse:
+        timings = {}
+        with self.span("total", timings):
+            query, docs = await self.aretrieve(
+                search_client=search_client,
+                history=history,
+                overrides=overrides,
+                query_cache=query_cache,
+                search_cache=search_cache,
+                vectors=vectors,
+                timings=timings,
+            )
+            with self.span("prompt", timings):
+                search_result, saved = self.pack_sources(docs=docs, overrides=overrides)
+                chat_prompt = self.build_chat_prompt(
+                    search_result=search_result, history=history, overrides=overrides
+                )
+            followups = self.start_followups(
+                history=history,
+                search_result=search_result,
+                overrides=overrides,
+                timings=timings,
+            )
+            logger.info("Running chatgpt on generated prompt...")
+            try:
+                with self.span("completion", timings):
+                    chat_completion = await self.openai.ChatCompletion.acreate(
+                        **self.chat_completion_args(
+                            chat_prompt=chat_prompt, overrides=overrides
+                        )
+                    )
+                followup_questions = await followups if followups else []
+            finally:
+                if followups:
+                    followups.cancel()
+        answer = chat_completion.choices[0].message["content"]
+        self.count_chat_tokens(chat_completion, chat_prompt=chat_prompt, answer=answer)
+        return MessageResponse(
+            data_points=search_result,
+            answer=answer,
+            thoughts=self.thoughts(
+                query=query,
+                saved=saved,
+                timings=timings if overrides.include_timings else None,
+            ),
+            followup_questions=followup_questions,
         )
 
-        chat_prompt = ChatGPTPrompt(
-            sources=content,
+    async def astream(
+        self,
+        search_client: AsyncSearchBackend,
+        history: list[ChatHistory],
+        overrides: Overrides | None = None,
+        query_cache: Cache | None = None,
+        search_cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> AsyncIterator[tuple[str, dict]]:
+        overrides = overrides or Overrides()
+        timings = {}
+        start = time.perf_counter()
+        query, docs = await self.aretrieve(
+            search_client=search_client,
             history=history,
+            overrides=overrides,
+            query_cache=query_cache,
+            search_cache=search_cache,
+            vectors=vectors,
+            timings=timings,
+        )
+        search_result, saved = self.pack_sources(docs=docs, overrides=overrides)
+        yield "data_points", {
+            "data_points": search_result,
+            "thoughts": self.thoughts(
+                query=query,
+                saved=saved,
+                timings=timings if overrides.include_timings else None,
+            ),
+        }
+        with self.span("prompt", timings):
+            chat_prompt = self.build_chat_prompt(
+                search_result=search_result, history=history, overrides=overrides
+            )
+        followups = self.start_followups(
+            history=history,
+            search_result=search_result,
+            overrides=overrides,
+            timings=timings,
+        )
+        logger.info("Streaming chatgpt on generated prompt...")
+        tokens = []
+        try:
+            with self.span("completion", timings):
+                chunks = await self.openai.ChatCompletion.acreate(
+                    **self.chat_completion_args(
+                        chat_prompt=chat_prompt, overrides=overrides
+                    ),
+                    stream=True,
+                )
+                async for chunk in chunks:
+                    token = chunk.choices[0].delta.get("content")
+                    if token:
+                        if not tokens:
+                            self.observe(
+                                "first_token", time.perf_counter() - start, timings
+                            )
+                        tokens.append(token)
+                        yield "answer", {"content": token}
+            if followups:
+                yield "followup_questions", {"followup_questions": await followups}
+        finally:
+            if followups:
+                followups.cancel()
+        self.observe("total", time.perf_counter() - start, timings)
+        # Streamed completions carry no usage, so the answer is counted here.
+        self.count_chat_tokens(None, chat_prompt=chat_prompt, answer="".join(tokens))
+        yield "done", {"timings": timings} if overrides.include_timings else {}
+
+    async def aretrieve(
+        self,
+        search_client: AsyncSearchBackend,
+        history: list[ChatHistory],
+        overrides: Overrides,
+        query_cache: Cache | None = None,
+        search_cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+        timings: dict[str, float] | None = None,
+    ) -> tuple[str, list[dict]]:
+        """Rewrite the conversation into a search query and search for it.
+
+        In speculative mode the first turn is searched as asked. Later turns
+        search the raw question while the rewrite runs, then keep those
+        results if the rewrite has the same words, or fuse them with the
+        rewritten query's results otherwise.
+        """
+
+        async def search(query: str, stage: str = "search") -> list[dict]:
+            logger.info("Executing semantic search...")
+            with self.span(stage, timings):
+                return await self.acognitive_search(
+                    query=query,
+                    client=search_client,
+                    overrides=overrides,
+                    cache=search_cache,
+                    vectors=vectors,
+                )
+
+        async def rewrite() -> str:
+            logger.info("Building search query...")
+            with self.span("query_rewrite", timings):
+                return await self.abuild_search_query(
+                    history=history, cache=query_cache
+                )
+
+        if self.skip_rewrite(history=history, overrides=overrides):
+            question = history[-1].user
+            return question, await search(question)
+        if overrides.query_rewrite != "speculative":
+            query = await rewrite()
+            return query, await search(query)
+
+        question = history[-1].user
+        speculative = asyncio.ensure_future(search(question, "speculative_search"))
+        try:
+            query = await rewrite()
+        except BaseException:
+            speculative.cancel()
+            raise
+        if set(tokenize(query)) == set(tokenize(question)):
+            return query, await speculative
+        searches = [asyncio.ensure_future(search(query)), speculative]
+        try:
+            rankings = await asyncio.gather(*searches)
+        except BaseException:
+            # gather leaves the other search running when one fails.
+            for task in searches:
+                task.cancel()
+            raise
+        return query, self.fuse(
+            rankings=rankings, overrides=overrides, key=self.search_doc_key
+        )
+
+    @staticmethod
+    def skip_rewrite(history: list[ChatHistory], overrides: Overrides) -> bool:
+        # With no earlier turns there is nothing for the rewrite to resolve.
+        return overrides.query_rewrite == "speculative" and len(history) == 1
+
+    def build_chat_prompt(
+        self,
+        search_result: list[str],
+        history: list[ChatHistory],
+        overrides: Overrides,
+    ) -> list[dict]:
+        follow_up_questions_prompt = (
+            FollowUpQuestionsPrompt()
+            if overrides.suggest_followup_questions
+            and not self.separate_followups(overrides)
+            else ""
+        )
+        question = history[-1:]
+        budget = self.context_window - self.answer_tokens
+        budget -= self.chatgpt_tokens.messages(
+            ChatGPTPrompt(
+                sources="",
+                history=question,
+                followup_questions=follow_up_questions_prompt,
+            )
+        )
+        turns, used = self.fit_history(
+            history=history[:-1], max_tokens=min(budget, self.history_tokens)
+        )
+        sources = self.fit_sources(sources=search_result, max_tokens=budget - used)
+        return ChatGPTPrompt(
+            sources="\n".join(sources),
+            history=turns + question,
             followup_questions=follow_up_questions_prompt,
         )
-        logger.info("Running chatgpt on generated prompt...")
-        chat_completion = openai.ChatCompletion.create(
+
+    @staticmethod
+    def separate_followups(overrides: Overrides) -> bool:
+        return (
+            overrides.suggest_followup_questions
+            and overrides.followup_mode == "separate"
+        )
+
+    def start_followups(
+        self,
+        history: list[ChatHistory],
+        search_result: list[str],
+        overrides: Overrides,
+        timings: dict[str, float] | None = None,
+    ) -> asyncio.Task | None:
+        """Generate follow-up questions alongside the answer when they are
+        asked for separately."""
+        if not self.separate_followups(overrides):
+            return None
+        return asyncio.ensure_future(
+            self.afollowup_questions(
+                history=history,
+                search_result=search_result,
+                overrides=overrides,
+                timings=timings,
+            )
+        )
+
+    def followup_questions(
+        self,
+        history: list[ChatHistory],
+        search_result: list[str],
+        overrides: Overrides,
+        timings: dict[str, float] | None = None,
+    ) -> list[str]:
+        args = self.followup_args(
+            history=history, search_result=search_result, overrides=overrides
+        )
+        try:
+            with self.span("followups", timings):
+                completion = self.openai.ChatCompletion.create(**args)
+        except Exception as e:
+            logger.warning(f"Follow-up questions failed: {e}")
+            return []
+        return self.parse_followups(completion, chat_prompt=args["messages"])
+
+    async def afollowup_questions(
+        self,
+        history: list[ChatHistory],
+        search_result: list[str],
+        overrides: Overrides,
+        timings: dict[str, float] | None = None,
+    ) -> list[str]:
+        args = self.followup_args(
+            history=history, search_result=search_result, overrides=overrides
+        )
+        try:
+            with self.span("followups", timings):
+                completion = await self.openai.ChatCompletion.acreate(**args)
+        except Exception as e:
+            # Follow-ups are optional, so their failure must not fail the answer.
+            logger.warning(f"Follow-up questions failed: {e}")
+            return []
+        return self.parse_followups(completion, chat_prompt=args["messages"])
+
+    def followup_args(
+        self, history: list[ChatHistory], search_result: list[str], overrides: Overrides
+    ) -> dict:
+        turns, used = self.fit_history(
+            history=history[:-1], max_tokens=FOLLOWUP_CONTEXT_TOKENS // 2
+        )
+        sources = self.fit_sources(
+            sources=search_result, max_tokens=FOLLOWUP_CONTEXT_TOKENS - used
+        )
+        return dict(
+            model=self.followup_model,
+            messages=FollowUpQuestionsChatPrompt(
+                sources="\n".join(sources), history=turns + history[-1:]
+            ),
+            temperature=overrides.temperature,
+            max_tokens=self.followup_tokens,
+            n=1,
+        )
+
+    def parse_followups(self, completion: dict, chat_prompt: list[dict]) -> list[str]:
+        text = completion.choices[0].message["content"]
+        self.count_chat_tokens(
+            completion, chat_prompt=chat_prompt, answer=text, model=self.followup_model
+        )
+        questions = (question.strip() for question in FOLLOWUP_QUESTION.findall(text))
+        return list(dict.fromkeys(question for question in questions if question))
+
+    def fit_history(
+        self, history: list[ChatHistory], max_tokens: int
+    ) -> tuple[list[ChatHistory], int]:
+        """Keep the most recent turns that fit in max_tokens."""
+        used = 0
+        start = len(history)
+        for hist in reversed(history):
+            tokens = sum(
+                self.chatgpt_tokens.message(message)
+                for message in ChatGPTPrompt.turn(hist)
+            )
+            if used + tokens > max_tokens:
+                break
+            used += tokens
+            start -= 1
+        if start:
+            logger.info(f"Dropped {start} history turns to fit the context window")
+        return history[start:], used
+
+    def fit_sources(self, sources: list[str], max_tokens: int) -> list[str]:
+        """Keep sources in rank order while they fit in max_tokens, skipping
+        any single source too large for what is left."""
+        fitted = []
+        used = 0
+        for source in sources:
+            tokens = self.chatgpt_tokens.count(source) + 1
+            if used + tokens <= max_tokens:
+                fitted.append(source)
+                used += tokens
+        if len(fitted) < len(sources):
+            logger.info(
+                f"Dropped {len(sources) - len(fitted)} sources to fit the context window"
+            )
+        return fitted
+
+    def chat_completion_args(
+        self, chat_prompt: list[dict], overrides: Overrides
+    ) -> dict:
+        return dict(
             model=self.chatgpt_model,
             messages=chat_prompt,
             temperature=overrides.temperature,
+            max_tokens=self.answer_tokens,
             n=1,
         )
-        return MessageResponse(
-            data_points=search_result,
-            answer=chat_completion.choices[0].message["content"],
-            thoughts=f"Searched for:<br>{query}<br>",
-        )
 
     def cognitive_search(
-        self, query: str, client: SearchClient, overrides: Overrides
-    ) -> list[str]:
-        filter = (
+        self,
+        query: str,
+        client: SearchBackend,
+        overrides: Overrides,
+        cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> list[dict]:
+        docs = None
+        if cache is not None:
+            key = cache.key(*self.search_params(query=query, overrides=overrides))
+            docs = cache.get(key)
+        if docs is None:
+            mode = self.retrieval_mode(overrides=overrides, vectors=vectors)
+            candidates = self.candidate_overrides(overrides=overrides, mode=mode)
+            rankings = []
+            if mode != "vector":
+                rankings.append(
+                    list(
+                        client.search(
+                            **self.search_args(query=query, overrides=candidates)
+                        )
+                    )
+                )
+            if mode != "text":
+                rankings.append(
+                    vectors.search(
+                        query, top=candidates.top, filter=self.search_filter(overrides)
+                    )
+                )
+            docs = [
+                self.search_doc(doc=doc, overrides=overrides)
+                for doc in self.fuse(rankings=rankings, overrides=overrides)
+            ]
+            if cache is not None:
+                cache.set(key, docs, {doc["sourcefile"] for doc in docs})
+        return docs
+
+    async def acognitive_search(
+        self,
+        query: str,
+        client: AsyncSearchBackend,
+        overrides: Overrides,
+        cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> list[dict]:
+        params = self.search_params(query=query, overrides=overrides)
+        if cache is not None:
+            docs = await cache.aget(cache.key(*params))
+            if docs is not None:
+                return docs
+        return await self.search_flights.do(
+            make_key(*params),
+            partial(
+                self.asearch_docs,
+                query=query,
+                client=client,
+                overrides=overrides,
+                cache=cache,
+                vectors=vectors,
+            ),
+        )
+
+    async def asearch_docs(
+        self,
+        query: str,
+        client: AsyncSearchBackend,
+        overrides: Overrides,
+        cache: SearchResultCache | None = None,
+        vectors: VectorStore | None = None,
+    ) -> list[dict]:
+        # Take the key before searching, so that an invalidation while the
+        # search runs keeps its result out of the cache.
+        if cache is not None:
+            key = cache.key(*self.search_params(query=query, overrides=overrides))
+        mode = self.retrieval_mode(overrides=overrides, vectors=vectors)
+        candidates = self.candidate_overrides(overrides=overrides, mode=mode)
+        searches = []
+        if mode != "vector":
+            searches.append(
+                self.akeyword_search(query=query, client=client, overrides=candidates)
+            )
+        if mode != "text":
+            searches.append(
+                vectors.asearch(
+                    query, top=candidates.top, filter=self.search_filter(overrides)
+                )
+            )
+        rankings = await asyncio.gather(*searches)
+        docs = [
+            self.search_doc(doc=doc, overrides=overrides)
+            for doc in self.fuse(rankings=rankings, overrides=overrides)
+        ]
+        if cache is not None:
+            await cache.aset(key, docs, {doc["sourcefile"] for doc in docs})
+        return docs
+
+    async def akeyword_search(
+        self, query: str, client: AsyncSearchBackend, overrides: Overrides
+    ) -> list[dict]:
+        result = await client.search(
+            **self.search_args(query=query, overrides=overrides)
+        )
+        return [doc async for doc in result]
+
+    @staticmethod
+    def retrieval_mode(overrides: Overrides, vectors: VectorStore | None) -> str:
+        if overrides.retrieval_mode != "text" and vectors is None:
+            logger.warning("Vector search is not enabled, falling back to text")
+            return "text"
+        return overrides.retrieval_mode
+
+    @staticmethod
+    def candidate_overrides(overrides: Overrides, mode: str) -> Overrides:
+        # Fusion needs more than the final top from each ranking to agree on.
+        if mode != "hybrid" or overrides.top is None:
+            return overrides
+        return overrides.copy(update={"top": 2 * overrides.top})
+
+    def fuse(
+        self,
+        rankings: list[list[dict]],
+        overrides: Overrides,
+        key: Callable[[dict], str | tuple] | None = None,
+    ) -> list[dict]:
+        # Docs already formatted by search_doc() need key=search_doc_key.
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion(
+            rankings, key=key or self.index_doc_key, top=overrides.top
+        )
+
+    def index_doc_key(self, doc: dict) -> str | tuple:
+        return doc.get("id") or (doc[self.sourcepage_field], doc[self.content_field])
+
+    @staticmethod
+    def search_doc_key(doc: dict) -> tuple:
+        return doc["sourcepage"], doc["content"]
+
+    @staticmethod
+    def search_params(query: str, overrides: Overrides) -> tuple:
+        # Only the query is normalized; the category is an exact filter value.
+        return (
+            normalize_text(query),
+            overrides.exclude_category,
+            overrides.top,
+            overrides.semantic_ranker,
+            overrides.semantic_captions,
+            overrides.retrieval_mode,
+        )
+
+    @staticmethod
+    def search_filter(overrides: Overrides) -> str | None:
+        return (
             "category ne '{}'".format(overrides.exclude_category.replace("'", "''"))
             if overrides.exclude_category
             else None
         )
+
+    def search_args(self, query: str, overrides: Overrides) -> dict:
+        filter = self.search_filter(overrides)
         if overrides.semantic_ranker:
-            result = client.search(
+            return dict(
                 search_text=query,
                 filter=filter,
                 query_type=QueryType.SEMANTIC,
@@ -82,34 +695,173 @@ class ReadRetrieveReadApproach:
                 if overrides.semantic_captions
                 else None,
             )
+        return dict(search_text=query, filter=filter, top=overrides.top)
+
+    def search_doc(self, doc: dict, overrides: Overrides) -> dict:
+        if overrides.semantic_captions and "@search.captions" in doc:
+            content = " . ".join([content.text for content in doc["@search.captions"]])
         else:
-            result = client.search(search_text=query, filter=filter, top=overrides.top)
-        if overrides.semantic_captions:
-            results = [
-                doc[self.sourcepage_field]
-                + ": "
-                + self.nonewlines(
-                    " . ".join([content.text for content in doc["@search.captions"]])
+            content = doc[self.content_field]
+        return {
+            "sourcepage": doc[self.sourcepage_field],
+            "sourcefile": doc.get(self.sourcefile_field),
+            "content": content,
+        }
+
+    def pack_sources(
+        self, docs: list[dict], overrides: Overrides
+    ) -> tuple[list[str], int]:
+        """Format the search results as prompt sources, merging overlapping
+        chunks and near-duplicates first. Also returns the tokens saved."""
+        sources = self.format_search_results(docs=docs)
+        if not overrides.deduplicate_sources or len(docs) < 2:
+            return sources, 0
+        packed = self.format_search_results(
+            docs=deduplicate(docs, threshold=self.duplicate_threshold)
+        )
+        saved = sum(map(self.chatgpt_tokens.count, sources)) - sum(
+            map(self.chatgpt_tokens.count, packed)
+        )
+        if saved:
+            logger.info(f"Deduplicated sources, saving {saved} tokens")
+        return packed, saved
+
+    @staticmethod
+    def thoughts(
+        query: str, saved: int = 0, timings: dict[str, float] | None = None
+    ) -> str:
+        thoughts = f"Searched for:<br>{query}<br>"
+        if saved:
+            thoughts += f"Merged overlapping sources, saving {saved} tokens<br>"
+        if timings:
+            thoughts += (
+                "Timings: "
+                + ", ".join(
+                    f"{stage} {seconds * 1000:.0f} ms"
+                    for stage, seconds in timings.items()
                 )
-                for doc in result
-            ]
+                + "<br>"
+            )
+        return thoughts
+
+    @staticmethod
+    def span(stage: str, timings: dict[str, float] | None = None):
+        return span(CHAT_STAGE_SECONDS, stage, timings)
+
+    @staticmethod
+    def observe(
+        stage: str, seconds: float, timings: dict[str, float] | None = None
+    ) -> None:
+        CHAT_STAGE_SECONDS.observe(seconds, stage=stage)
+        if timings is not None:
+            timings[stage] = seconds
+
+    def count_chat_tokens(
+        self,
+        completion: dict | None,
+        chat_prompt: list[dict],
+        answer: str,
+        model: str | None = None,
+    ) -> None:
+        model = model or self.chatgpt_model
+        usage = completion.get("usage") if completion is not None else None
+        if usage:
+            count_tokens(model, usage["prompt_tokens"], usage["completion_tokens"])
         else:
-            results = [
-                doc[self.sourcepage_field]
-                + ": "
-                + self.nonewlines(doc[self.content_field])
-                for doc in result
-            ]
-        return results
+            count_tokens(
+                model,
+                self.chatgpt_tokens.messages(chat_prompt),
+                self.chatgpt_tokens.count(answer),
+            )
+
+    def count_query_tokens(self, completion: dict, prompt: str) -> None:
+        usage = completion.get("usage")
+        if usage:
+            count_tokens(
+                self.gpt_model, usage["prompt_tokens"], usage["completion_tokens"]
+            )
+        else:
+            count_tokens(
+                self.gpt_model,
+                self.gpt_tokens.count(prompt),
+                self.gpt_tokens.count(completion.choices[0].text),
+            )
+
+    def format_search_results(self, docs: list[dict]) -> list[str]:
+        return [
+            doc["sourcepage"] + ": " + self.nonewlines(doc["content"]) for doc in docs
+        ]
+
+    def build_search_query(
+        self, history: list[ChatHistory], cache: Cache | None = None
+    ) -> str:
+        key = self.search_query_key(history=history)
+        if cache is not None and (query := cache.get(key)) is not None:
+            return query
+        args = self.search_query_args(history=history)
+        completion = self.openai.Completion.create(**args)
+        self.count_query_tokens(completion, prompt=args["prompt"])
+        query = completion.choices[0].text
+        if cache is not None:
+            cache.set(key, query)
+        return query
 
-    def build_search_query(self, history: list[ChatHistory]) -> str:
+    async def abuild_search_query(
+        self, history: list[ChatHistory], cache: Cache | None = None
+    ) -> str:
+        key = self.search_query_key(history=history)
+        if cache is not None and (query := await cache.aget(key)) is not None:
+            return query
+        return await self.query_flights.do(
+            key, partial(self.acomplete_search_query, history=history, cache=cache)
+        )
+
+    async def acomplete_search_query(
+        self, history: list[ChatHistory], cache: Cache | None = None
+    ) -> str:
+        args = self.search_query_args(history=history)
+        completion = await self.openai.Completion.acreate(**args)
+        self.count_query_tokens(completion, prompt=args["prompt"])
+        query = completion.choices[0].text
+        if cache is not None:
+            await cache.aset(self.search_query_key(history=history), query)
+        return query
+
+    @staticmethod
+    def chat_key(history: list[ChatHistory], overrides: Overrides) -> str:
+        return make_key(
+            *(
+                normalize_text(turn)
+                for hist in history
+                for turn in (hist.user, hist.bot or "")
+            ),
+            overrides.dict(),
+        )
+
+    def flight_stats(self) -> dict:
+        return {
+            "chat": self.chat_flights.stats(),
+            "query": self.query_flights.stats(),
+            "search": self.search_flights.stats(),
+        }
+
+    def search_query_key(self, history: list[ChatHistory]) -> str:
+        return make_key(
+            self.gpt_model,
+            normalize_text(
+                self.get_chat_history_as_text(history=history, include_last_turn=False)
+            ),
+            normalize_text(history[-1].user),
+        )
+
+    def search_query_args(self, history: list[ChatHistory]) -> dict:
         prompt = GPTPrompt(
             history=self.get_chat_history_as_text(
                 history=history, include_last_turn=False
             ),
             question=history[-1].user,
         )
-        completion = openai.Completion.create(
+        return dict(
             model=self.gpt_model,
             prompt=prompt,
             temperature=0.0,
@@ -117,32 +869,28 @@ class ReadRetrieveReadApproach:
             n=1,
             stop=["\n"],
         )
-        return completion.choices[0].text
 
     def get_chat_history_as_text(
         self,
         history: list[ChatHistory],
         include_last_turn: bool = True,
-        approx_max_tokens: int = 1000,
+        max_tokens: int = 1000,
     ) -> str:
-        history_text = ""
+        turns = []
+        used = 0
         for hist in reversed(history if include_last_turn else history[:-1]):
-            history_text = (
-                """<|im_start|>user"""
-                + "\n"
+            turn = (
+                "<|im_start|>user\n"
                 + hist.user
+                + "\n<|im_end|>\n<|im_start|>assistant\n"
+                + (hist.bot + "<|im_end|>" if hist.bot else "")
                 + "\n"
-                + """<|im_end|>"""
-                + "\n"
-                + """<|im_start|>assistant"""
-                + "\n"
-                + (hist.bot + """<|im_end|>""" if hist.bot else "")
-                + "\n"
-                + history_text
             )
-            if len(history_text) > approx_max_tokens * 4:
+            used += self.gpt_tokens.count(turn)
+            if turns and used > max_tokens:
                 break
-        return history_text
+            turns.append(turn)
+        return "".join(reversed(turns))
 
     @staticmethod
     def nonewlines(string: str):
@@ -0,0 +1,49 @@
+import asyncio
+import logging
+
+from functools import partial
+from typing import Awaitable, Callable, TypeVar
+
+logger = logging.getLogger()
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Lets concurrent calls with the same key share one execution and its
+    result, or its exception. A key is forgotten as soon as its call ends,
+    so this never serves stale results; caching is left to the caches."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.coalesced = 0
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(partial(self._done, key))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joining in-flight call {key}")
+        # One caller going away must not cancel the call the others wait on.
+        return await asyncio.shield(task)
+
+    def _done(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every waiter has gone.
+            task.exception()
+
+    def stats(self) -> dict:
+        total = self.calls + self.coalesced
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._tasks),
+            "coalesce_rate": self.coalesced / total if total else 0.0,
+        }
@@ -0,0 +1,225 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import mimetypes
+import tempfile
+import threading
+
+from pathlib import Path
+from typing import BinaryIO, Iterator
+from collections import OrderedDict
+
+from azure.storage.blob import ContainerClient
+
+from athena.core.models import BlobContent
+from athena.libs.listing import logical_name
+
+logger = logging.getLogger()
+
+CHUNK_SIZE = 64 * 1024
+BYTE_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Return the inclusive (start, end) of a single byte range, or None to
+    serve the whole blob. Multi-range requests get the whole blob as well.
+    """
+    if not header:
+        return None
+    match = BYTE_RANGE.fullmatch(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable(f"bytes */{size}")
+    return start, end
+
+
+def content_type(name: str, content_type: str | None) -> str:
+    if not content_type or content_type == "application/octet-stream":
+        return mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return content_type
+
+
+def read_file(file: BinaryIO, start: int, length: int) -> Iterator[bytes]:
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class ContentCache:
+    """Size-bounded LRU of whole blobs on local disk, for hot citation pages.
+
+    Each entry is a data file plus a JSON sidecar with its BlobContent, so
+    the cache survives restarts.
+    """
+
+    def __init__(
+        self, directory: str | Path, max_bytes: int, max_item_bytes: int
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, BlobContent] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        sidecars = sorted(
+            self.directory.glob("*.json"), key=lambda path: path.stat().st_mtime
+        )
+        for sidecar in sidecars:
+            try:
+                content = BlobContent.parse_file(sidecar)
+            except Exception:
+                sidecar.unlink(missing_ok=True)
+                continue
+            if self.path(content.name).exists():
+                self._entries[content.name] = content
+                self._bytes += content.size
+            else:
+                sidecar.unlink(missing_ok=True)
+        # Data files without a sidecar are downloads cut off by a restart.
+        known = {self.path(name).name for name in self._entries}
+        for path in self.directory.iterdir():
+            if path.suffix != ".json" and path.name not in known:
+                path.unlink(missing_ok=True)
+        self.evict()
+
+    def path(self, name: str) -> Path:
+        return self.directory / hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+    def open(self, name: str) -> tuple[BlobContent, BinaryIO] | None:
+        """Look up a blob and open its data, so that eviction while the
+        response streams cannot pull the file away."""
+        with self._lock:
+            content = self._entries.get(name)
+            if content is None:
+                self.misses += 1
+                return None
+            try:
+                file = open(self.path(name), "rb")
+            except FileNotFoundError:
+                self._remove(name)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(name)
+            self.hits += 1
+            return content, file
+
+    def fill(self, content: BlobContent, chunks: Iterator[bytes]) -> Iterator[bytes]:
+        """Pass a blob's chunks through, storing the blob once it has been
+        read to the end."""
+        if content.size > self.max_item_bytes:
+            yield from chunks
+            return
+        with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as f:
+            try:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            except BaseException:
+                f.close()
+                os.unlink(f.name)
+                raise
+        self.add(content, f.name)
+
+    def add(self, content: BlobContent, data_path: str) -> None:
+        path = self.path(content.name)
+        with self._lock:
+            self._remove(content.name)
+            os.replace(data_path, path)
+            path.with_suffix(".json").write_text(content.json())
+            self._entries[content.name] = content
+            self._bytes += content.size
+            self.evict()
+
+    def evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, name: str) -> None:
+        content = self._entries.pop(name, None)
+        if content is None:
+            return
+        self._bytes -= content.size
+        path = self.path(name)
+        path.unlink(missing_ok=True)
+        path.with_suffix(".json").unlink(missing_ok=True)
+
+    def invalidate(self, sourcefile: str | None = None) -> None:
+        """Drop the cached blobs of one logical file, or all of them."""
+        with self._lock:
+            names = [
+                name
+                for name in self._entries
+                if sourcefile is None or logical_name(name) == sourcefile
+            ]
+            for name in names:
+                self._remove(name)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+def blob_content(blob_container: ContainerClient, name: str) -> BlobContent:
+    properties = blob_container.get_blob_client(name).get_blob_properties()
+    return BlobContent(
+        name=name,
+        etag=properties.etag,
+        size=properties.size,
+        content_type=content_type(name, properties.content_settings.content_type),
+    )
+
+
+def download(
+    blob_container: ContainerClient,
+    name: str,
+    offset: int | None = None,
+    length: int | None = None,
+) -> tuple[BlobContent, Iterator[bytes]]:
+    downloader = blob_container.get_blob_client(name).download_blob(
+        offset=offset, length=length
+    )
+    properties = downloader.properties
+    content = BlobContent(
+        name=name,
+        etag=properties.etag,
+        size=properties.size,
+        content_type=content_type(name, properties.content_settings.content_type),
+    )
+    return content, downloader.chunks()
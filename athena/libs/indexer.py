@@ -1,87 +1,174 @@
 import os
 import re
 import html
+import json
+import heapq
+import bisect
+import hashlib
 import logging
 
+from typing import IO, Iterable, Iterator
+from collections import defaultdict
+
 from azure.ai.formrecognizer import DocumentAnalysisClient, AnalyzeResult
-from azure.search.documents import SearchClient
+
+from athena.core.models import ChunkingOptions, IndexingReport, IngestJob
+from athena.libs.batch_indexer import BatchIndexer
+from athena.libs.jobs import StageTimer, track
+from athena.libs.search import SearchBackend
+from athena.libs.vectors import VectorStore
 
 logger = logging.getLogger("indexer")
 
-MAX_SECTION_LENGTH = 1000
-SENTENCE_SEARCH_LIMIT = 100
-SECTION_OVERLAP = 100
+SENTENCE_ENDINGS = ".!?"
+SENTENCE_ENDING = re.compile(r"[.!?]")
+LAST_SENTENCE_ENDING = re.compile(r".*[.!?]", re.DOTALL)
+WORD_BREAK = re.compile(r"[,;: ()\[\]{}\t\n]")
+LAST_WORD_BREAK = re.compile(r".*[,;: ()\[\]{}\t\n]", re.DOTALL)
 
 
 class CognitiveIndex:
+    job: IngestJob | None = None
+
     def __init__(
         self,
         filename: str,
-        file_data: bytes,
+        document: bytes | IO[bytes],
         formrecognizer: DocumentAnalysisClient,
-        cognitive_search: SearchClient,
+        cognitive_search: SearchBackend,
         category: str | None,
+        job: IngestJob | None = None,
+        chunking: ChunkingOptions | None = None,
+        indexer: BatchIndexer | None = None,
+        known_sections: set[str] | None = None,
+        section_ids: list[str] | None = None,
+        vectors: VectorStore | None = None,
     ) -> None:
+        self.job = job
+        self.section_ids = [] if section_ids is None else section_ids
         logger.info("Analyzing document...")
-        lro_poller = formrecognizer.begin_analyze_document(
-            model_id="prebuilt-layout", document=file_data
-        )
-        results = lro_poller.result()
-        logger.info("Creating page map and sections...")
-        page_map = self.get_page_map(form_result=results)
-        sections = self.create_sections(
-            filename=filename, page_map=page_map, category=category
-        )
-        logger.info("Indexing Sections...")
-        self.index_sections(client=cognitive_search, sections=sections)
+        with track(job, "analyzing"):
+            lro_poller = formrecognizer.begin_analyze_document(
+                model_id="prebuilt-layout", document=document
+            )
+            results = lro_poller.result()
+        if job is not None:
+            job.pages_analyzed = len(results.pages)
+        logger.info("Creating page map...")
+        timer = StageTimer(job)
+        try:
+            with timer.stage("chunking"):
+                page_map = self.get_page_map(form_result=results)
+            # The page map holds everything chunking needs; let the analysis
+            # result go before sections are built.
+            del results, lro_poller
+            logger.info("Chunking and indexing sections...")
+            # Sections are chunked and embedded as indexing pulls them, so
+            # those stages are timed by the calls into their generators.
+            sections = timer.iterate(
+                "chunking",
+                self.create_sections(
+                    filename=filename,
+                    page_map=page_map,
+                    category=category,
+                    options=chunking,
+                ),
+            )
+            if vectors is not None:
+                sections = timer.iterate(
+                    "embedding", self.embed_sections(sections=sections, vectors=vectors)
+                )
+            with timer.stage("indexing"):
+                self.index_sections(
+                    client=cognitive_search,
+                    sections=self.changed_sections(
+                        sections=sections, known_sections=known_sections or set()
+                    ),
+                    indexer=indexer,
+                )
+        finally:
+            timer.record()
 
     def get_page_map(self, form_result: AnalyzeResult) -> list[tuple[str]]:
+        tables_by_page = defaultdict(list)
+        for table in form_result.tables:
+            tables_by_page[table.bounding_regions[0].page_number].append(table)
+
+        content = form_result.content
         offset = 0
         page_map = []
         for page_num, page in enumerate(form_result.pages):
-            tables_on_page = [
-                table
-                for table in form_result.tables
-                if table.bounding_regions[0].page_number == page_num + 1
-            ]
-
+            tables_on_page = tables_by_page.get(page_num + 1, [])
             page_offset = page.spans[0].offset
             page_length = page.spans[0].length
-            table_chars = [-1] * page_length
-            for table_id, table in enumerate(tables_on_page):
-                for span in table.spans:
-                    for i in range(span.length):
-                        idx = span.offset - page_offset + i
-                        if idx >= 0 and idx < page_length:
-                            table_chars[idx] = table_id
-
-            page_text = ""
+
+            parts = []
+            position = 0
             added_tables = set()
-            for idx, table_id in enumerate(table_chars):
-                if table_id == -1:
-                    page_text += form_result.content[page_offset + idx]
-                elif not table_id in added_tables:
-                    page_text += self.table_to_html(tables_on_page[table_id])
+            for start, end, table_id in self.table_segments(
+                tables=tables_on_page, page_offset=page_offset, page_length=page_length
+            ):
+                parts.append(content[page_offset + position : page_offset + start])
+                if table_id not in added_tables:
+                    parts.append(self.table_to_html(tables_on_page[table_id]))
                     added_tables.add(table_id)
+                position = end
+            parts.append(content[page_offset + position : page_offset + page_length])
+            parts.append(" ")
 
-            page_text += " "
+            page_text = "".join(parts)
             page_map.append((page_num, offset, page_text))
             offset += len(page_text)
 
         return page_map
 
-    def table_to_html(self, table) -> html:
-        table_html = "<table>"
-        rows = [
-            sorted(
-                [cell for cell in table.cells if cell.row_index == i],
-                key=lambda cell: cell.column_index,
-            )
-            for i in range(table.row_count)
-        ]
+    @staticmethod
+    def table_segments(
+        tables: list, page_offset: int, page_length: int
+    ) -> list[tuple[int, int, int]]:
+        # Page-relative (start, end, table_id) intervals covered by tables. When
+        # spans overlap the later table owns the characters.
+        intervals = sorted(
+            (start, end, table_id)
+            for table_id, table in enumerate(tables)
+            for span in table.spans
+            if (start := max(span.offset - page_offset, 0))
+            < (end := min(span.offset - page_offset + span.length, page_length))
+        )
+        if all(
+            intervals[i][1] <= intervals[i + 1][0] for i in range(len(intervals) - 1)
+        ):
+            return intervals
+
+        boundaries = sorted({b for start, end, _ in intervals for b in (start, end)})
+        segments = []
+        active = []
+        i = 0
+        for start, end in zip(boundaries, boundaries[1:]):
+            while i < len(intervals) and intervals[i][0] == start:
+                heapq.heappush(active, (-intervals[i][2], intervals[i][1]))
+                i += 1
+            while active and active[0][1] <= start:
+                heapq.heappop(active)
+            if not active:
+                continue
+            table_id = -active[0][0]
+            if segments and segments[-1][1] == start and segments[-1][2] == table_id:
+                segments[-1] = (segments[-1][0], end, table_id)
+            else:
+                segments.append((start, end, table_id))
+        return segments
+
+    def table_to_html(self, table) -> str:
+        rows = [[] for _ in range(table.row_count)]
+        for cell in table.cells:
+            if 0 <= cell.row_index < table.row_count:
+                rows[cell.row_index].append(cell)
+
+        parts = ["<table>"]
         for row_cells in rows:
-            table_html += "<tr>"
-            for cell in row_cells:
+            parts.append("<tr>")
+            for cell in sorted(row_cells, key=lambda cell: cell.column_index):
                 tag = (
                     "th"
                     if (cell.kind == "columnHeader" or cell.kind == "rowHeader")
@@ -92,59 +179,111 @@ class CognitiveIndex:
                     cell_spans += f" colSpan={cell.column_span}"
                 if cell.row_span > 1:
                     cell_spans += f" rowSpan={cell.row_span}"
-                table_html += f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>"
-            table_html += "</tr>"
-        table_html += "</table>"
-        return table_html
+                parts.append(f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>")
+            parts.append("</tr>")
+        parts.append("</table>")
+        return "".join(parts)
 
     def create_sections(
-        self, filename: str, page_map: list[tuple[str]], category: str | None
-    ) -> dict:
-        for i, (section, pagenum) in enumerate(self.split_text(page_map)):
+        self,
+        filename: str,
+        page_map: list[tuple[str]],
+        category: str | None,
+        options: ChunkingOptions | None = None,
+    ) -> Iterator[dict]:
+        seen = set()
+        for section, pagenum in self.split_text(page_map, options):
+            sourcepage = self.blob_name_from_file_page(filename, pagenum)
+            # Ids come from the content so that unchanged sections keep their
+            # id when a re-upload shifts their offsets.
+            digest = hashlib.sha256(
+                json.dumps([section, category, sourcepage]).encode("utf-8")
+            ).hexdigest()[:32]
+            section_id = re.sub("[^0-9a-zA-Z_-]", "_", f"{filename}-{digest}")
+            if section_id in seen:
+                continue
+            seen.add(section_id)
             yield {
-                "id": re.sub("[^0-9a-zA-Z_-]", "_", f"{filename}-{i}"),
+                "id": section_id,
                 "content": section,
                 "category": category,
-                "sourcepage": self.blob_name_from_file_page(filename, pagenum),
+                "sourcepage": sourcepage,
                 "sourcefile": filename,
             }
 
+    def changed_sections(
+        self, sections: Iterable[dict], known_sections: set[str]
+    ) -> Iterator[dict]:
+        for section in sections:
+            self.section_ids.append(section["id"])
+            if section["id"] in known_sections:
+                if self.job is not None:
+                    self.job.sections_unchanged += 1
+                continue
+            yield section
+
+    def embed_sections(
+        self, sections: Iterable[dict], vectors: VectorStore | None
+    ) -> Iterator[dict]:
+        """Pass sections through, embedding those the vector index lacks in
+        batches of the embedder's batch size."""
+        if vectors is None:
+            yield from sections
+            return
+        batch = []
+        for section in sections:
+            if section["id"] not in vectors:
+                batch.append(section)
+                if len(batch) >= vectors.embedder.batch_size:
+                    self.add_vectors(vectors, batch)
+                    batch = []
+            yield section
+        self.add_vectors(vectors, batch)
+
+    def add_vectors(self, vectors: VectorStore, batch: list[dict]) -> None:
+        vectors.add(batch)
+        if self.job is not None:
+            self.job.sections_embedded += len(batch)
+
     def blob_name_from_file_page(self, filename: str, page=0) -> str:
         if os.path.splitext(filename)[1].lower() == ".pdf":
             return os.path.splitext(os.path.basename(filename))[0] + f"-{page}" + ".pdf"
         else:
             return os.path.basename(filename)
 
-    def split_text(self, page_map: str) -> tuple:
-        SENTENCE_ENDINGS = [".", "!", "?"]
-        WORDS_BREAKS = [",", ";", ":", " ", "(", ")", "[", "]", "{", "}", "\t", "\n"]
+    def split_text(
+        self, page_map: list[tuple[str]], options: ChunkingOptions | None = None
+    ) -> tuple:
+        options = options or ChunkingOptions()
+        max_section_length = options.max_section_length
+        sentence_search_limit = options.sentence_search_limit
+        section_overlap = options.section_overlap
+        page_offsets = [p[1] for p in page_map]
 
         def find_page(offset):
-            l = len(page_map)
-            for i in range(l - 1):
-                if offset >= page_map[i][1] and offset < page_map[i + 1][1]:
-                    return i
-            return l - 1
+            return bisect.bisect_right(page_offsets, offset) - 1
 
         all_text = "".join(p[2] for p in page_map)
         length = len(all_text)
         start = 0
         end = length
-        while start + SECTION_OVERLAP < length:
+        # An unclosed table in the last section can send start back to a
+        # boundary that was already used, which used to loop forever.
+        seen_sections = set()
+        while start + section_overlap < length:
             last_word = -1
-            end = start + MAX_SECTION_LENGTH
+            end = start + max_section_length
 
             if end > length:
                 end = length
             else:
-                while (
-                    end < length
-                    and (end - start - MAX_SECTION_LENGTH) < SENTENCE_SEARCH_LIMIT
-                    and all_text[end] not in SENTENCE_ENDINGS
-                ):
-                    if all_text[end] in WORDS_BREAKS:
-                        last_word = end
-                    end += 1
+                bound = min(length, start + max_section_length + sentence_search_limit)
+                sentence_end = SENTENCE_ENDING.search(all_text, end, bound)
+                stop = sentence_end.start() if sentence_end else bound
+                word_break = LAST_WORD_BREAK.match(all_text, end, stop)
+                if word_break:
+                    last_word = word_break.end() - 1
+                end = stop
                 if (
                     end < length
                     and all_text[end] not in SENTENCE_ENDINGS
@@ -155,45 +294,70 @@ class CognitiveIndex:
                 end += 1
 
             last_word = -1
-            while (
-                start > 0
-                and start > end - MAX_SECTION_LENGTH - 2 * SENTENCE_SEARCH_LIMIT
-                and all_text[start] not in SENTENCE_ENDINGS
-            ):
-                if all_text[start] in WORDS_BREAKS:
-                    last_word = start
-                start -= 1
+            lower = max(0, end - max_section_length - 2 * sentence_search_limit)
+            if start > lower:
+                sentence_end = LAST_SENTENCE_ENDING.match(
+                    all_text, lower + 1, start + 1
+                )
+                stop = sentence_end.end() - 1 if sentence_end else lower
+                word_break = WORD_BREAK.search(all_text, stop + 1, start + 1)
+                if word_break:
+                    last_word = word_break.start()
+                start = stop
             if all_text[start] not in SENTENCE_ENDINGS and last_word > 0:
                 start = last_word
             if start > 0:
                 start += 1
 
+            if (start, end) in seen_sections:
+                return
+            seen_sections.add((start, end))
+
             section_text = all_text[start:end]
             yield (section_text, find_page(start))
 
             last_table_start = section_text.rfind("<table")
             if (
-                last_table_start > 2 * SENTENCE_SEARCH_LIMIT
+                last_table_start > 2 * sentence_search_limit
                 and last_table_start > section_text.rfind("</table")
             ):
-                start = min(end - SECTION_OVERLAP, start + last_table_start)
+                start = min(end - section_overlap, start + last_table_start)
             else:
-                start = end - SECTION_OVERLAP
+                start = end - section_overlap
 
-        if start + SECTION_OVERLAP < end:
+        if start + section_overlap < end:
             yield (all_text[start:end], find_page(start))
 
-    def index_sections(self, client: SearchClient, sections: dict):
-        i = 0
-        batch = []
-        for s in sections:
-            batch.append(s)
-            i += 1
-            if i % 1000 == 0:
-                results = client.upload_documents(documents=batch)
-                succeeded = sum([1 for r in results if r.succeeded])
-                batch = []
-
-        if len(batch) > 0:
-            results = client.upload_documents(documents=batch)
-            succeeded = sum([1 for r in results if r.succeeded])
+    def index_sections(
+        self,
+        client: SearchBackend,
+        sections: Iterable[dict],
+        indexer: BatchIndexer | None = None,
+    ) -> IndexingReport:
+        if indexer is None:
+            indexer = BatchIndexer()
+            try:
+                return self.index_sections(client, sections, indexer)
+            finally:
+                indexer.close()
+
+        report = indexer.index(
+            client=client, sections=sections, on_progress=self.report_indexed
+        )
+        if self.job is not None:
+            self.job.indexing = report
+        if report.failed:
+            raise Exception(
+                f"{report.failed} sections failed to index: "
+                + ", ".join(
+                    f"{sourcefile} ({f.failed})"
+                    for sourcefile, f in report.files.items()
+                    if f.failed
+                )
+            )
+        return report
+
+    def report_indexed(self, succeeded: int, failed: int = 0) -> None:
+        if self.job is not None:
+            self.job.sections_indexed += succeeded
+            self.job.sections_failed += failed
@@ -0,0 +1,417 @@
+import io
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from typing import Any, BinaryIO, Callable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from pypdf import PdfReader, PdfWriter
+from azure.core.exceptions import AzureError, ResourceNotFoundError
+from azure.storage.blob import ContainerClient
+from azure.ai.formrecognizer import DocumentAnalysisClient
+
+from athena.core.models import ChunkingOptions, FileManifest, IngestJob
+from athena.libs.batch_indexer import BatchIndexer
+from athena.libs.cache import SearchResultCache
+from athena.libs.content import ContentCache
+from athena.libs.indexer import CognitiveIndex
+from athena.libs.jobs import track
+from athena.libs.listing import FileListCache
+from athena.libs.manifest import IngestManifest
+from athena.libs.search import SearchBackend
+from athena.libs.vectors import VectorStore
+
+logger = logging.getLogger()
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+
+def blob_name_from_file_page(filename, page=0):
+    if os.path.splitext(filename)[1].lower() == ".pdf":
+        return os.path.splitext(os.path.basename(filename))[0] + f"-{page}" + ".pdf"
+    else:
+        return os.path.basename(filename)
+
+
+def render_page(page) -> bytes:
+    f = io.BytesIO()
+    writer = PdfWriter()
+    writer.add_page(page)
+    writer.write(f)
+    return f.getvalue()
+
+
+class BlobUploader:
+    def __init__(
+        self,
+        workers: int = 8,
+        window: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+    ) -> None:
+        self.window = window
+        self.retries = retries
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="blob-upload"
+        )
+
+    def upload(
+        self, blob_container: ContainerClient, name: str, data: bytes | BinaryIO
+    ) -> None:
+        def upload_blob(attempt: int) -> None:
+            if attempt and hasattr(data, "seek"):
+                data.seek(0)
+            blob_container.upload_blob(name, data, overwrite=True)
+
+        self.retry(f"Upload of {name}", upload_blob)
+
+    def delete(self, blob_container: ContainerClient, name: str) -> None:
+        def delete_blob(attempt: int) -> None:
+            try:
+                blob_container.delete_blob(name)
+            except ResourceNotFoundError:
+                pass
+
+        self.retry(f"Delete of {name}", delete_blob)
+
+    def retry(self, description: str, action: Callable[[int], None]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                action(attempt)
+                return
+            except AzureError as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2**attempt
+                logger.warning(f"{description} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def upload_all(
+        self,
+        job: IngestJob,
+        blob_container: ContainerClient,
+        blobs: Iterable[tuple[str, bytes | BinaryIO]],
+    ) -> None:
+        # Blobs are produced lazily so the next page renders while earlier
+        # ones upload; at most `window` rendered pages are held at once.
+        in_flight = set()
+        try:
+            for name, data in blobs:
+                if len(in_flight) >= self.window:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self.collect(job, done)
+                in_flight.add(
+                    self._executor.submit(self.upload, blob_container, name, data)
+                )
+            done, in_flight = wait(in_flight)
+            self.collect(job, done)
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    @staticmethod
+    def collect(job: IngestJob, done: set[Future]) -> None:
+        for future in done:
+            future.result()
+            job.pages_uploaded += 1
+
+    def delete_all(self, blob_container: ContainerClient, names: Iterable[str]) -> int:
+        futures = [
+            self._executor.submit(self.delete, blob_container, name) for name in names
+        ]
+        for future in futures:
+            future.result()
+        return len(futures)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def spool_upload(source: BinaryIO, directory: str | None = None) -> str:
+    """Copy an upload to a temporary file that the ingest job owns."""
+    with tempfile.NamedTemporaryFile(
+        dir=directory, prefix="athena-upload-", delete=False
+    ) as f:
+        shutil.copyfileobj(source, f, SPOOL_CHUNK_SIZE)
+    return f.name
+
+
+def pdf_blobs(job: IngestJob, file: BinaryIO) -> Iterator[tuple[str, bytes]]:
+    reader = PdfReader(file)
+    pages = reader.pages
+    job.pages_total = len(pages)
+    for i in range(len(pages)):
+        yield blob_name_from_file_page(job.filename, i), render_page(pages[i])
+
+
+def content_hash(data: bytes | BinaryIO, *parts: Any) -> str:
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode("utf-8"))
+    if isinstance(data, bytes):
+        digest.update(data)
+    else:
+        for chunk in iter(lambda: data.read(SPOOL_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        data.seek(0)
+    return digest.hexdigest()
+
+
+def changed_blobs(
+    job: IngestJob,
+    blobs: Iterable[tuple[str, bytes | BinaryIO]],
+    known_pages: dict[str, str],
+    pages: dict[str, str],
+) -> Iterator[tuple[str, bytes | BinaryIO]]:
+    for name, data in blobs:
+        pages[name] = content_hash(data)
+        if known_pages.get(name) == pages[name]:
+            job.pages_skipped += 1
+            continue
+        yield name, data
+
+
+def upload_blobs(
+    job: IngestJob,
+    file: BinaryIO,
+    content_type: str | None,
+    blob_container: ContainerClient,
+    uploader: BlobUploader,
+    known_pages: dict[str, str] | None = None,
+    pages: dict[str, str] | None = None,
+) -> dict[str, str]:
+    """Upload the blobs for a file, skipping pages whose rendered content
+    matches `known_pages`, and return the hash of every blob it produced.
+    """
+    if content_type == "application/pdf":
+        blobs = pdf_blobs(job=job, file=file)
+    else:
+        blobs = [(blob_name_from_file_page(job.filename), file)]
+    pages = {} if pages is None else pages
+    uploader.upload_all(
+        job=job,
+        blob_container=blob_container,
+        blobs=changed_blobs(
+            job=job, blobs=blobs, known_pages=known_pages or {}, pages=pages
+        ),
+    )
+    return pages
+
+
+def ingest_file(
+    job: IngestJob,
+    path: str,
+    content_type: str | None,
+    blob_container: ContainerClient,
+    formrecognizer: DocumentAnalysisClient,
+    cognitive_search: SearchBackend,
+    uploader: BlobUploader,
+    indexer: BatchIndexer,
+    manifest: IngestManifest | None = None,
+    search_cache: SearchResultCache | None = None,
+    file_list: FileListCache | None = None,
+    content_cache: ContentCache | None = None,
+    chunking: ChunkingOptions | None = None,
+    vectors: VectorStore | None = None,
+) -> None:
+    previous = manifest.get(job.filename) if manifest is not None else None
+    # Only a complete manifest says what is already stored; an incomplete one
+    # just lists what an earlier failed attempt may have left behind.
+    known = previous if previous is not None and previous.complete else None
+    pages = {}
+    section_ids = []
+    indexed = previous.sections if previous is not None else []
+    try:
+        with open(path, "rb") as file:
+            file_hash = content_hash(
+                file,
+                content_type,
+                job.category,
+                (chunking or ChunkingOptions()).dict(),
+            )
+            if known is not None and known.file_hash == file_hash:
+                logger.info(f"{job.filename} is unchanged, skipping ingest")
+                job.pages_skipped = len(known.pages)
+                job.sections_unchanged = len(known.sections)
+                return
+
+            try:
+                with track(job, "uploading"):
+                    upload_blobs(
+                        job=job,
+                        file=file,
+                        content_type=content_type,
+                        blob_container=blob_container,
+                        uploader=uploader,
+                        known_pages=known.pages if known else None,
+                        pages=pages,
+                    )
+                    if previous is not None:
+                        stale = previous.pages.keys() - pages.keys()
+                        logger.info(f"Removing {len(stale)} stale blobs...")
+                        uploader.delete_all(blob_container, stale)
+            except Exception as e:
+                raise Exception("Error in uploading to Azure Blob Storage") from e
+            finally:
+                if file_list is not None:
+                    file_list.invalidate()
+                if content_cache is not None:
+                    content_cache.invalidate(sourcefile=job.filename)
+
+            file.seek(0)
+            try:
+                if previous is None:
+                    # Files indexed before the manifest have no entry; search
+                    # for their sections, which may still carry the old
+                    # positional ids.
+                    indexed = file_section_ids(
+                        cognitive_search=cognitive_search, sourcefile=job.filename
+                    )
+                CognitiveIndex(
+                    filename=job.filename,
+                    document=file,
+                    formrecognizer=formrecognizer,
+                    cognitive_search=cognitive_search,
+                    category=job.category,
+                    job=job,
+                    chunking=chunking,
+                    indexer=indexer,
+                    known_sections=set(known.sections) if known else None,
+                    section_ids=section_ids,
+                    vectors=vectors,
+                )
+                delete_stale_sections(
+                    job=job,
+                    cognitive_search=cognitive_search,
+                    indexer=indexer,
+                    stale=set(indexed) - set(section_ids),
+                    vectors=vectors,
+                )
+            except Exception as e:
+                raise Exception("Cognitive indexer error") from e
+            finally:
+                if search_cache is not None:
+                    search_cache.invalidate()
+
+        if manifest is not None:
+            manifest.put(
+                FileManifest(
+                    sourcefile=job.filename,
+                    file_hash=file_hash,
+                    pages=pages,
+                    sections=section_ids,
+                )
+            )
+    except Exception:
+        if manifest is not None:
+            manifest.put(
+                FileManifest(
+                    sourcefile=job.filename,
+                    file_hash="",
+                    pages={**(previous.pages if previous else {}), **pages},
+                    sections=list(dict.fromkeys(indexed + section_ids)),
+                    complete=False,
+                )
+            )
+        raise
+    finally:
+        os.remove(path)
+
+
+def delete_stale_sections(
+    job: IngestJob,
+    cognitive_search: SearchBackend,
+    indexer: BatchIndexer,
+    stale: set[str],
+    vectors: VectorStore | None = None,
+) -> None:
+    if not stale:
+        return
+    logger.info(f"Removing {len(stale)} stale sections of {job.filename}...")
+    if vectors is not None:
+        vectors.delete(stale)
+    report = indexer.delete(
+        client=cognitive_search, keys=stale, sourcefile=job.filename
+    )
+    job.sections_deleted += sum(f.indexed for f in report.files.values())
+    if report.failed:
+        raise Exception(f"{report.failed} stale sections failed to delete")
+
+
+def file_blob_names(
+    blob_container: ContainerClient, sourcefile: str | None
+) -> list[str]:
+    if sourcefile is None:
+        return list(blob_container.list_blob_names())
+    if os.path.splitext(sourcefile)[1].lower() != ".pdf":
+        return [blob_name_from_file_page(sourcefile)]
+    prefix = os.path.splitext(os.path.basename(sourcefile))[0]
+    page_blob = re.compile(rf"{re.escape(prefix)}-\d+\.pdf")
+    return [
+        name
+        for name in blob_container.list_blob_names(name_starts_with=prefix)
+        if page_blob.fullmatch(name)
+    ]
+
+
+def file_section_ids(
+    cognitive_search: SearchBackend, sourcefile: str | None
+) -> list[str]:
+    filter = (
+        "sourcefile eq '{}'".format(sourcefile.replace("'", "''"))
+        if sourcefile is not None
+        else None
+    )
+    return [
+        doc["id"] for doc in cognitive_search.search("", filter=filter, select=["id"])
+    ]
+
+
+def remove_file(
+    sourcefile: str | None,
+    blob_container: ContainerClient,
+    cognitive_search: SearchBackend,
+    uploader: BlobUploader,
+    indexer: BatchIndexer,
+    manifest: IngestManifest | None = None,
+    vectors: VectorStore | None = None,
+) -> dict:
+    """Delete the blobs and sections of one file, or of every file when
+    `sourcefile` is None.
+
+    The manifest lists what ingest wrote, so removal needs no lookups; files
+    it does not know about fall back to one listing and one id-only search.
+    """
+    recorded = (
+        manifest.get(sourcefile)
+        if manifest is not None and sourcefile is not None
+        else None
+    )
+    if recorded is not None:
+        blobs = list(recorded.pages)
+        keys = recorded.sections
+    else:
+        blobs = file_blob_names(blob_container=blob_container, sourcefile=sourcefile)
+        keys = file_section_ids(
+            cognitive_search=cognitive_search, sourcefile=sourcefile
+        )
+
+    logger.info(f"Removing {len(blobs)} blobs and {len(keys)} sections...")
+    uploader.delete_all(blob_container, blobs)
+    if vectors is not None:
+        vectors.delete(keys)
+    report = indexer.delete(client=cognitive_search, keys=keys, sourcefile=sourcefile)
+    if report.failed:
+        raise Exception(f"{report.failed} sections failed to delete")
+
+    if manifest is not None:
+        if sourcefile is None:
+            manifest.clear()
+        else:
+            manifest.delete(sourcefile)
+    return {"blobs": len(blobs), "sections": len(keys)}
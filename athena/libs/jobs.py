@@ -0,0 +1,167 @@
+import time
+import uuid
+import asyncio
+import logging
+
+from typing import Callable, Iterable, Iterator, TypeVar
+from datetime import datetime
+from contextlib import contextmanager
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from athena.core.models import IngestJob
+from athena.libs.metrics import INGEST_STAGE_SECONDS, span
+
+logger = logging.getLogger()
+
+T = TypeVar("T")
+
+
+class QueueFull(Exception):
+    pass
+
+
+@contextmanager
+def track(job: IngestJob | None, stage: str):
+    if job is not None:
+        job.stage = stage
+    with span(INGEST_STAGE_SECONDS, stage, job.timings if job is not None else None):
+        yield
+
+
+class StageTimer:
+    """Splits time between stages that interleave, such as generators that
+    feed each other lazily, charging each moment to the innermost stage."""
+
+    def __init__(self, job: IngestJob | None) -> None:
+        self.job = job
+        self.elapsed: defaultdict[str, float] = defaultdict(float)
+        self._stack: list[str] = []
+        self._since = time.perf_counter()
+
+    @contextmanager
+    def stage(self, stage: str):
+        self._switch(stage)
+        try:
+            yield
+        finally:
+            self._switch(None)
+
+    def iterate(self, stage: str, items: Iterable[T]) -> Iterator[T]:
+        """Yield from `items`, timing only the work of producing them."""
+        iterator = iter(items)
+        done = object()
+        while True:
+            with self.stage(stage):
+                item = next(iterator, done)
+            if item is done:
+                return
+            yield item
+
+    def record(self) -> None:
+        for stage, elapsed in self.elapsed.items():
+            INGEST_STAGE_SECONDS.observe(elapsed, stage=stage)
+            if self.job is not None:
+                self.job.timings[stage] = self.job.timings.get(stage, 0.0) + elapsed
+
+    def _switch(self, stage: str | None) -> None:
+        # Enter `stage`, or leave the current one when it is None.
+        now = time.perf_counter()
+        if self._stack:
+            self.elapsed[self._stack[-1]] += now - self._since
+        self._since = now
+        if stage is None:
+            self._stack.pop()
+        else:
+            self._stack.append(stage)
+        if self.job is not None and self._stack:
+            self.job.stage = self._stack[-1]
+
+
+class IngestQueue:
+    def __init__(self, workers: int, queue_size: int, job_history: int) -> None:
+        self.workers = workers
+        self.queue_size = queue_size
+        self.job_history = job_history
+        self.jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._executor: ThreadPoolExecutor | None = None
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="ingest"
+        )
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started ingest queue with {self.workers} workers")
+
+    async def stop(self) -> None:
+        # Queued jobs will not run; fail them and release what they hold.
+        while not self._queue.empty():
+            job, _, cleanup = self._queue.get_nowait()
+            self._abandon(job, cleanup)
+            self._queue.task_done()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(
+        self,
+        filename: str,
+        category: str | None,
+        fn: Callable[[IngestJob], None],
+        cleanup: Callable[[], None] | None = None,
+    ) -> IngestJob:
+        """Queue `fn` to run on a worker thread; `cleanup` runs instead if the
+        queue stops before the job starts."""
+        job = IngestJob(id=uuid.uuid4().hex, filename=filename, category=category)
+        try:
+            self._queue.put_nowait((job, fn, cleanup))
+        except asyncio.QueueFull:
+            raise QueueFull(f"Ingest queue is full ({self.queue_size} jobs)")
+        self.jobs[job.id] = job
+        if len(self.jobs) > self.job_history:
+            # Jobs still queued or running stay visible until they finish.
+            finished = [id for id, j in self.jobs.items() if j.finished_at]
+            for id in finished[: len(self.jobs) - self.job_history]:
+                del self.jobs[id]
+        return job
+
+    def get(self, job_id: str) -> IngestJob | None:
+        return self.jobs.get(job_id)
+
+    def _abandon(self, job: IngestJob, cleanup: Callable[[], None] | None) -> None:
+        job.stage = "failed"
+        job.error = "Ingest queue stopped before the job ran"
+        job.finished_at = datetime.utcnow()
+        if cleanup is not None:
+            try:
+                cleanup()
+            except Exception:
+                logger.exception(f"Cleaning up ingest job {job.id} failed")
+
+    async def _worker(self) -> None:
+        while True:
+            job, fn, cleanup = await self._queue.get()
+            job.timings["queued"] = (datetime.utcnow() - job.created_at).total_seconds()
+            INGEST_STAGE_SECONDS.observe(job.timings["queued"], stage="queued")
+            start = time.perf_counter()
+            future = self._executor.submit(fn, job)
+            try:
+                await asyncio.wrap_future(future)
+                job.stage = "done"
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    self._abandon(job, cleanup)
+                raise
+            except Exception as e:
+                logger.exception(f"Ingest job {job.id} for {job.filename} failed")
+                job.stage = "failed"
+                job.error = str(e)
+            finally:
+                job.timings["total"] = time.perf_counter() - start
+                INGEST_STAGE_SECONDS.observe(job.timings["total"], stage="total")
+                job.finished_at = datetime.utcnow()
+                self._queue.task_done()
@@ -0,0 +1,98 @@
+import re
+import time
+import bisect
+import logging
+import threading
+
+from azure.storage.blob import ContainerClient
+
+from athena.core.models import FileList, StoredFile
+
+logger = logging.getLogger()
+
+PAGE_BLOB = re.compile(r"(?P<stem>.+)-\d+\.pdf")
+
+
+def logical_name(blob_name: str) -> str:
+    """Map a per-page PDF blob back to the file it was split from."""
+    if match := PAGE_BLOB.fullmatch(blob_name):
+        return match["stem"] + ".pdf"
+    return blob_name
+
+
+class FileListCache:
+    def __init__(self, ttl: float = 30.0) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._listing: tuple[list[StoredFile], list[str]] | None = None
+        self._expires = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def listing(
+        self, blob_container: ContainerClient
+    ) -> tuple[list[StoredFile], list[str]]:
+        with self._lock:
+            if self._listing is not None and time.monotonic() < self._expires:
+                self.hits += 1
+                return self._listing
+            self.misses += 1
+            generation = self._generation
+        files = self.scan(blob_container)
+        listing = files, [f.name for f in files]
+        with self._lock:
+            # A listing that raced with an invalidation may already be stale.
+            if generation == self._generation:
+                self._listing = listing
+                self._expires = time.monotonic() + self.ttl
+        return listing
+
+    @staticmethod
+    def scan(blob_container: ContainerClient) -> list[StoredFile]:
+        files: dict[str, StoredFile] = {}
+        for blob in blob_container.list_blobs():
+            name = logical_name(blob.name)
+            entry = files.get(name)
+            if entry is None:
+                entry = files[name] = StoredFile(name=name)
+            entry.blobs += 1
+            entry.size += blob.size or 0
+            if blob.last_modified is not None and (
+                entry.last_modified is None or blob.last_modified > entry.last_modified
+            ):
+                entry.last_modified = blob.last_modified
+        return sorted(files.values(), key=lambda f: f.name)
+
+    def page(
+        self,
+        blob_container: ContainerClient,
+        limit: int,
+        continuation_token: str | None = None,
+    ) -> FileList:
+        files, names = self.listing(blob_container)
+        # The token is the last name returned, so pages stay consistent when
+        # files are added or removed between requests.
+        start = (
+            bisect.bisect_right(names, continuation_token) if continuation_token else 0
+        )
+        page = files[start : start + limit]
+        more = start + limit < len(files)
+        return FileList(
+            files=page, continuation_token=page[-1].name if more and page else None
+        )
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._listing = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "size": len(self._listing[0]) if self._listing is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,54 @@
+import sqlite3
+import logging
+import threading
+
+from pathlib import Path
+
+from athena.core.models import FileManifest
+
+logger = logging.getLogger()
+
+
+class IngestManifest:
+    """What the last successful ingest of each file wrote, keyed by sourcefile.
+
+    Page blobs are recorded with the hash of their rendered bytes and
+    sections by id, which embeds the section's content hash.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (sourcefile TEXT PRIMARY KEY, manifest TEXT)"
+        )
+        self._db.commit()
+
+    def get(self, sourcefile: str) -> FileManifest | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT manifest FROM files WHERE sourcefile = ?", (sourcefile,)
+            ).fetchone()
+        return FileManifest.parse_raw(row[0]) if row is not None else None
+
+    def put(self, manifest: FileManifest) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?)",
+                (manifest.sourcefile, manifest.json()),
+            )
+            self._db.commit()
+
+    def delete(self, sourcefile: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM files WHERE sourcefile = ?", (sourcefile,))
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM files")
+            self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
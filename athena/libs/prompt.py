@@ -38,6 +38,24 @@ class FollowUpQuestionsPrompt:
         return prompt
 
 
+class FollowUpQuestionsChatPrompt:
+    def __new__(cls, sources: str, history: list[ChatHistory]) -> list[dict]:
+        logger.info("Generating followup questions ChatGPT Prompt...")
+        system_prompt_content = f"""
+            {FollowUpQuestionsPrompt()}
+            Sources:
+            {sources}
+        """
+        final_prompt = [
+            MessagePrompt(
+                role="system", content=system_prompt_content, name="system"
+            ).dict()
+        ]
+        for hist in history:
+            final_prompt.extend(ChatGPTPrompt.turn(hist))
+        return final_prompt
+
+
 class ChatGPTPrompt:
     def __new__(
         cls, sources: str, history: list[ChatHistory], followup_questions: str
@@ -60,15 +78,17 @@ class ChatGPTPrompt:
         ).dict()
         final_prompt = [system_prompt, assistant_prompt]
         for hist in history:
-            final_prompt.append(
-                MessagePrompt(role="user", content=hist.user, name="employee").dict()
-            )
-            final_prompt.append(
-                MessagePrompt(
-                    role="assistant",
-                    content=hist.bot if hist.bot is not None else "",
-                    name="athena",
-                ).dict()
-            )
+            final_prompt.extend(cls.turn(hist))
 
         return final_prompt
+
+    @staticmethod
+    def turn(hist: ChatHistory) -> list[dict]:
+        return [
+            MessagePrompt(role="user", content=hist.user, name="employee").dict(),
+            MessagePrompt(
+                role="assistant",
+                content=hist.bot if hist.bot is not None else "",
+                name="athena",
+            ).dict(),
+        ]
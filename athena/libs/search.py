@@ -0,0 +1,363 @@
+import re
+import json
+import math
+import mmap
+import heapq
+import asyncio
+import logging
+import threading
+
+from abc import ABC, abstractmethod
+from array import array
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterable, Iterator
+from itertools import islice
+from collections import Counter, defaultdict
+
+from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from azure.search.documents.models import IndexingResult
+
+from athena.libs.segments import SegmentLog
+
+logger = logging.getLogger()
+
+TOKEN = re.compile(r"\w+")
+FILTER_CLAUSE = re.compile(r"\s*(\w+) (eq|ne) '((?:[^']|'')*)'\s*")
+FILTER_AND = re.compile(r"and\b")
+
+
+class SearchBackend(ABC):
+    """The part of an Azure SearchClient that retrieval and indexing use."""
+
+    @abstractmethod
+    def search(
+        self,
+        search_text: str,
+        filter: str | None = None,
+        top: int | None = None,
+        select: list[str] | None = None,
+        **kwargs: Any,
+    ) -> Iterable[dict]:
+        ...
+
+    @abstractmethod
+    def upload_documents(self, documents: list[dict]) -> list[IndexingResult]:
+        ...
+
+    @abstractmethod
+    def delete_documents(self, documents: list[dict]) -> list[IndexingResult]:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncSearchBackend(ABC):
+    @abstractmethod
+    async def search(
+        self,
+        search_text: str,
+        filter: str | None = None,
+        top: int | None = None,
+        select: list[str] | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[dict]:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+
+SearchBackend.register(SearchClient)
+AsyncSearchBackend.register(AsyncSearchClient)
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN.findall(text.casefold())
+
+
+def parse_filter(filter: str | None) -> list[tuple[str, bool, str]]:
+    """Parse the subset of OData filters the app sends: `field eq 'value'`
+    and `field ne 'value'` clauses joined with `and`."""
+    clauses = []
+    if not filter or not filter.strip():
+        return clauses
+    position = 0
+    while True:
+        match = FILTER_CLAUSE.match(filter, position)
+        if match is None:
+            raise ValueError(f"Unsupported filter: {filter}")
+        field, operator, value = match.groups()
+        clauses.append((field, operator == "eq", value.replace("''", "'")))
+        position = match.end()
+        if position == len(filter):
+            return clauses
+        separator = FILTER_AND.match(filter, position)
+        if separator is None:
+            raise ValueError(f"Unsupported filter: {filter}")
+        position = separator.end()
+
+
+def matches(doc: dict, clauses: list[tuple[str, bool, str]]) -> bool:
+    return all((doc.get(field) == value) == equal for field, equal, value in clauses)
+
+
+class LocalSearchIndex(SearchBackend):
+    """In-process BM25 search over the section dicts create_sections makes.
+
+    Each term's postings are (document, term frequency) pairs of uint32 in a
+    single memory-mapped file written by flush(). Terms of documents uploaded
+    since then are held in in-memory arrays until the next flush.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        searchable_fields: tuple[str, ...] = ("content",),
+        flush_every: int = 10000,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self.segments = SegmentLog(directory, ("segment-{}.json", "postings-{}.bin"))
+        self.searchable_fields = searchable_fields
+        self.flush_every = flush_every
+        self.k1 = k1
+        self.b = b
+        self.docs: list[dict | None] = []
+        self.ids: dict[str, int] = {}
+        self.lengths = array("I")
+        self.total_length = 0
+        self.terms: dict[str, tuple[int, int]] = {}
+        self.delta: dict[str, array] = {}
+        self._file = None
+        self._mmap = None
+        self._postings = memoryview(array("I"))
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self) -> None:
+        if self.segments.generation:
+            segment_path, postings_path = self.segments.paths(self.segments.generation)
+            segment = json.loads(segment_path.read_text(encoding="utf-8"))
+            self.docs = segment["docs"]
+            self.ids = {doc["id"]: number for number, doc in enumerate(self.docs)}
+            self.lengths = array("I", segment["lengths"])
+            self.total_length = sum(self.lengths)
+            self.terms = {
+                term: tuple(entry) for term, entry in segment["terms"].items()
+            }
+            self.open_postings(postings_path)
+        for operation in self.segments.replay():
+            if "upload" in operation:
+                self._add(operation["upload"])
+            else:
+                self._remove(operation["delete"])
+
+    def open_postings(self, path: Path) -> None:
+        self.close_postings()
+        if path.stat().st_size == 0:
+            return
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._postings = memoryview(self._mmap).cast("I")
+
+    def close_postings(self) -> None:
+        self._postings.release()
+        self._postings = memoryview(array("I"))
+        if self._mmap is not None:
+            self._mmap.close()
+            self._file.close()
+            self._mmap = self._file = None
+
+    def _add(self, doc: dict) -> None:
+        self._remove(doc["id"])
+        number = len(self.docs)
+        counts = Counter(
+            token
+            for field in self.searchable_fields
+            for token in tokenize(doc.get(field) or "")
+        )
+        length = sum(counts.values())
+        self.docs.append(doc)
+        self.ids[doc["id"]] = number
+        self.lengths.append(length)
+        self.total_length += length
+        for term, frequency in counts.items():
+            self.delta.setdefault(term, array("I")).extend((number, frequency))
+
+    def _remove(self, key: str) -> None:
+        number = self.ids.pop(key, None)
+        if number is not None:
+            self.docs[number] = None
+            self.total_length -= self.lengths[number]
+
+    def postings(self, term: str) -> Iterator[tuple[int, int]]:
+        entry = self.terms.get(term)
+        if entry is not None:
+            offset, count = entry
+            postings = self._postings[offset : offset + 2 * count]
+            yield from zip(postings[::2], postings[1::2])
+        delta = self.delta.get(term)
+        if delta is not None:
+            yield from zip(delta[::2], delta[1::2])
+
+    def upload_documents(self, documents: list[dict]) -> list[IndexingResult]:
+        return self.apply("upload", documents)
+
+    def delete_documents(self, documents: list[dict]) -> list[IndexingResult]:
+        return self.apply("delete", documents)
+
+    def apply(self, action: str, documents: list[dict]) -> list[IndexingResult]:
+        with self._lock:
+            if action == "upload":
+                self.segments.append({"upload": doc} for doc in documents)
+                for doc in documents:
+                    self._add(dict(doc))
+            else:
+                self.segments.append({"delete": doc["id"]} for doc in documents)
+                for doc in documents:
+                    self._remove(doc["id"])
+            if self.segments.pending >= self.flush_every:
+                self.flush()
+        return [
+            IndexingResult(key=doc["id"], succeeded=True, status_code=200)
+            for doc in documents
+        ]
+
+    def search(
+        self,
+        search_text: str,
+        filter: str | None = None,
+        top: int | None = None,
+        select: list[str] | None = None,
+        query_caption: str | None = None,
+        **kwargs: Any,
+    ) -> list[dict]:
+        """Rank by BM25, or list every matching document in index order when
+        there are no search terms. Semantic ranking arguments are ignored."""
+        clauses = parse_filter(filter)
+        terms = set(tokenize(search_text or ""))
+        with self._lock:
+            if terms:
+                scores = self.score(terms)
+                candidates = (
+                    (number, score)
+                    for number, score in scores.items()
+                    if matches(self.docs[number], clauses)
+                )
+                if top is None:
+                    hits = sorted(candidates, key=lambda hit: (-hit[1], hit[0]))
+                else:
+                    hits = heapq.nsmallest(
+                        top, candidates, key=lambda hit: (-hit[1], hit[0])
+                    )
+            else:
+                hits = islice(
+                    (
+                        (number, 1.0)
+                        for number, doc in enumerate(self.docs)
+                        if doc is not None and matches(doc, clauses)
+                    ),
+                    top,
+                )
+            return [
+                self.result(self.docs[number], score, select, query_caption)
+                for number, score in hits
+            ]
+
+    def score(self, terms: Iterable[str]) -> dict[int, float]:
+        count = len(self.ids)
+        if not count:
+            return {}
+        average_length = self.total_length / count or 1.0
+        scores = defaultdict(float)
+        for term in terms:
+            postings = [
+                (number, frequency)
+                for number, frequency in self.postings(term)
+                if self.docs[number] is not None
+            ]
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for number, frequency in postings:
+                norm = frequency + self.k1 * (
+                    1 - self.b + self.b * self.lengths[number] / average_length
+                )
+                scores[number] += idf * frequency * (self.k1 + 1) / norm
+        return scores
+
+    @staticmethod
+    def result(
+        doc: dict, score: float, select: list[str] | None, query_caption: str | None
+    ) -> dict:
+        result = {k: doc[k] for k in select if k in doc} if select else dict(doc)
+        result["@search.score"] = score
+        if query_caption:
+            result["@search.captions"] = [
+                SimpleNamespace(text=doc.get("content", ""), highlights=None)
+            ]
+        return result
+
+    def flush(self) -> None:
+        """Write the live documents as a new segment and truncate the log."""
+        with self._lock:
+            live = [number for number, doc in enumerate(self.docs) if doc is not None]
+            renumber = {number: i for i, number in enumerate(live)}
+            postings = array("I")
+            terms = {}
+            for term in sorted(self.terms.keys() | self.delta.keys()):
+                start = len(postings)
+                for number, frequency in self.postings(term):
+                    if (i := renumber.get(number)) is not None:
+                        postings.extend((i, frequency))
+                if len(postings) > start:
+                    terms[term] = (start, (len(postings) - start) // 2)
+            docs = [self.docs[number] for number in live]
+            lengths = [self.lengths[number] for number in live]
+
+            generation = self.segments.generation + 1
+            segment_path, postings_path = self.segments.paths(generation)
+            with open(postings_path, "wb") as f:
+                postings.tofile(f)
+            segment_path.write_text(
+                json.dumps({"docs": docs, "lengths": lengths, "terms": terms}),
+                encoding="utf-8",
+            )
+            self.open_postings(postings_path)
+            self.segments.commit(generation)
+            self.docs = docs
+            self.ids = {doc["id"]: number for number, doc in enumerate(docs)}
+            self.lengths = array("I", lengths)
+            self.total_length = sum(lengths)
+            self.terms = terms
+            self.delta = {}
+            logger.info(f"Flushed local search index with {len(docs)} documents")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.segments.pending:
+                self.flush()
+            self.segments.close()
+            self.close_postings()
+
+
+class AsyncLocalSearchIndex(AsyncSearchBackend):
+    """Async view of a LocalSearchIndex; searches run in a worker thread."""
+
+    def __init__(self, index: LocalSearchIndex) -> None:
+        self.index = index
+
+    async def search(self, search_text: str, **kwargs: Any) -> AsyncIterator[dict]:
+        docs = await asyncio.to_thread(self.index.search, search_text, **kwargs)
+        return iterate(docs)
+
+
+async def iterate(docs: list[dict]) -> AsyncIterator[dict]:
+    for doc in docs:
+        yield doc
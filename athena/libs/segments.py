@@ -0,0 +1,71 @@
+import os
+import json
+
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+class SegmentLog:
+    """The files behind an index that flushes to numbered segments.
+
+    CURRENT names the generation of the last flushed segment files, and
+    log.jsonl holds the operations applied since then, one JSON object a
+    line, so a change is durable once appended and is replayed on open.
+    """
+
+    def __init__(self, directory: str | Path, names: tuple[str, ...]) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.names = names
+        self.current = self.directory / "CURRENT"
+        self.path = self.directory / "log.jsonl"
+        self.generation = int(self.current.read_text()) if self.current.exists() else 0
+        self.pending = 0
+        self._log = open(self.path, "a", encoding="utf-8")
+
+    def paths(self, generation: int) -> tuple[Path, ...]:
+        """The segment files of a generation, in the order of `names`."""
+        return tuple(self.directory / name.format(generation) for name in self.names)
+
+    def replay(self) -> Iterator[dict]:
+        """Yield the logged operations, dropping a last line torn by a crash."""
+        with open(self.path, "rb") as log:
+            offset = 0
+            for line in log:
+                try:
+                    operation = json.loads(line) if line.endswith(b"\n") else None
+                except json.JSONDecodeError:
+                    operation = None
+                if operation is None:
+                    # Later appends would otherwise run on from the torn line.
+                    os.truncate(self.path, offset)
+                    return
+                offset += len(line)
+                self.pending += 1
+                yield operation
+
+    def append(self, operations: Iterable[dict]) -> None:
+        count = 0
+        for operation in operations:
+            self._log.write(json.dumps(operation) + "\n")
+            count += 1
+        self._log.flush()
+        self.pending += count
+
+    def commit(self, generation: int) -> None:
+        """Point CURRENT at `generation`, whose files are written, then
+        truncate the log and delete the previous generation's files."""
+        tmp = self.current.with_suffix(".tmp")
+        tmp.write_text(str(generation))
+        os.replace(tmp, self.current)
+        # Replaying a log over the segment it went into is harmless, so a
+        # crash before the truncation loses nothing.
+        self._log.close()
+        self._log = open(self.path, "w", encoding="utf-8")
+        for path in self.paths(self.generation):
+            path.unlink(missing_ok=True)
+        self.generation = generation
+        self.pending = 0
+
+    def close(self) -> None:
+        self._log.close()
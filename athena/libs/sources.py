@@ -0,0 +1,85 @@
+import re
+
+WORD = re.compile(r"\w+")
+SHINGLE_SIZE = 5
+MIN_OVERLAP = 20
+
+
+def merge_overlap(
+    first: str, second: str, min_overlap: int = MIN_OVERLAP
+) -> str | None:
+    """Join two chunks when the start of second repeats the end of first, as
+    neighbouring sections from the indexer do, or when one contains the
+    other. Returns None when they do not overlap."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    probe = second[:min_overlap]
+    if len(probe) < min_overlap:
+        return None
+    position = first.find(probe)
+    while position != -1:
+        if second.startswith(first[position:]):
+            return first + second[len(first) - position :]
+        position = first.find(probe, position + 1)
+    return None
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[int]:
+    words = WORD.findall(text.casefold())
+    if len(words) <= size:
+        return {hash(tuple(words))}
+    return {hash(tuple(words[i : i + size])) for i in range(len(words) - size + 1)}
+
+
+def similarity(first: set[int], second: set[int]) -> float:
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def merge_adjacent(docs: list[dict], min_overlap: int = MIN_OVERLAP) -> list[dict]:
+    """Merge overlapping chunks of the same sourcepage into the best ranked
+    of them, keeping the rank order of what is left."""
+    merged: list[dict] = []
+    for doc in docs:
+        while True:
+            for i, kept in enumerate(merged):
+                if kept["sourcepage"] != doc["sourcepage"]:
+                    continue
+                content = merge_overlap(
+                    kept["content"], doc["content"], min_overlap
+                ) or merge_overlap(doc["content"], kept["content"], min_overlap)
+                if content is not None:
+                    # The merged chunk may now overlap another kept one.
+                    kept = merged.pop(i)
+                    doc = {
+                        **kept,
+                        "content": content,
+                        "rank": min(kept["rank"], doc["rank"]),
+                    }
+                    break
+            else:
+                break
+        position = next(
+            (i for i, kept in enumerate(merged) if kept["rank"] > doc["rank"]),
+            len(merged),
+        )
+        merged.insert(position, doc)
+    return merged
+
+
+def deduplicate(
+    docs: list[dict], threshold: float = 0.8, min_overlap: int = MIN_OVERLAP
+) -> list[dict]:
+    """Merge overlapping chunks of a page, then drop chunks whose word
+    shingles are near-duplicates of a better ranked chunk."""
+    ranked = [{**doc, "rank": rank} for rank, doc in enumerate(docs)]
+    kept: list[tuple[dict, set[int]]] = []
+    for doc in merge_adjacent(ranked, min_overlap):
+        doc_shingles = shingles(doc["content"])
+        if any(similarity(doc_shingles, other) >= threshold for _, other in kept):
+            continue
+        kept.append((doc, doc_shingles))
+    return [{k: v for k, v in doc.items() if k != "rank"} for doc, _ in kept]
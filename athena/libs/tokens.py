@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import threading
+
+from typing import Iterable
+from collections import OrderedDict
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - depends on the environment
+    tiktoken = None
+
+logger = logging.getLogger()
+
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-35-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16384,
+    "gpt-35-turbo-16k": 16384,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "text-davinci-003": 4097,
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+# Every chat message is framed by a few tokens of its own, and the reply is
+# primed with three more.
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+
+def context_window(model: str | None, overrides: dict[str, int] | None = None) -> int:
+    windows = {**MODEL_CONTEXT_WINDOWS, **(overrides or {})}
+    return windows.get(model or "", DEFAULT_CONTEXT_WINDOW)
+
+
+class TokenCounter:
+    """Counts tokens with the model's tiktoken encoding and remembers the
+    count of every text it has seen, so a conversation's earlier turns are
+    only encoded once.
+
+    Falls back to a four-characters-per-token estimate when tiktoken or its
+    encoding files are unavailable.
+    """
+
+    def __init__(self, model: str | None, maxsize: int = 16384) -> None:
+        self.model = model
+        self.maxsize = maxsize
+        self._encoding = None
+        self._loaded = False
+        self._counts: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        if not self._loaded:
+            self._encoding = self.load_encoding(self.model)
+            self._loaded = True
+        return self._encoding
+
+    def load(self) -> None:
+        """Load the encoding now rather than on the first count, as tiktoken
+        may download it."""
+        self.encoding
+
+    @staticmethod
+    def load_encoding(model: str | None):
+        if tiktoken is None:
+            logger.warning("tiktoken is not installed, estimating token counts")
+            return None
+        try:
+            try:
+                return tiktoken.encoding_for_model(model or "")
+            except KeyError:
+                return tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            logger.warning(
+                f"Could not load the tokenizer for {model}, estimating token counts",
+                exc_info=True,
+            )
+            return None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._lock:
+            count = self._counts.get(key)
+            if count is not None:
+                self._counts.move_to_end(key)
+                return count
+        encoding = self.encoding
+        if encoding is None:
+            count = len(text) // 4 + 1
+        else:
+            count = len(encoding.encode(text, disallowed_special=()))
+        with self._lock:
+            self._counts[key] = count
+            if len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+        return count
+
+    def message(self, message: dict) -> int:
+        tokens = TOKENS_PER_MESSAGE
+        for field, value in message.items():
+            if isinstance(value, str):
+                tokens += self.count(value)
+                if field == "name" and value:
+                    tokens += TOKENS_PER_NAME
+        return tokens
+
+    def messages(self, messages: Iterable[dict]) -> int:
+        return sum(self.message(message) for message in messages) + TOKENS_PER_REPLY
@@ -0,0 +1,429 @@
+import json
+import base64
+import asyncio
+import hashlib
+import logging
+import threading
+
+from types import ModuleType
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import openai
+
+from athena.libs.cache import Cache
+from athena.libs.search import matches, parse_filter
+from athena.libs.segments import SegmentLog
+
+logger = logging.getLogger()
+
+BLOCK_ROWS = 65536
+IVF_MIN_ROWS_PER_PARTITION = 39
+IVF_ITERATIONS = 10
+RRF_K = 60
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode()
+
+
+def decode_vector(value: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+
+
+def reciprocal_rank_fusion(
+    rankings: Iterable[list[dict]], key, top: int | None = None, k: int = RRF_K
+) -> list[dict]:
+    """Merge ranked lists by summing 1 / (k + rank) for every list a
+    document appears in."""
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            doc_key = key(doc)
+            scores[doc_key] = scores.get(doc_key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(doc_key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[doc_key] for doc_key in ranked[:top]]
+
+
+class Embedder:
+    """Embeds texts in batches through the OpenAI embeddings API, caching
+    every vector by a hash of the model and the text unless `cache` is False."""
+
+    def __init__(
+        self,
+        openai_client: ModuleType = openai,
+        model: str = "text-embedding-ada-002",
+        batch_size: int = 16,
+        cache: Cache | None = None,
+    ) -> None:
+        self.openai = openai_client
+        self.model = model
+        self.batch_size = batch_size
+        self.cache = cache
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    def lookup(
+        self, texts: list[str], cache: Cache | None
+    ) -> tuple[list[np.ndarray | None], dict[str, list[int]]]:
+        vectors = [None] * len(texts)
+        missing = {}
+        for i, text in enumerate(texts):
+            cached = cache.get(self.key(text)) if cache is not None else None
+            if cached is not None:
+                vectors[i] = decode_vector(cached)
+            else:
+                missing.setdefault(text, []).append(i)
+        return vectors, missing
+
+    def batches(self, missing: dict[str, list[int]]) -> Iterator[list[str]]:
+        texts = list(missing)
+        for start in range(0, len(texts), self.batch_size):
+            yield texts[start : start + self.batch_size]
+
+    def store(
+        self,
+        vectors: list[np.ndarray | None],
+        missing: dict[str, list[int]],
+        batch: list[str],
+        response,
+        cache: Cache | None,
+    ) -> None:
+        for item in response["data"]:
+            text = batch[item["index"]]
+            vector = np.asarray(item["embedding"], dtype=np.float32)
+            if cache is not None:
+                cache.set(self.key(text), encode_vector(vector))
+            for i in missing[text]:
+                vectors[i] = vector
+
+    async def off_loop(self, fn, *args, cache: Cache | None):
+        # A disk cache does I/O, so its lookups run on a thread.
+        if cache is not None and cache.blocking:
+            return await asyncio.to_thread(fn, *args, cache)
+        return fn(*args, cache)
+
+    def embed(self, texts: list[str], cache: bool = True) -> np.ndarray:
+        cache = self.cache if cache else None
+        vectors, missing = self.lookup(texts, cache)
+        for batch in self.batches(missing):
+            response = self.openai.Embedding.create(model=self.model, input=batch)
+            self.store(vectors, missing, batch, response, cache)
+        return normalize(np.vstack(vectors)) if vectors else np.empty((0, 0))
+
+    async def aembed(self, texts: list[str], cache: bool = True) -> np.ndarray:
+        cache = self.cache if cache else None
+        vectors, missing = await self.off_loop(self.lookup, texts, cache=cache)
+        for batch in self.batches(missing):
+            response = await self.openai.Embedding.acreate(
+                model=self.model, input=batch
+            )
+            await self.off_loop(
+                self.store, vectors, missing, batch, response, cache=cache
+            )
+        return normalize(np.vstack(vectors)) if vectors else np.empty((0, 0))
+
+
+class VectorIndex:
+    """Exhaustive or IVF-partitioned cosine search over unit vectors.
+
+    flush() writes the live vectors as a memory-mapped .npy matrix (float16
+    by default) with the section dicts beside it, and vectors added since
+    then are searched from memory. With `partitions` set, flush() also
+    clusters the matrix with spherical k-means and searches only probe the
+    `probes` nearest partitions.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        dtype: str = "float16",
+        partitions: int = 0,
+        probes: int = 8,
+        flush_every: int = 10000,
+    ) -> None:
+        self.segments = SegmentLog(
+            directory, ("segment-{}.json", "vectors-{}.npy", "ivf-{}.npz")
+        )
+        self.dtype = np.dtype(dtype)
+        self.partitions = partitions
+        self.probes = probes
+        self.flush_every = flush_every
+        self.dimensions: int | None = None
+        self.matrix = np.empty((0, 0), dtype=self.dtype)
+        self.centroids: np.ndarray | None = None
+        self.order: np.ndarray | None = None
+        self.offsets: np.ndarray | None = None
+        self.docs: list[dict] = []
+        self.ids: dict[str, int] = {}
+        # One byte per row; bytearray appends in amortized constant time.
+        self.live = bytearray()
+        self.delta: list[np.ndarray] = []
+        self._delta_matrix: np.ndarray | None = None
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self) -> None:
+        if self.segments.generation:
+            segment_path, vectors_path, ivf_path = self.segments.paths(
+                self.segments.generation
+            )
+            segment = json.loads(segment_path.read_text(encoding="utf-8"))
+            self.docs = segment["docs"]
+            self.dimensions = segment["dimensions"]
+            self.matrix = (
+                np.load(vectors_path, mmap_mode="r")
+                if self.docs
+                else np.empty((0, self.dimensions or 0), dtype=self.dtype)
+            )
+            self.ids = {doc["id"]: row for row, doc in enumerate(self.docs)}
+            self.live = bytearray(b"\x01") * len(self.docs)
+            if ivf_path.exists():
+                with np.load(ivf_path) as ivf:
+                    self.centroids = ivf["centroids"]
+                    self.order = ivf["order"]
+                    self.offsets = ivf["offsets"]
+        for operation in self.segments.replay():
+            if "upload" in operation:
+                self._add(operation["upload"], decode_vector(operation["vector"]))
+            else:
+                self._remove(operation["delete"])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _add(self, doc: dict, vector: np.ndarray) -> None:
+        if self.dimensions is None:
+            self.dimensions = len(vector)
+        elif len(vector) != self.dimensions:
+            raise ValueError(
+                f"Vector of {len(vector)} dimensions added to an index of "
+                f"{self.dimensions}"
+            )
+        self._remove(doc["id"])
+        self.ids[doc["id"]] = len(self.docs)
+        self.docs.append(doc)
+        self.live.append(1)
+        self.delta.append(vector)
+        self._delta_matrix = None
+
+    def _remove(self, key: str) -> None:
+        row = self.ids.pop(key, None)
+        if row is not None:
+            self.live[row] = 0
+
+    def add(self, docs: list[dict], vectors: np.ndarray) -> None:
+        with self._lock:
+            vectors = [np.asarray(vector, dtype=np.float32) for vector in vectors]
+            self.segments.append(
+                {"upload": doc, "vector": encode_vector(vector)}
+                for doc, vector in zip(docs, vectors)
+            )
+            for doc, vector in zip(docs, vectors):
+                self._add(doc, vector)
+            if self.segments.pending >= self.flush_every:
+                self.flush()
+
+    def delete(self, keys: Iterable[str]) -> None:
+        with self._lock:
+            keys = [key for key in dict.fromkeys(keys) if key in self.ids]
+            self.segments.append({"delete": key} for key in keys)
+            for key in keys:
+                self._remove(key)
+
+    def search(
+        self, vector: np.ndarray, top: int | None = 3, filter: str | None = None
+    ) -> list[tuple[dict, float]]:
+        clauses = parse_filter(filter)
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            rows, scores = self.score(query)
+            keep = np.frombuffer(self.live, dtype=bool)[rows]
+            if clauses:
+                keep &= np.fromiter(
+                    (matches(self.docs[row], clauses) for row in rows),
+                    dtype=bool,
+                    count=len(rows),
+                )
+            rows, scores = rows[keep], scores[keep]
+            if top is not None and len(rows) > top:
+                best = np.argpartition(-scores, top - 1)[:top]
+                rows, scores = rows[best], scores[best]
+            ranked = np.argsort(-scores, kind="stable")
+            return [(self.docs[rows[i]], float(scores[i])) for i in ranked]
+
+    def score(self, query: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Cosine scores of the candidate rows: the probed partitions (or
+        the whole matrix) plus everything added since the last flush."""
+        segment_rows = len(self.matrix)
+        if self.centroids is not None and segment_rows:
+            nearest = np.argsort(-(self.centroids @ query))[: self.probes]
+            candidates = np.concatenate(
+                [self.order[self.offsets[p] : self.offsets[p + 1]] for p in nearest]
+            )
+            candidates.sort()
+        else:
+            candidates = np.arange(segment_rows)
+        scores = [
+            np.asarray(
+                self.matrix[candidates[start : start + BLOCK_ROWS]], dtype=np.float32
+            )
+            @ query
+            for start in range(0, len(candidates), BLOCK_ROWS)
+        ]
+        if self.delta:
+            if self._delta_matrix is None:
+                self._delta_matrix = np.vstack(self.delta)
+            scores.append(self._delta_matrix @ query)
+            candidates = np.concatenate(
+                [candidates, np.arange(segment_rows, len(self.docs))]
+            )
+        if not scores:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return candidates, np.concatenate(scores)
+
+    def train(self, matrix: np.ndarray) -> tuple[np.ndarray, ...] | None:
+        """Spherical k-means over (a sample of) the matrix; returns the
+        centroids, the rows ordered by partition and the partition offsets."""
+        partitions = min(self.partitions, len(matrix) // IVF_MIN_ROWS_PER_PARTITION)
+        if partitions < 2:
+            return None
+        rng = np.random.default_rng(0)
+        sample_size = min(len(matrix), partitions * 256)
+        sample = np.asarray(
+            matrix[np.sort(rng.choice(len(matrix), sample_size, replace=False))],
+            dtype=np.float32,
+        )
+        centroids = sample[rng.choice(len(sample), partitions, replace=False)]
+        for _ in range(IVF_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for p in range(partitions):
+                members = sample[assignment == p]
+                if len(members):
+                    centroids[p] = members.sum(axis=0)
+            centroids = normalize(centroids)
+        assignment = np.concatenate(
+            [
+                np.argmax(
+                    np.asarray(matrix[start : start + BLOCK_ROWS], dtype=np.float32)
+                    @ centroids.T,
+                    axis=1,
+                )
+                for start in range(0, len(matrix), BLOCK_ROWS)
+            ]
+        )
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(partitions + 1))
+        return centroids, order, offsets
+
+    def flush(self) -> None:
+        """Write the live vectors as a new segment and truncate the log."""
+        with self._lock:
+            rows = np.flatnonzero(np.frombuffer(self.live, dtype=bool))
+            generation = self.segments.generation + 1
+            segment_path, vectors_path, ivf_path = self.segments.paths(generation)
+            dimensions = self.dimensions or 0
+            docs = [self.docs[row] for row in rows]
+            if len(rows):
+                matrix = np.lib.format.open_memmap(
+                    vectors_path,
+                    mode="w+",
+                    dtype=self.dtype,
+                    shape=(len(rows), dimensions),
+                )
+                segment_rows = len(self.matrix)
+                for start in range(0, len(rows), BLOCK_ROWS):
+                    block = rows[start : start + BLOCK_ROWS]
+                    old = block[block < segment_rows]
+                    new = block[block >= segment_rows] - segment_rows
+                    if len(old):
+                        matrix[start : start + len(old)] = self.matrix[old]
+                    if len(new):
+                        matrix[start + len(old) : start + len(block)] = np.vstack(
+                            [self.delta[i] for i in new]
+                        )
+                matrix.flush()
+                ivf = self.train(matrix)
+                del matrix
+                if ivf is not None:
+                    centroids, order, offsets = ivf
+                    np.savez(
+                        ivf_path, centroids=centroids, order=order, offsets=offsets
+                    )
+            segment_path.write_text(
+                json.dumps({"docs": docs, "dimensions": self.dimensions}),
+                encoding="utf-8",
+            )
+            self.matrix = np.empty((0, dimensions), dtype=self.dtype)
+            self.segments.commit(generation)
+            self.docs, self.ids, self.live = [], {}, bytearray()
+            self.delta, self._delta_matrix = [], None
+            self.centroids = self.order = self.offsets = None
+            self.load()
+            logger.info(f"Flushed vector index with {len(self.docs)} vectors")
+
+    def close(self) -> None:
+        with self._lock:
+            if self.segments.pending:
+                self.flush()
+            self.segments.close()
+            self.matrix = np.empty((0, 0), dtype=self.dtype)
+
+
+class VectorStore:
+    """Embeds sections into a VectorIndex and runs vector queries.
+
+    Query embeddings bypass the embedding cache: queries rarely repeat, and
+    caching them would push section vectors out of it.
+    """
+
+    def __init__(self, embedder: Embedder, index: VectorIndex) -> None:
+        self.embedder = embedder
+        self.index = index
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def add(self, sections: list[dict]) -> None:
+        if sections:
+            vectors = self.embedder.embed([section["content"] for section in sections])
+            self.index.add(sections, vectors)
+
+    def delete(self, keys: Iterable[str]) -> None:
+        self.index.delete(keys)
+
+    def search(
+        self, query: str, top: int | None = 3, filter: str | None = None
+    ) -> list[dict]:
+        vector = self.embedder.embed([query], cache=False)[0]
+        return self.results(self.index.search(vector, top=top, filter=filter))
+
+    async def asearch(
+        self, query: str, top: int | None = 3, filter: str | None = None
+    ) -> list[dict]:
+        vector = (await self.embedder.aembed([query], cache=False))[0]
+        hits = await asyncio.to_thread(
+            self.index.search, vector, top=top, filter=filter
+        )
+        return self.results(hits)
+
+    @staticmethod
+    def results(hits: list[tuple[dict, float]]) -> list[dict]:
+        return [{**doc, "@search.score": score} for doc, score in hits]
+
+    def close(self) -> None:
+        self.index.close()
+        if self.embedder.cache is not None:
+            self.embedder.cache.close()
@@ -4,7 +4,7 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from athena.routers import file_handler, chat
+from athena.routers import file_handler, chat, metrics
 from athena.core.logger import setup_rich_logger
 from athena.core.lifespan import azure_resource_connections
 from athena.core.config import ApiSettings
@@ -18,6 +18,7 @@ def init() -> FastAPI:
     app = FastAPI(lifespan=azure_resource_connections)
     app.include_router(file_handler.router)
     app.include_router(chat.router)
+    app.include_router(metrics.router)
     setup_rich_logger()
     origins = [config.cors_origin]
     logger.info("Initializing Athena Core...")
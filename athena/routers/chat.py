@@ -1,43 +1,229 @@
+import json
+import logging
 import openai
-import mimetypes
-import enum
 
 from fastapi import APIRouter, Request, Response, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import Awaitable, Callable
 from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
-from athena.core.config import OpenAISettings
-from athena.core.models import Chat, MessageResponse
+from athena.libs.batch import run_batch
+from athena.core.config import OpenAISettings, PromptSettings
+from athena.core.models import BlobContent, Chat, MessageResponse
+from athena.libs.content import (
+    ContentCache,
+    RangeNotSatisfiable,
+    blob_content,
+    download,
+    parse_range,
+    read_file,
+)
 
 router = APIRouter(tags=["chat"], prefix="/chat")
+logger = logging.getLogger()
 
-chat_approaches = {"rrr": ReadRetrieveReadApproach("sourcepage", "content")}
+prompt_settings = PromptSettings()
+chat_approaches = {
+    "rrr": ReadRetrieveReadApproach(
+        "sourcepage",
+        "content",
+        answer_tokens=prompt_settings.answer_tokens,
+        history_tokens=prompt_settings.history_tokens,
+        context_windows=prompt_settings.context_windows,
+        duplicate_threshold=prompt_settings.duplicate_threshold,
+        followup_model=prompt_settings.followup_model,
+        followup_tokens=prompt_settings.followup_tokens,
+    )
+}
 openai_config = OpenAISettings()
 openai.api_key = openai_config.api_key
 
 
 @router.post("/")
 async def chat(request: Request, chat: Chat) -> MessageResponse:
-    search_client = request.app.state.cognitive_search
+    search_client = request.app.state.async_cognitive_search
     try:
         impl = chat_approaches.get(chat.approach)
         if not impl:
             return HTTPException(status_code=400, detail="unknown approach")
-        chat_response = impl.run(
+        chat_response = await impl.arun(
             search_client=search_client,
             history=chat.history,
             overrides=chat.overrides,
+            query_cache=request.app.state.query_cache,
+            search_cache=request.app.state.search_cache,
+            vectors=request.app.state.vector_store,
         )
         return chat_response
     except Exception as e:
         raise e
 
 
+@router.post("/stream")
+async def chat_stream(request: Request, chat: Chat) -> StreamingResponse:
+    search_client = request.app.state.async_cognitive_search
+    impl = chat_approaches.get(chat.approach)
+    if not impl:
+        raise HTTPException(status_code=400, detail="unknown approach")
+
+    async def event_stream():
+        try:
+            async for event, data in impl.astream(
+                search_client=search_client,
+                history=chat.history,
+                overrides=chat.overrides,
+                query_cache=request.app.state.query_cache,
+                search_cache=request.app.state.search_cache,
+                vectors=request.app.state.vector_store,
+            ):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logger.exception("Chat stream failed")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def answerer(state) -> Callable[[Chat], Awaitable[MessageResponse]]:
+    """Answer chats with the app's clients and shared caches, outside of a
+    single request."""
+
+    async def answer(chat: Chat) -> MessageResponse:
+        impl = chat_approaches.get(chat.approach)
+        if not impl:
+            raise ValueError("unknown approach")
+        return await impl.arun(
+            search_client=state.async_cognitive_search,
+            history=chat.history,
+            overrides=chat.overrides,
+            query_cache=state.query_cache,
+            search_cache=state.search_cache,
+            vectors=state.vector_store,
+        )
+
+    return answer
+
+
+@router.post("/batch")
+async def chat_batch(request: Request, concurrency: int = 8) -> StreamingResponse:
+    """Answer a JSONL body of Chat payloads, streaming one JSON line per chat
+    in input order and a latency and throughput summary last."""
+    if not 0 < concurrency <= 64:
+        raise HTTPException(
+            status_code=422, detail="concurrency must be between 1 and 64"
+        )
+    # Read the whole body first; the response listens on the same channel
+    # for disconnects while it streams.
+    body = await request.body()
+    records = run_batch(
+        body.decode("utf-8").splitlines(),
+        answer=answerer(request.app.state),
+        concurrency=concurrency,
+    )
+    return StreamingResponse(
+        (json.dumps(record) + "\n" async for record in records),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.get("/cache")
+async def cache_stats(request: Request):
+    caches = {
+        "query_cache": request.app.state.query_cache,
+        "search_cache": request.app.state.search_cache,
+        "file_list": request.app.state.file_list,
+        "content_cache": request.app.state.content_cache,
+    }
+    return {
+        **{
+            name: cache.stats() if cache is not None else None
+            for name, cache in caches.items()
+        },
+        "coalescing": {
+            name: impl.flight_stats() for name, impl in chat_approaches.items()
+        },
+    }
+
+
 @router.get("/content/{path}")
-async def content(request: Request, path: str, response: Response):
+async def content(request: Request, path: str) -> Response:
     blob_container = request.app.state.blob_container
-    blob = blob_container.get_blob_client(path).download_blob()
-    mime_type = blob.properties["content_settings"]["content_type"]
-    if mime_type == "application/octet-stream":
-        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
-    response.headers["Content-Type"] = mime_type
-    response.headers["Content-Disposition"] = f"inline; filename={path}"
-    return (blob.readall(),)
+    cache = request.app.state.content_cache
+    range_header = request.headers.get("range")
+    if_none_match = request.headers.get("if-none-match")
+
+    cached = cache.open(path) if cache is not None else None
+    if cached is None and range_header is None and if_none_match is None:
+        # The common cold path: one GET, filling the cache as it streams.
+        return await stream_blob(blob_container, cache, path)
+
+    if cached is not None:
+        blob, file = cached
+    else:
+        blob, file = await run_in_threadpool(blob_content, blob_container, path), None
+    if etag_matches(if_none_match, blob.etag):
+        if file is not None:
+            file.close()
+        return Response(status_code=304, headers={"ETag": blob.etag})
+    if file is None and range_header is None:
+        return await stream_blob(blob_container, cache, path)
+    if file is None and cache is not None and blob.size <= cache.max_item_bytes:
+        # Fetch small blobs whole so later ranges of them are served locally.
+        await run_in_threadpool(fill_cache, cache, blob_container, path)
+        if (cached := cache.open(path)) is not None:
+            blob, file = cached
+
+    try:
+        byte_range = parse_range(range_header, blob.size)
+    except RangeNotSatisfiable as e:
+        if file is not None:
+            file.close()
+        return Response(status_code=416, headers={"Content-Range": str(e)})
+    start, end = byte_range or (0, blob.size - 1)
+    length = end - start + 1
+    headers = content_headers(blob, path, length)
+    if byte_range is not None:
+        headers["Content-Range"] = f"bytes {start}-{end}/{blob.size}"
+    if file is not None:
+        body = read_file(file, start, length)
+    else:
+        _, body = await run_in_threadpool(download, blob_container, path, start, length)
+    return StreamingResponse(
+        body, status_code=206 if byte_range else 200, headers=headers
+    )
+
+
+async def stream_blob(
+    blob_container, cache: ContentCache | None, path: str
+) -> StreamingResponse:
+    blob, chunks = await run_in_threadpool(download, blob_container, path)
+    if cache is not None:
+        chunks = cache.fill(blob, chunks)
+    return StreamingResponse(chunks, headers=content_headers(blob, path, blob.size))
+
+
+def content_headers(blob: BlobContent, path: str, length: int) -> dict:
+    return {
+        "Content-Type": blob.content_type,
+        "Content-Disposition": f"inline; filename={path}",
+        "Content-Length": str(length),
+        "Accept-Ranges": "bytes",
+        "ETag": blob.etag,
+    }
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+def fill_cache(cache: ContentCache, blob_container, path: str) -> None:
+    blob, chunks = download(blob_container, path)
+    for _ in cache.fill(blob, chunks):
+        pass
@@ -1,104 +1,113 @@
 import os
-import re
-import io
 import logging
-import time
 
-from pypdf import PdfReader, PdfWriter
-from athena.libs.indexer import CognitiveIndex
-from fastapi import APIRouter, UploadFile, Request
+from functools import partial
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from athena.core.models import ChunkingOptions, FileList, IngestJob
+from athena.libs.ingest import ingest_file, remove_file, spool_upload
+from athena.libs.jobs import QueueFull
+from fastapi import APIRouter, UploadFile, Request, HTTPException
 
 router = APIRouter(tags=["file"], prefix="/file")
 logger = logging.getLogger()
 
 
-def blob_name_from_file_page(filename, page=0):
-    if os.path.splitext(filename)[1].lower() == ".pdf":
-        return os.path.splitext(os.path.basename(filename))[0] + f"-{page}" + ".pdf"
-    else:
-        return os.path.basename(filename)
+def invalidate_search_cache(request: Request, sourcefile: str | None = None):
+    search_cache = request.app.state.search_cache
+    if search_cache is not None:
+        search_cache.invalidate(sourcefile=sourcefile)
 
 
-@router.post("/upload")
-async def upload(request: Request, uploaded_file: UploadFile, category: str = None):
-    blob_container = request.app.state.blob_container
+@router.post("/upload", status_code=202)
+async def upload(
+    request: Request,
+    uploaded_file: UploadFile,
+    category: str = None,
+    max_section_length: int = 1000,
+    sentence_search_limit: int = 100,
+    section_overlap: int = 100,
+):
     try:
-        if uploaded_file.content_type == "application/pdf":
-            reader = PdfReader(uploaded_file.file)
-            pages = reader.pages
-            for i in range(len(pages)):
-                blob_name = blob_name_from_file_page(uploaded_file.filename, i)
-                f = io.BytesIO()
-                writer = PdfWriter()
-                writer.add_page(pages[i])
-                writer.write(f)
-                f.seek(0)
-                blob_container.upload_blob(blob_name, f, overwrite=True)
-        else:
-            blob_name = blob_name_from_file_page(uploaded_file.filename)
-            data = uploaded_file.file.read()
-            blob_container.upload_blob(blob_name, data, overwrite=True)
-    except Exception:
-        raise Exception("Error in uploading to Azure Blob Storage")
-
+        chunking = ChunkingOptions(
+            max_section_length=max_section_length,
+            sentence_search_limit=sentence_search_limit,
+            section_overlap=section_overlap,
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+    path = await run_in_threadpool(
+        spool_upload, uploaded_file.file, request.app.state.upload_spool_dir
+    )
+    ingest = partial(
+        ingest_file,
+        path=path,
+        content_type=uploaded_file.content_type,
+        blob_container=request.app.state.blob_container,
+        formrecognizer=request.app.state.formrecognizer,
+        cognitive_search=request.app.state.cognitive_search,
+        uploader=request.app.state.blob_uploader,
+        indexer=request.app.state.search_indexer,
+        manifest=request.app.state.ingest_manifest,
+        search_cache=request.app.state.search_cache,
+        file_list=request.app.state.file_list,
+        content_cache=request.app.state.content_cache,
+        chunking=chunking,
+        vectors=request.app.state.vector_store,
+    )
     try:
-        uploaded_file.file.seek(0, 0)
-        data = uploaded_file.file.read()
-        CognitiveIndex(
+        job = request.app.state.ingest_queue.submit(
             filename=uploaded_file.filename,
-            file_data=data,
-            formrecognizer=request.app.state.formrecognizer,
-            cognitive_search=request.app.state.cognitive_search,
             category=category,
+            fn=ingest,
+            cleanup=partial(os.remove, path),
         )
-    except Exception:
-        raise Exception("Cognitive indexer error")
+    except QueueFull as e:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail=str(e))
 
-    return {"Uploaded": uploaded_file.filename}
+    return {"Queued": uploaded_file.filename, "job_id": job.id}
 
 
-# TODO: Handle paged blobs being listed separately
-@router.get("/list")
-async def get_files(request: Request):
-    blob_container = request.app.state.blob_container
-    blob_iter = blob_container.list_blob_names()
-    blob_list = []
-    blob = blob_iter.next()
-    while blob:
-        blob_list.append(blob)
-        try:
-            blob = blob_iter.next()
-        except:
-            blob = False
+@router.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str) -> IngestJob:
+    job = request.app.state.ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="unknown job")
+    return job
 
-    return {"files": blob_list}
+
+@router.get("/list")
+async def get_files(
+    request: Request, limit: int = 100, continuation_token: str | None = None
+) -> FileList:
+    if not 0 < limit <= 1000:
+        raise HTTPException(status_code=422, detail="limit must be between 1 and 1000")
+    return await run_in_threadpool(
+        request.app.state.file_list.page,
+        blob_container=request.app.state.blob_container,
+        limit=limit,
+        continuation_token=continuation_token,
+    )
 
 
 @router.post("/remove")
 async def remove(request: Request, filename: str = None):
-    blob_container = request.app.state.blob_container
-    search_client = request.app.state.cognitive_search
-    if filename == None:
-        blobs = blob_container.list_blob_names()
-    else:
-        prefix = os.path.splitext(os.path.basename(filename))[0]
-        blobs = filter(
-            lambda b: re.match(f"{prefix}-\d+\.*", b),
-            blob_container.list_blob_names(
-                name_starts_with=os.path.splitext(os.path.basename(prefix))[0]
-            ),
-        )
-    for blob in blobs:
-        logger.info(f"Removing blob {blob}...")
-        blob_container.delete_blob(blob)
-    while True:
-        filter = (
-            None
-            if filename == None
-            else f"sourcefile eq '{os.path.basename(filename)}'"
+    sourcefile = None if filename == None else os.path.basename(filename)
+    try:
+        removed = await run_in_threadpool(
+            remove_file,
+            sourcefile=sourcefile,
+            blob_container=request.app.state.blob_container,
+            cognitive_search=request.app.state.cognitive_search,
+            uploader=request.app.state.blob_uploader,
+            indexer=request.app.state.search_indexer,
+            manifest=request.app.state.ingest_manifest,
+            vectors=request.app.state.vector_store,
         )
-        r = search_client.search("", filter=filter, top=1000, include_total_count=True)
-        if r.get_count() == 0:
-            break
-        r = search_client.delete_documents(documents=[{"id": d["id"]} for d in r])
-        time.sleep(2)
+    finally:
+        await run_in_threadpool(invalidate_search_cache, request, sourcefile=sourcefile)
+        request.app.state.file_list.invalidate()
+        if request.app.state.content_cache is not None:
+            request.app.state.content_cache.invalidate(sourcefile=sourcefile)
+    return {"Removed": sourcefile, **removed}
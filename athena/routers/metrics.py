@@ -0,0 +1,10 @@
+from fastapi import APIRouter, Response
+
+from athena.libs.metrics import REGISTRY
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def metrics() -> Response:
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
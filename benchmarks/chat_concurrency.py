@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+for key in (
+    "storage_account",
+    "storage_connection_string",
+    "storage_account_key",
+    "storage_container",
+    "search_service",
+    "search_index",
+    "search_keys",
+    "semantic_configuration",
+    "formrecognizer_endpoint",
+    "formrecognizer_key",
+):
+    os.environ.setdefault(key, "benchmark")
+
+from openai.openai_object import OpenAIObject
+
+from athena.core.models import ChatHistory, Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import (
+    FakeAsyncSearchClient,
+    FakeCompletion,
+    FakeOpenAI,
+    FakeSearchClient,
+)
+
+
+class QuestionCompletion(FakeCompletion):
+    """Rewrites each question to itself, so distinct questions also search
+    distinctly rather than sharing one coalesced search."""
+
+    def response(self, prompt: str, **kwargs) -> OpenAIObject:
+        question = prompt.split("Question:")[-1].split("Search query:")[0].strip()
+        return OpenAIObject.construct_from({"choices": [{"text": question}]})
+
+
+async def blocking_handler(impl, search_client, history, overrides):
+    return impl.run(search_client=search_client, history=history, overrides=overrides)
+
+
+async def async_handler(impl, search_client, history, overrides):
+    return await impl.arun(
+        search_client=search_client, history=history, overrides=overrides
+    )
+
+
+async def measure(handler, impl, search_client, requests: int, concurrency: int):
+    overrides = Overrides()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        # Distinct questions, so coalescing does not stand in for async I/O.
+        history = [ChatHistory(user=f"What does the handbook say about policy {i}?")]
+        async with semaphore:
+            await handler(impl, search_client, history, overrides)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {"elapsed_s": round(elapsed, 4), "rps": round(requests / elapsed, 2)}
+
+
+async def main(args) -> dict:
+    openai = FakeOpenAI(latency=args.llm_latency)
+    openai.Completion = QuestionCompletion(latency=args.llm_latency, text="")
+    impl = ReadRetrieveReadApproach("sourcepage", "content", openai_client=openai)
+    before = await measure(
+        blocking_handler,
+        impl,
+        FakeSearchClient(latency=args.search_latency),
+        args.requests,
+        args.concurrency,
+    )
+    after = await measure(
+        async_handler,
+        impl,
+        FakeAsyncSearchClient(latency=args.search_latency),
+        args.requests,
+        args.concurrency,
+    )
+    return {
+        "benchmark": "chat_concurrency",
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "llm_latency_s": args.llm_latency,
+        "search_latency_s": args.search_latency,
+        "sync_run": before,
+        "async_arun": after,
+        "speedup": round(after["rps"] / before["rps"], 2),
+        "coalescing": impl.flight_stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Single worker /chat/ throughput: blocking run vs arun"
+    )
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    json.dump(asyncio.run(main(parser.parse_args())), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,99 @@
+import sys
+import json
+import time
+import random
+import argparse
+
+from athena.core.models import ChunkingOptions
+from athena.libs.indexer import CognitiveIndex
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing"]
+PUNCTUATION = ["", "", "", "", ".", ",", ";", ":", "!", "?", "\n"]
+
+
+def make_document(rng: random.Random, pages: int, page_length: int) -> list[tuple]:
+    page_map = []
+    offset = 0
+    for page_num in range(pages):
+        words = []
+        size = 0
+        while size < page_length:
+            word = rng.choice(WORDS) + rng.choice(PUNCTUATION)
+            words.append(word)
+            size += len(word) + 1
+        if rng.random() < 0.1:
+            words.append("<table><tr><td>cell</td></tr></table>")
+        text = " ".join(words) + " "
+        page_map.append((page_num, offset, text))
+        offset += len(text)
+    return page_map
+
+
+def measure(split_text, page_map: list[tuple], options: ChunkingOptions) -> dict:
+    start = time.perf_counter()
+    sections = sum(1 for _ in split_text(page_map, options))
+    elapsed = time.perf_counter() - start
+    return {
+        "sections": sections,
+        "elapsed_s": round(elapsed, 4),
+        "sections_per_s": round(sections / elapsed, 2),
+    }
+
+
+def main(args) -> dict:
+    rng = random.Random(args.seed)
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    options = ChunkingOptions(
+        max_section_length=args.max_section_length,
+        sentence_search_limit=args.sentence_search_limit,
+        section_overlap=args.section_overlap,
+    )
+    if args.legacy:
+        from tests.test_indexer import legacy_split_text
+
+        def legacy(page_map, options):
+            return legacy_split_text(page_map, **options.dict())
+
+    results = []
+    for pages in args.pages:
+        page_map = make_document(rng, pages, args.page_length)
+        result = {
+            "pages": pages,
+            "chars": sum(len(p[2]) for p in page_map),
+            "split_text": measure(index.split_text, page_map, options),
+        }
+        if args.legacy:
+            result["legacy_split_text"] = measure(legacy, page_map, options)
+            result["speedup"] = round(
+                result["split_text"]["sections_per_s"]
+                / result["legacy_split_text"]["sections_per_s"],
+                2,
+            )
+        results.append(result)
+    return {
+        "benchmark": "chunking",
+        "page_length": args.page_length,
+        "options": options.dict(),
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="CognitiveIndex.split_text throughput on synthetic documents"
+    )
+    parser.add_argument(
+        "--pages", type=int, nargs="+", default=[1000, 2500, 5000, 10000]
+    )
+    parser.add_argument("--page-length", type=int, default=3000)
+    parser.add_argument("--max-section-length", type=int, default=1000)
+    parser.add_argument("--sentence-search-limit", type=int, default=100)
+    parser.add_argument("--section-overlap", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--legacy",
+        action="store_true",
+        help="also time the previous per-character chunker (slow on large documents)",
+    )
+    json.dump(main(parser.parse_args()), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,299 @@
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+
+from functools import partial
+from urllib.parse import urlencode
+
+for key in (
+    "api_key",
+    "storage_account",
+    "storage_connection_string",
+    "storage_account_key",
+    "storage_container",
+    "search_service",
+    "search_index",
+    "search_keys",
+    "semantic_configuration",
+    "formrecognizer_endpoint",
+    "formrecognizer_key",
+):
+    os.environ.setdefault(key, "benchmark")
+
+from fastapi import FastAPI
+from pypdf import PdfWriter
+
+from athena.core.lifespan import azure_resource_connections
+from athena.libs.batch import latency_summary
+from tests.fakes import FakeAzureServices, FakeOpenAI, FakeSearchClient
+from tests.fakes import make_layout
+from athena.libs.indexer import CognitiveIndex
+from athena.routers import chat, file_handler
+
+
+async def call(
+    app: FastAPI,
+    method: str,
+    path: str,
+    params: dict | None = None,
+    body: bytes = b"",
+    content_type: str | None = None,
+) -> tuple[int, bytes]:
+    """One in-process ASGI request, without a server or an HTTP client."""
+    request = [{"type": "http.request", "body": body, "more_body": False}]
+    status = None
+    chunks = []
+
+    async def receive():
+        if request:
+            return request.pop()
+        # The client never disconnects.
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    headers = [(b"content-length", str(len(body)).encode())]
+    if content_type is not None:
+        headers.append((b"content-type", content_type.encode()))
+    await app(
+        {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": urlencode(params or {}).encode(),
+            "headers": headers,
+            "server": ("benchmark", 80),
+            "client": ("benchmark", 1),
+        },
+        receive,
+        send,
+    )
+    return status, b"".join(chunks)
+
+
+def multipart(field: str, filename: str, content_type: str, data: bytes):
+    boundary = "athena-benchmark-boundary"
+    body = (
+        (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        + data
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def make_pdf(pages: int) -> bytes:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    f = io.BytesIO()
+    writer.write(f)
+    return f.getvalue()
+
+
+def create_app(services: FakeAzureServices, openai: FakeOpenAI) -> FastAPI:
+    app = FastAPI(
+        lifespan=partial(azure_resource_connections, connect=services.connect)
+    )
+    app.include_router(file_handler.router)
+    app.include_router(chat.router)
+    for impl in chat.chat_approaches.values():
+        impl.openai = openai
+    return app
+
+
+async def measure_chat(app: FastAPI, requests: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failed = 0
+
+    async def one(i: int):
+        nonlocal failed
+        # Distinct questions, so neither the caches nor coalescing hide work.
+        body = json.dumps(
+            {
+                "history": [{"user": f"What does policy {i} say about leave?"}],
+                "approach": "rrr",
+            }
+        ).encode()
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await call(
+                app, "POST", "/chat/", body=body, content_type="application/json"
+            )
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failed += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "failed": failed,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 4),
+        "rps": round(requests / elapsed, 2),
+        "latency_s": {k: round(v, 4) for k, v in latency_summary(latencies).items()},
+    }
+
+
+async def measure_upload(app: FastAPI, files: int, pages: int) -> dict:
+    pdf = make_pdf(pages)
+    start = time.perf_counter()
+    job_ids = []
+    for i in range(files):
+        body, content_type = multipart(
+            "uploaded_file", f"benchmark-{i}.pdf", "application/pdf", pdf
+        )
+        status, response = await call(
+            app, "POST", "/file/upload", body=body, content_type=content_type
+        )
+        if status != 202:
+            raise RuntimeError(f"upload failed with {status}: {response.decode()}")
+        job_ids.append(json.loads(response)["job_id"])
+
+    jobs = []
+    for job_id in job_ids:
+        while True:
+            _, response = await call(app, "GET", f"/file/jobs/{job_id}")
+            job = json.loads(response)
+            if job["stage"] in ("done", "failed"):
+                break
+            await asyncio.sleep(0.01)
+        jobs.append(job)
+    elapsed = time.perf_counter() - start
+
+    analyzed = sum(job["pages_analyzed"] for job in jobs)
+    stages = {}
+    for job in jobs:
+        for stage, seconds in job["timings"].items():
+            stages[stage] = stages.get(stage, 0.0) + seconds
+    return {
+        "files": files,
+        "pages_per_file": pages,
+        "failed": sum(job["stage"] == "failed" for job in jobs),
+        "sections_indexed": sum(job["sections_indexed"] for job in jobs),
+        "elapsed_s": round(elapsed, 4),
+        "pages_per_s": round(analyzed / elapsed, 2),
+        "mean_stage_s": {k: round(v / len(jobs), 4) for k, v in stages.items()},
+    }
+
+
+def timed(fn, *args, **kwargs):
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, {
+        "cpu_s": round(time.process_time() - cpu, 4),
+        "wall_s": round(time.perf_counter() - wall, 4),
+    }
+
+
+def measure_stages(pages: int, page_length: int, seed: int) -> dict:
+    """CPU time of each ingest stage on a synthetic layout. CPU time covers
+    every thread, so it includes the indexer's workers."""
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    index.section_ids = []
+    layout = make_layout(pages, page_length=page_length, seed=seed)
+    page_map, get_page_map = timed(index.get_page_map, form_result=layout)
+    sections, split_text = timed(lambda: list(index.split_text(page_map)))
+    documents = list(index.create_sections("benchmark.pdf", page_map, None))
+    _, index_sections = timed(
+        index.index_sections, client=FakeSearchClient(sections=[]), sections=documents
+    )
+    return {
+        "pages": pages,
+        "chars": len(layout.content),
+        "tables": len(layout.tables),
+        "sections": len(sections),
+        "get_page_map": get_page_map,
+        "split_text": split_text,
+        "index_sections": index_sections,
+    }
+
+
+async def main(args) -> dict:
+    with tempfile.TemporaryDirectory(prefix="athena-benchmark-") as directory:
+        os.environ.setdefault("upload_spool_dir", directory)
+        os.environ.setdefault("content_cache_dir", os.path.join(directory, "content"))
+        os.environ.setdefault(
+            "ingest_manifest_path", os.path.join(directory, "manifest.sqlite3")
+        )
+        if not args.cache:
+            os.environ.setdefault("query_cache_backend", "none")
+            os.environ.setdefault("search_cache_backend", "none")
+
+        services = FakeAzureServices(
+            blob_latency=args.blob_latency,
+            analyze_latency=args.analyze_latency,
+            analyze_page_latency=args.analyze_page_latency,
+            search_latency=args.search_latency,
+            page_length=args.page_length,
+        )
+        openai = FakeOpenAI(latency=args.llm_latency)
+        app = create_app(services, openai)
+        async with app.router.lifespan_context(app):
+            chat_result = await measure_chat(app, args.requests, args.concurrency)
+            upload_result = await measure_upload(app, args.files, args.pages)
+
+    return {
+        "benchmark": "end_to_end",
+        "latency_s": {
+            "llm": args.llm_latency,
+            "search": args.search_latency,
+            "blob": args.blob_latency,
+            "analyze": args.analyze_latency,
+            "analyze_page": args.analyze_page_latency,
+        },
+        "chat": chat_result,
+        "upload": upload_result,
+        "stages": [
+            measure_stages(pages, args.page_length, args.seed)
+            for pages in args.stage_pages
+        ],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="/chat/ and /file/upload through the app against fake backends"
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=25)
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--page-length", type=int, default=3000)
+    parser.add_argument("--stage-pages", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.02)
+    parser.add_argument("--blob-latency", type=float, default=0.01)
+    parser.add_argument("--analyze-latency", type=float, default=0.5)
+    parser.add_argument("--analyze-page-latency", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="keep the query and search caches on, as configured",
+    )
+    json.dump(asyncio.run(main(parser.parse_args())), sys.stdout, indent=2)
+    print()
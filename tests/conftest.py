@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+# Settings are read when athena modules are imported, so they are set here,
+# before pytest imports any test module.
+for key in (
+    "api_key",
+    "storage_account",
+    "storage_connection_string",
+    "storage_account_key",
+    "storage_container",
+    "search_service",
+    "search_index",
+    "search_keys",
+    "semantic_configuration",
+    "formrecognizer_endpoint",
+    "formrecognizer_key",
+):
+    os.environ.setdefault(key, "test")
+
+os.environ.setdefault("env_state", "dev")
+os.environ.setdefault("cors_origin", "*")
+os.environ.setdefault("logger_file", os.path.join(tempfile.gettempdir(), "athena.log"))
@@ -0,0 +1,316 @@
+import io
+import time
+import zlib
+import random
+import asyncio
+import threading
+
+from types import SimpleNamespace
+
+from pypdf import PdfReader
+from openai.openai_object import OpenAIObject
+from azure.core.exceptions import ResourceNotFoundError
+from azure.search.documents.models import IndexingResult
+
+SAMPLE_SECTIONS = [
+    {
+        "id": f"handbook_pdf-{i}",
+        "content": f"Section {i} of the employee handbook covers policy number {i}.",
+        "category": None,
+        "sourcepage": f"handbook-{i}.pdf",
+        "sourcefile": "handbook.pdf",
+    }
+    for i in range(50)
+]
+
+WORDS = ["policy", "employee", "leave", "benefit", "handbook", "manager", "request"]
+PUNCTUATION = ["", "", "", "", ".", ",", ";", ":", "!", "?", "\n"]
+
+
+class FakeCompletion:
+    def __init__(self, latency: float, text: str, token_latency: float = 0.0):
+        self.latency = latency
+        self.text = text
+        self.token_latency = token_latency
+        self.calls = 0
+
+    def response(self, **kwargs) -> OpenAIObject:
+        return OpenAIObject.construct_from({"choices": [{"text": self.text}]})
+
+    def create(self, **kwargs) -> OpenAIObject:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.response(**kwargs)
+
+    async def acreate(self, **kwargs) -> OpenAIObject:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.response(**kwargs)
+
+
+class FakeChatCompletion(FakeCompletion):
+    def response(self, **kwargs) -> OpenAIObject:
+        return OpenAIObject.construct_from(
+            {"choices": [{"message": {"role": "assistant", "content": self.text}}]}
+        )
+
+    async def acreate(self, stream: bool = False, **kwargs):
+        if stream:
+            self.calls += 1
+            return self.astream()
+        return await super().acreate(**kwargs)
+
+    async def astream(self):
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self.text.split(" ")):
+            await asyncio.sleep(self.token_latency)
+            yield OpenAIObject.construct_from(
+                {"choices": [{"delta": {"content": token if i == 0 else " " + token}}]}
+            )
+
+
+class FakeEmbedding:
+    """Hashed bag-of-words vectors, so texts sharing words are similar."""
+
+    def __init__(self, latency: float = 0.0, dimensions: int = 64):
+        self.latency = latency
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def embedding(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            vector[zlib.crc32(word.strip(".,?!").encode()) % self.dimensions] += 1.0
+        return vector
+
+    def response(self, input: list[str], **kwargs) -> OpenAIObject:
+        self.calls += 1
+        return OpenAIObject.construct_from(
+            {
+                "data": [
+                    {"index": i, "embedding": self.embedding(text)}
+                    for i, text in enumerate(input)
+                ]
+            }
+        )
+
+    def create(self, **kwargs) -> OpenAIObject:
+        time.sleep(self.latency)
+        return self.response(**kwargs)
+
+    async def acreate(self, **kwargs) -> OpenAIObject:
+        await asyncio.sleep(self.latency)
+        return self.response(**kwargs)
+
+
+class FakeOpenAI:
+    def __init__(
+        self,
+        latency: float = 0.0,
+        search_query: str = "employee handbook policy",
+        answer: str = "Policies are described in the handbook [handbook-0.pdf].",
+        token_latency: float = 0.0,
+    ) -> None:
+        self.Completion = FakeCompletion(latency=latency, text=search_query)
+        self.ChatCompletion = FakeChatCompletion(
+            latency=latency, text=answer, token_latency=token_latency
+        )
+        self.Embedding = FakeEmbedding(latency=latency)
+
+
+class FakeSearchClient:
+    def __init__(self, sections: list[dict] | None = None, latency: float = 0.0):
+        self.sections = list(SAMPLE_SECTIONS if sections is None else sections)
+        self.latency = latency
+
+    def query(self, search_text: str, filter: str | None, top: int | None) -> list:
+        terms = set(search_text.lower().split())
+        scored = [
+            (len(terms.intersection(s["content"].lower().split())), i, s)
+            for i, s in enumerate(self.sections)
+        ]
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [dict(s) for _, _, s in scored[: top or 50]]
+
+    def search(self, search_text: str, filter=None, top=None, **kwargs) -> list:
+        time.sleep(self.latency)
+        return self.query(search_text=search_text, filter=filter, top=top)
+
+    def upload_documents(self, documents: list[dict]) -> list[IndexingResult]:
+        time.sleep(self.latency)
+        self.sections.extend(documents)
+        return [
+            IndexingResult(key=doc["id"], succeeded=True, status_code=201)
+            for doc in documents
+        ]
+
+    def delete_documents(self, documents: list[dict]) -> list[IndexingResult]:
+        time.sleep(self.latency)
+        keys = {doc["id"] for doc in documents}
+        self.sections[:] = [s for s in self.sections if s["id"] not in keys]
+        return [
+            IndexingResult(key=key, succeeded=True, status_code=200) for key in keys
+        ]
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAsyncSearchClient(FakeSearchClient):
+    async def search(self, search_text: str, filter=None, top=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self.iterate(self.query(search_text=search_text, filter=filter, top=top))
+
+    @staticmethod
+    async def iterate(docs: list):
+        for doc in docs:
+            yield doc
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeBlobContainer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.blobs = {}
+        self._lock = threading.Lock()
+
+    def upload_blob(self, name, data, overwrite=False):
+        time.sleep(self.latency)
+        data = data if isinstance(data, bytes) else data.read()
+        with self._lock:
+            self.blobs[name] = data
+
+    def delete_blob(self, name):
+        time.sleep(self.latency)
+        with self._lock:
+            if self.blobs.pop(name, None) is None:
+                raise ResourceNotFoundError(name)
+
+    def list_blob_names(self, name_starts_with=None):
+        time.sleep(self.latency)
+        with self._lock:
+            return [n for n in self.blobs if n.startswith(name_starts_with or "")]
+
+    def close(self) -> None:
+        pass
+
+
+def make_table(rng: random.Random, page_number: int, offset: int, length: int):
+    rows = rng.randint(2, 6)
+    columns = rng.randint(2, 5)
+    return SimpleNamespace(
+        row_count=rows,
+        cells=[
+            SimpleNamespace(
+                row_index=row,
+                column_index=column,
+                kind="columnHeader" if row == 0 else "content",
+                column_span=1,
+                row_span=1,
+                content=rng.choice(WORDS),
+            )
+            for row in range(rows)
+            for column in range(columns)
+        ],
+        bounding_regions=[SimpleNamespace(page_number=page_number)],
+        spans=[SimpleNamespace(offset=offset, length=length)],
+    )
+
+
+def make_layout(
+    pages: int, page_length: int = 3000, table_rate: float = 0.2, seed: int = 0
+) -> SimpleNamespace:
+    """A synthetic prebuilt-layout result: pages of random sentences, some
+    with a table over part of their text."""
+    rng = random.Random(seed)
+    parts = []
+    page_spans = []
+    tables = []
+    offset = 0
+    for page_number in range(1, pages + 1):
+        words = []
+        size = 0
+        while size < page_length:
+            word = rng.choice(WORDS) + rng.choice(PUNCTUATION)
+            words.append(word)
+            size += len(word) + 1
+        text = " ".join(words)
+        parts.append(text + "\n")
+        page_spans.append(
+            SimpleNamespace(spans=[SimpleNamespace(offset=offset, length=len(text))])
+        )
+        if rng.random() < table_rate:
+            start = rng.randrange(len(text))
+            tables.append(
+                make_table(
+                    rng, page_number, offset + start, min(400, len(text) - start)
+                )
+            )
+        offset += len(text) + 1
+    return SimpleNamespace(content="".join(parts), pages=page_spans, tables=tables)
+
+
+class FakeFormRecognizer:
+    """Analyzes PDFs into synthetic text, one layout page per PDF page, and
+    anything else into a single page of its own text."""
+
+    def __init__(
+        self, latency: float = 0.0, page_latency: float = 0.0, page_length: int = 3000
+    ):
+        self.latency = latency
+        self.page_latency = page_latency
+        self.page_length = page_length
+        self.calls = 0
+
+    def begin_analyze_document(self, model_id, document):
+        self.calls += 1
+        data = document if isinstance(document, bytes) else document.read()
+        if data.startswith(b"%PDF"):
+            pages = len(PdfReader(io.BytesIO(data)).pages)
+            result = make_layout(
+                pages, page_length=self.page_length, seed=zlib.crc32(data)
+            )
+        else:
+            content = data.decode("utf-8")
+            span = SimpleNamespace(offset=0, length=len(content))
+            result = SimpleNamespace(
+                content=content, pages=[SimpleNamespace(spans=[span])], tables=[]
+            )
+        time.sleep(self.latency + self.page_latency * len(result.pages))
+        return SimpleNamespace(result=lambda: result)
+
+    def close(self) -> None:
+        pass
+
+
+class FakeAzureServices:
+    """Local stand-ins for blob storage, form recognizer and search, set on
+    the app by `azure_resource_connections(app, connect=services.connect)`."""
+
+    def __init__(
+        self,
+        blob_latency: float = 0.0,
+        analyze_latency: float = 0.0,
+        analyze_page_latency: float = 0.0,
+        search_latency: float = 0.0,
+        page_length: int = 3000,
+        sections: list[dict] | None = None,
+    ):
+        self.blob_container = FakeBlobContainer(latency=blob_latency)
+        self.formrecognizer = FakeFormRecognizer(
+            latency=analyze_latency,
+            page_latency=analyze_page_latency,
+            page_length=page_length,
+        )
+        self.cognitive_search = FakeSearchClient(sections, latency=search_latency)
+        self.async_cognitive_search = FakeAsyncSearchClient(latency=search_latency)
+        # Both clients search the same sections, like one index.
+        self.async_cognitive_search.sections = self.cognitive_search.sections
+
+    def connect(self, app) -> None:
+        app.state.blob_container = self.blob_container
+        app.state.formrecognizer = self.formrecognizer
+        app.state.cognitive_search = self.cognitive_search
+        app.state.async_cognitive_search = self.async_cognitive_search
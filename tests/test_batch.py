@@ -0,0 +1,93 @@
+import json
+import asyncio
+
+from types import SimpleNamespace
+from starlette.requests import Request
+
+from athena.core.models import MessageResponse
+from athena.libs.batch import percentile, run_batch
+from tests.fakes import FakeAsyncSearchClient, FakeOpenAI
+from athena.routers.chat import chat_approaches, chat_batch
+
+
+def chat_line(question):
+    return json.dumps({"history": [{"user": question}], "approach": "rrr"})
+
+
+def collect(records):
+    async def main():
+        return [record async for record in records]
+
+    return asyncio.run(main())
+
+
+def test_records_keep_input_order_with_bounded_concurrency():
+    running = 0
+    peak = 0
+
+    async def answer(chat):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        question = chat.history[-1].user
+        # Later questions finish first.
+        await asyncio.sleep(0.01 * (10 - int(question)))
+        running -= 1
+        return MessageResponse(data_points=[], answer=f"answer {question}", thoughts="")
+
+    lines = [chat_line(str(i)) for i in range(10)]
+    lines[3] = "not json"
+    lines.insert(5, "   ")
+    records = collect(run_batch(lines, answer=answer, concurrency=3))
+
+    assert [r.get("line") for r in records[:-1]] == [1, 2, 3, 4, 5, 7, 8, 9, 10, 11]
+    assert records[1]["answer"] == "answer 1" and records[1]["latency"] > 0
+    assert "error" in records[3]
+    assert peak == 3
+    summary = records[-1]["summary"]
+    assert summary["requests"] == 10 and summary["failed"] == 1
+    assert summary["concurrency"] == 3
+    assert summary["latency"]["p50"] <= summary["latency"]["p99"]
+
+
+def test_percentile_is_nearest_rank():
+    values = [float(i) for i in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values[:1], 99) == 1.0
+    assert percentile([], 50) == 0.0
+
+
+def test_batch_endpoint_streams_answers(monkeypatch):
+    openai = FakeOpenAI()
+    monkeypatch.setattr(chat_approaches["rrr"], "openai", openai)
+    state = SimpleNamespace(
+        async_cognitive_search=FakeAsyncSearchClient(),
+        query_cache=None,
+        search_cache=None,
+        vector_store=None,
+    )
+    body = "\n".join([chat_line("policy 1?"), chat_line("policy 2?")]).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/chat/batch",
+            "headers": [],
+            "app": SimpleNamespace(state=state),
+        },
+        receive,
+    )
+
+    async def main():
+        response = await chat_batch(request, concurrency=2)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    records = asyncio.run(main())
+    assert [r.get("line") for r in records] == [1, 2, None]
+    assert records[0]["answer"] == openai.ChatCompletion.text
+    assert records[-1]["summary"]["succeeded"] == 2
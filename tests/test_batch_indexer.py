@@ -0,0 +1,165 @@
+import json
+import time
+import threading
+
+import pytest
+
+from azure.core.exceptions import ServiceResponseError
+from azure.search.documents.models import IndexingResult
+
+from athena.core.models import IngestJob
+from athena.libs.batch_indexer import BatchIndexer
+from athena.libs.indexer import CognitiveIndex
+
+
+class FakeIndexClient:
+    def __init__(self, latency=0.0, failures=None, errors=0):
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.errors = errors
+        self.requests = []
+        self.searches = 0
+        self.documents = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def upload_documents(self, documents):
+        with self._lock:
+            self.requests.append([d["id"] for d in documents])
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            with self._lock:
+                if self.errors:
+                    self.errors -= 1
+                    raise ServiceResponseError("connection reset")
+                results = []
+                for doc in documents:
+                    status = self.failures.get(doc["id"])
+                    if isinstance(status, list):
+                        status = status.pop(0) if status else None
+                    if status:
+                        results.append(
+                            IndexingResult(
+                                key=doc["id"],
+                                succeeded=False,
+                                status_code=status,
+                                error_message="failed",
+                            )
+                        )
+                    else:
+                        self.documents[doc["id"]] = doc
+                        results.append(
+                            IndexingResult(
+                                key=doc["id"], succeeded=True, status_code=201
+                            )
+                        )
+                return results
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def search(self, search_text, filter=None, select=None):
+        self.searches += 1
+        sourcefile = filter.split("'")[1] if filter else None
+        return [
+            {"id": key}
+            for key, doc in self.documents.items()
+            if sourcefile is None or doc["sourcefile"] == sourcefile
+        ]
+
+    def delete_documents(self, documents):
+        with self._lock:
+            self.requests.append([d["id"] for d in documents])
+            for doc in documents:
+                self.documents.pop(doc["id"], None)
+        return [
+            IndexingResult(key=doc["id"], succeeded=True, status_code=200)
+            for doc in documents
+        ]
+
+
+def make_sections(count, sourcefile="manual.pdf", size=10):
+    return [
+        {"id": f"{sourcefile}-{i}", "content": "x" * size, "sourcefile": sourcefile}
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def indexer():
+    indexer = BatchIndexer(max_documents=10, workers=4, retries=2, backoff=0.0)
+    yield indexer
+    indexer.close()
+
+
+def test_batches_respect_document_and_byte_limits():
+    indexer = BatchIndexer(max_documents=5, max_bytes=1000)
+    sections = make_sections(12, size=150)
+    batches = list(indexer.batches(sections))
+    indexer.close()
+
+    assert [s for batch in batches for s in batch] == sections
+    for batch in batches:
+        assert len(batch) <= 5
+        assert sum(len(json.dumps(s)) + 32 for s in batch) <= 1000
+
+
+def test_oversized_section_gets_its_own_batch():
+    indexer = BatchIndexer(max_documents=5, max_bytes=100)
+    batches = list(indexer.batches(make_sections(3, size=500)))
+    indexer.close()
+    assert [len(b) for b in batches] == [1, 1, 1]
+
+
+def test_batches_are_indexed_concurrently(indexer):
+    client = FakeIndexClient(latency=0.02)
+    sections = make_sections(60, "a.pdf") + make_sections(20, "b.pdf")
+    report = indexer.index(client, sections)
+
+    assert len(client.documents) == 80
+    assert report.batches == 8
+    assert client.max_active > 1
+    assert report.files["a.pdf"].indexed == 60
+    assert report.files["b.pdf"].indexed == 20
+    assert report.failed == 0
+
+
+def test_only_failed_keys_are_retried(indexer):
+    client = FakeIndexClient(failures={"manual.pdf-3": [503], "manual.pdf-4": [409]})
+    report = indexer.index(client, make_sections(8))
+
+    assert len(client.documents) == 8
+    assert client.requests[1] == ["manual.pdf-3", "manual.pdf-4"]
+    assert report.retries == 1
+    assert report.failed == 0
+
+
+def test_permanent_failures_are_reported(indexer):
+    client = FakeIndexClient(failures={"manual.pdf-1": 400, "manual.pdf-2": 503})
+    report = indexer.index(client, make_sections(4))
+
+    assert len(client.requests) == 3
+    assert report.files["manual.pdf"].indexed == 2
+    assert report.files["manual.pdf"].failed == 2
+    assert set(report.files["manual.pdf"].errors) == {"manual.pdf-1", "manual.pdf-2"}
+
+
+def test_request_errors_retry_the_batch(indexer):
+    client = FakeIndexClient(errors=1)
+    report = indexer.index(client, make_sections(4))
+    assert len(client.documents) == 4
+    assert report.retries == 1
+
+
+def test_cognitive_index_raises_on_failed_sections(indexer):
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    index.job = IngestJob(id="job", filename="manual.pdf")
+    client = FakeIndexClient(failures={"manual.pdf-1": 400})
+    with pytest.raises(Exception, match="1 sections failed to index"):
+        index.index_sections(client, make_sections(4), indexer)
+    assert index.job.sections_indexed == 3
+    assert index.job.sections_failed == 1
+    assert index.job.indexing.files["manual.pdf"].failed == 1
@@ -0,0 +1,142 @@
+import time
+import asyncio
+
+import pytest
+
+from athena.libs.cache import DiskCache, SearchResultCache, build_cache
+
+DOCS = [{"sourcefile": "a.pdf", "content": "Policy 3 covers leave."}]
+
+
+@pytest.fixture(params=["memory", "disk"])
+def make_cache(request, tmp_path):
+    def make(maxsize=3, ttl=None):
+        return build_cache(
+            request.param, maxsize=maxsize, ttl=ttl, path=tmp_path / "cache.db"
+        )
+
+    return make
+
+
+def test_evicts_least_recently_used(make_cache):
+    cache = make_cache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_expired_entries_are_misses(make_cache):
+    cache = make_cache(ttl=0.01)
+    cache.set("a", {"value": 1})
+    assert cache.get("a") == {"value": 1}
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_counts_hits_and_misses(make_cache):
+    cache = make_cache()
+    cache.set("a", [1, 2])
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert stats["size"] == 1 and stats["maxsize"] == 3
+
+
+def test_async_access_matches_sync(make_cache):
+    cache = make_cache()
+
+    async def main():
+        await cache.aset("a", "query")
+        return await cache.aget("a"), await cache.aget("b")
+
+    assert asyncio.run(main()) == ("query", None)
+    assert isinstance(cache, DiskCache) == cache.blocking
+
+
+def test_disk_cache_persists_entries_and_recency(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = DiskCache(path, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.close()
+
+    cache = DiskCache(path, maxsize=2)
+    assert len(cache) == 2
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+
+def test_disk_cache_hits_are_reads_until_an_eviction(tmp_path):
+    cache = DiskCache(tmp_path / "cache.db", maxsize=2)
+    statements = []
+    cache._db.set_trace_callback(statements.append)
+    cache.set("a", 1)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    for _ in range(3):
+        cache.get("a")
+
+    assert not any(s.startswith(("UPDATE", "DELETE")) for s in statements)
+    cache.set("c", 3)
+    assert sum(s.startswith("UPDATE") for s in statements) == 1
+    assert cache.get("b") is None and len(cache) == 2
+
+
+def test_full_invalidation_moves_to_a_new_generation(make_cache):
+    results = SearchResultCache(make_cache())
+    key = results.key("policy", 3)
+    results.set(key, DOCS, {"a.pdf"})
+    generation = results.generation
+    results.invalidate()
+
+    assert results.generation == generation + 1
+    assert results.key("policy", 3)[1] != key[1]
+    assert results.get(key) is None
+    assert results.stats()["invalidations"] == 1 and results.stats()["size"] == 0
+
+
+def test_sourcefile_invalidation_drops_only_results_citing_it(make_cache):
+    results = SearchResultCache(make_cache())
+    both, other = results.key("both"), results.key("other")
+    results.set(both, DOCS, {"a.pdf", "b.pdf"})
+    results.set(other, DOCS, {"b.pdf"})
+    results.invalidate(sourcefile="a.pdf")
+
+    assert results.get(both) is None
+    assert results.get(other) == DOCS
+    assert results._by_source == {"b.pdf": {other[1]}}
+
+
+def test_results_of_a_search_that_raced_an_invalidation_are_dropped(make_cache):
+    results = SearchResultCache(make_cache())
+    key = results.key("policy")
+    results.invalidate(sourcefile="unrelated.pdf")
+    results.set(key, DOCS, {"a.pdf"})
+
+    assert results.get(results.key("policy")) is None
+    assert not results._by_source
+
+
+def test_evicted_results_leave_the_sourcefile_index(make_cache):
+    results = SearchResultCache(make_cache(maxsize=2, ttl=0.05))
+    keys = [results.key(i) for i in range(3)]
+    for key in keys:
+        results.set(key, DOCS, {"a.pdf"})
+
+    assert results._by_source == {"a.pdf": {keys[1][1], keys[2][1]}}
+    time.sleep(0.06)
+    assert results.get(keys[1]) is None
+    assert results._by_source == {"a.pdf": {keys[2][1]}}
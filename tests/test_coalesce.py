@@ -0,0 +1,88 @@
+import asyncio
+
+from athena.core.models import ChatHistory, Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from athena.libs.coalesce import SingleFlight
+from tests.fakes import FakeAsyncSearchClient, FakeOpenAI
+
+
+def test_concurrent_calls_share_one_execution():
+    flights = SingleFlight()
+    calls = []
+
+    async def work(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        results = await asyncio.gather(
+            *(flights.do("a", lambda: work(1)) for _ in range(5)),
+            flights.do("b", lambda: work(2)),
+        )
+        # Finished calls are forgotten rather than cached.
+        await flights.do("a", lambda: work(3))
+        return results
+
+    assert asyncio.run(main()) == [1, 1, 1, 1, 1, 2]
+    assert calls == [1, 2, 3]
+    assert flights.stats() == {
+        "calls": 3,
+        "coalesced": 4,
+        "in_flight": 0,
+        "coalesce_rate": 4 / 7,
+    }
+
+
+def test_errors_are_shared_and_cancelling_one_caller_keeps_the_call():
+    flights = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream")
+
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        results = await asyncio.gather(
+            flights.do("x", fail), flights.do("x", fail), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        leader = asyncio.ensure_future(flights.do("y", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flights.do("y", slow))
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == "done"
+
+
+def test_identical_chats_make_one_upstream_call():
+    openai = FakeOpenAI(latency=0.02)
+    rrr = ReadRetrieveReadApproach("sourcepage", "content", openai_client=openai)
+    client = FakeAsyncSearchClient(latency=0.02)
+    history = [ChatHistory(user="What is the  travel policy?")]
+
+    async def ask(history, overrides=None):
+        return await rrr.arun(
+            search_client=client, history=history, overrides=overrides
+        )
+
+    async def main():
+        return await asyncio.gather(
+            *(ask(history) for _ in range(10)),
+            ask([ChatHistory(user="what is the travel policy?")]),
+            ask(history, Overrides(top=5)),
+        )
+
+    responses = asyncio.run(main())
+    assert all(response is responses[0] for response in responses[:11])
+    assert openai.ChatCompletion.calls == 2
+    # Both chats rewrite the question identically.
+    assert openai.Completion.calls == 1
+    stats = rrr.flight_stats()
+    assert stats["chat"]["calls"] == 2 and stats["chat"]["coalesced"] == 10
+    assert stats["query"]["coalesced"] == 1
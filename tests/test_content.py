@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+from types import SimpleNamespace
+from starlette.requests import Request
+
+from athena.core.models import BlobContent
+from athena.libs.content import ContentCache, RangeNotSatisfiable, parse_range
+from athena.routers.chat import content
+
+
+class FakeDownloader:
+    def __init__(self, blob, offset, length):
+        self.properties = SimpleNamespace(
+            etag=blob.etag,
+            size=blob.size if offset is None else length,
+            content_settings=SimpleNamespace(content_type="application/pdf"),
+        )
+        start = offset or 0
+        end = len(blob.data) if length is None else start + length
+        self.data = blob.data[start:end]
+
+    def chunks(self):
+        for i in range(0, len(self.data), 4):
+            yield self.data[i : i + 4]
+
+
+class FakeBlob:
+    def __init__(self, container, name):
+        self.container = container
+        self.data = container.blobs[name]
+        self.etag = f'"etag-{len(self.data)}"'
+        self.size = len(self.data)
+
+    def get_blob_properties(self):
+        self.container.heads += 1
+        return SimpleNamespace(
+            etag=self.etag,
+            size=self.size,
+            content_settings=SimpleNamespace(content_type="application/octet-stream"),
+        )
+
+    def download_blob(self, offset=None, length=None):
+        self.container.downloads.append((offset, length))
+        return FakeDownloader(self, offset, length)
+
+
+class FakeContainer:
+    def __init__(self, blobs):
+        self.blobs = blobs
+        self.heads = 0
+        self.downloads = []
+
+    def get_blob_client(self, name):
+        return FakeBlob(self, name)
+
+
+def get(state, path, **headers):
+    app = SimpleNamespace(state=state)
+    request = Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": f"/chat/content/{path}",
+            "headers": [
+                (k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()
+            ],
+            "app": app,
+        }
+    )
+
+    async def fetch():
+        response = await content(request, path)
+        body = b""
+        if hasattr(response, "body_iterator"):
+            async for chunk in response.body_iterator:
+                body += chunk
+        return response, body
+
+    return asyncio.run(fetch())
+
+
+@pytest.fixture
+def state(tmp_path):
+    container = FakeContainer(
+        {"manual-0.pdf": b"0123456789" * 3, "big.pdf": b"x" * 100}
+    )
+    cache = ContentCache(tmp_path / "content", max_bytes=64, max_item_bytes=40)
+    return SimpleNamespace(blob_container=container, content_cache=cache)
+
+
+def test_parse_range():
+    assert parse_range(None, 10) is None
+    assert parse_range("bytes=2-5", 10) == (2, 5)
+    assert parse_range("bytes=2-", 10) == (2, 9)
+    assert parse_range("bytes=-3", 10) == (7, 9)
+    assert parse_range("bytes=5-100", 10) == (5, 9)
+    assert parse_range("bytes=0-1,4-5", 10) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range("bytes=10-", 10)
+
+
+def test_second_request_is_served_from_disk(state):
+    response, body = get(state, "manual-0.pdf")
+    assert body == b"0123456789" * 3
+    assert response.headers["etag"] == '"etag-30"'
+    assert response.headers["content-type"] == "application/pdf"
+
+    response, body = get(state, "manual-0.pdf")
+    assert body == b"0123456789" * 3
+    assert len(state.blob_container.downloads) == 1
+    assert state.content_cache.hits == 1
+
+
+def test_if_none_match_returns_not_modified(state):
+    get(state, "manual-0.pdf")
+    response, body = get(state, "manual-0.pdf", if_none_match='"etag-30"')
+    assert response.status_code == 304
+    assert body == b""
+    assert state.blob_container.heads == 0
+
+
+def test_range_of_small_blob_fills_the_cache(state):
+    response, body = get(state, "manual-0.pdf", range="bytes=5-14")
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 5-14/30"
+    assert body == b"5678901234"
+
+    response, body = get(state, "manual-0.pdf", range="bytes=-2")
+    assert body == b"89"
+    assert state.blob_container.downloads == [(None, None)]
+
+
+def test_range_of_large_blob_is_downloaded_directly(state):
+    response, body = get(state, "big.pdf", range="bytes=10-19")
+    assert response.status_code == 206
+    assert body == b"x" * 10
+    assert state.blob_container.downloads == [(10, 10)]
+    assert state.content_cache.stats()["size"] == 0
+
+
+def test_unsatisfiable_range(state):
+    response, _ = get(state, "manual-0.pdf", range="bytes=50-")
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */30"
+
+
+def test_cache_evicts_least_recently_used_and_reloads(tmp_path):
+    cache = ContentCache(tmp_path, max_bytes=25, max_item_bytes=25)
+
+    def add(name, size):
+        blob = BlobContent(name=name, etag="e", size=size, content_type="x")
+        list(cache.fill(blob, iter([b"a" * size])))
+
+    add("a-0.pdf", 10)
+    add("a-1.pdf", 10)
+    cache.open("a-0.pdf")[1].close()
+    add("b.txt", 10)
+    assert cache.open("a-1.pdf") is None
+    assert cache.stats()["bytes"] == 20
+
+    reloaded = ContentCache(tmp_path, max_bytes=25, max_item_bytes=25)
+    assert reloaded.stats()["size"] == 2
+    reloaded.invalidate(sourcefile="a.pdf")
+    assert reloaded.open("a-0.pdf") is None
+    assert reloaded.open("b.txt") is not None
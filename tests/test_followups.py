@@ -0,0 +1,107 @@
+import time
+import asyncio
+
+from athena.core.models import ChatHistory, Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import FakeAsyncSearchClient, FakeChatCompletion, FakeOpenAI
+
+ANSWER = "Leave is covered by policy 3 [handbook-3.pdf]."
+FOLLOWUPS = "<<How do I request leave?>> <<Is leave paid?>> <<Is leave paid?>>"
+
+
+class RecordingChatCompletion(FakeChatCompletion):
+    def __init__(self, latency):
+        super().__init__(latency=latency, text=ANSWER)
+        self.requests = []
+
+    def response(self, messages, **kwargs):
+        self.text = FOLLOWUPS if kwargs["max_tokens"] == 64 else ANSWER
+        return super().response(**kwargs)
+
+    async def acreate(self, stream=False, **kwargs):
+        self.requests.append((kwargs, time.perf_counter()))
+        if stream and kwargs["max_tokens"] != 64:
+            self.calls += 1
+            self.text = ANSWER
+            return self.astream()
+        return await super().acreate(**kwargs)
+
+
+def approach(latency=0.0):
+    openai = FakeOpenAI(latency=latency)
+    openai.ChatCompletion = RecordingChatCompletion(latency=latency)
+    return ReadRetrieveReadApproach("sourcepage", "content", openai_client=openai)
+
+
+def ask(rrr, mode):
+    return asyncio.run(
+        rrr.arun(
+            search_client=FakeAsyncSearchClient(),
+            history=[ChatHistory(user="What is the leave policy?")],
+            overrides=Overrides(followup_mode=mode),
+        )
+    )
+
+
+def system_prompt(request):
+    return request[0]["messages"][0]["content"]
+
+
+def test_separate_followups_run_alongside_the_answer():
+    rrr = approach(latency=0.05)
+    response = ask(rrr, "separate")
+
+    assert response.answer == ANSWER
+    assert response.followup_questions == ["How do I request leave?", "Is leave paid?"]
+    main, followups = sorted(
+        rrr.openai.ChatCompletion.requests, key=lambda r: r[0]["max_tokens"] == 64
+    )
+    assert "follow-up questions" not in system_prompt(main)
+    assert "follow-up questions" in system_prompt(followups)
+    assert abs(main[1] - followups[1]) < 0.05
+
+
+def test_inline_followups_stay_in_the_main_prompt():
+    rrr = approach()
+    response = ask(rrr, "inline")
+    (main,) = rrr.openai.ChatCompletion.requests
+    assert "follow-up questions" in system_prompt(main)
+    assert response.followup_questions == []
+
+
+def test_stream_sends_followups_as_their_own_event():
+    rrr = approach()
+
+    async def main():
+        return [
+            event
+            async for event in rrr.astream(
+                search_client=FakeAsyncSearchClient(),
+                history=[ChatHistory(user="What is the leave policy?")],
+                overrides=Overrides(followup_mode="separate"),
+            )
+        ]
+
+    events = asyncio.run(main())
+    names = [name for name, _ in events]
+    assert names[-2:] == ["followup_questions", "done"]
+    assert events[-2][1]["followup_questions"] == [
+        "How do I request leave?",
+        "Is leave paid?",
+    ]
+    answer = "".join(data["content"] for name, data in events if name == "answer")
+    assert answer == ANSWER
+
+
+def test_failed_followups_do_not_fail_the_answer():
+    rrr = approach()
+    answer = rrr.openai.ChatCompletion.acreate
+
+    async def acreate(**kwargs):
+        if kwargs["max_tokens"] == 64:
+            raise RuntimeError("rate limited")
+        return await answer(**kwargs)
+
+    rrr.openai.ChatCompletion.acreate = acreate
+    response = ask(rrr, "separate")
+    assert response.answer == ANSWER and response.followup_questions == []
@@ -0,0 +1,298 @@
+import html
+import random
+import itertools
+
+from types import SimpleNamespace
+
+from athena.core.models import ChunkingOptions
+from athena.libs.indexer import CognitiveIndex
+
+
+def legacy_table_to_html(table) -> str:
+    table_html = "<table>"
+    rows = [
+        sorted(
+            [cell for cell in table.cells if cell.row_index == i],
+            key=lambda cell: cell.column_index,
+        )
+        for i in range(table.row_count)
+    ]
+    for row_cells in rows:
+        table_html += "<tr>"
+        for cell in row_cells:
+            tag = (
+                "th"
+                if (cell.kind == "columnHeader" or cell.kind == "rowHeader")
+                else "td"
+            )
+            cell_spans = ""
+            if cell.column_span > 1:
+                cell_spans += f" colSpan={cell.column_span}"
+            if cell.row_span > 1:
+                cell_spans += f" rowSpan={cell.row_span}"
+            table_html += f"<{tag}{cell_spans}>{html.escape(cell.content)}</{tag}>"
+        table_html += "</tr>"
+    table_html += "</table>"
+    return table_html
+
+
+def legacy_get_page_map(form_result) -> list[tuple[str]]:
+    offset = 0
+    page_map = []
+    for page_num, page in enumerate(form_result.pages):
+        tables_on_page = [
+            table
+            for table in form_result.tables
+            if table.bounding_regions[0].page_number == page_num + 1
+        ]
+
+        page_offset = page.spans[0].offset
+        page_length = page.spans[0].length
+        table_chars = [-1] * page_length
+        for table_id, table in enumerate(tables_on_page):
+            for span in table.spans:
+                for i in range(span.length):
+                    idx = span.offset - page_offset + i
+                    if idx >= 0 and idx < page_length:
+                        table_chars[idx] = table_id
+
+        page_text = ""
+        added_tables = set()
+        for idx, table_id in enumerate(table_chars):
+            if table_id == -1:
+                page_text += form_result.content[page_offset + idx]
+            elif not table_id in added_tables:
+                page_text += legacy_table_to_html(tables_on_page[table_id])
+                added_tables.add(table_id)
+
+        page_text += " "
+        page_map.append((page_num, offset, page_text))
+        offset += len(page_text)
+
+    return page_map
+
+
+def legacy_split_text(
+    page_map, max_section_length=1000, sentence_search_limit=100, section_overlap=100
+):
+    SENTENCE_ENDINGS = [".", "!", "?"]
+    WORDS_BREAKS = [",", ";", ":", " ", "(", ")", "[", "]", "{", "}", "\t", "\n"]
+
+    def find_page(offset):
+        l = len(page_map)
+        for i in range(l - 1):
+            if offset >= page_map[i][1] and offset < page_map[i + 1][1]:
+                return i
+        return l - 1
+
+    all_text = "".join(p[2] for p in page_map)
+    length = len(all_text)
+    start = 0
+    end = length
+    while start + section_overlap < length:
+        last_word = -1
+        end = start + max_section_length
+
+        if end > length:
+            end = length
+        else:
+            while (
+                end < length
+                and (end - start - max_section_length) < sentence_search_limit
+                and all_text[end] not in SENTENCE_ENDINGS
+            ):
+                if all_text[end] in WORDS_BREAKS:
+                    last_word = end
+                end += 1
+            if end < length and all_text[end] not in SENTENCE_ENDINGS and last_word > 0:
+                end = last_word
+        if end < length:
+            end += 1
+
+        last_word = -1
+        while (
+            start > 0
+            and start > end - max_section_length - 2 * sentence_search_limit
+            and all_text[start] not in SENTENCE_ENDINGS
+        ):
+            if all_text[start] in WORDS_BREAKS:
+                last_word = start
+            start -= 1
+        if all_text[start] not in SENTENCE_ENDINGS and last_word > 0:
+            start = last_word
+        if start > 0:
+            start += 1
+
+        section_text = all_text[start:end]
+        yield (section_text, find_page(start))
+
+        last_table_start = section_text.rfind("<table")
+        if (
+            last_table_start > 2 * sentence_search_limit
+            and last_table_start > section_text.rfind("</table")
+        ):
+            start = min(end - section_overlap, start + last_table_start)
+        else:
+            start = end - section_overlap
+
+    if start + section_overlap < end:
+        yield (all_text[start:end], find_page(start))
+
+
+def make_page_map(rng: random.Random) -> list[tuple]:
+    words = ["lorem", "ipsum", "dolor", "sit", "amet", "<table><tr>", "</table>"]
+    punctuation = ["", "", "", ".", "!", "?", ",", ";", ":", "(", ")", "\n", "\t"]
+    page_map = []
+    offset = 0
+    for page_num in range(rng.randint(0, 8)):
+        text = (
+            " ".join(
+                rng.choice(words) + rng.choice(punctuation)
+                for _ in range(rng.randint(0, 400))
+            )
+            + " "
+        )
+        page_map.append((page_num, offset, text))
+        offset += len(text)
+    return page_map
+
+
+def make_table(rng: random.Random, page_number: int, spans: list[tuple[int, int]]):
+    row_count = rng.randint(0, 4)
+    column_count = rng.randint(1, 4)
+    cells = [
+        SimpleNamespace(
+            row_index=row,
+            column_index=column,
+            kind=rng.choice(["content", "columnHeader", "rowHeader"]),
+            column_span=rng.choice([1, 1, 2]),
+            row_span=rng.choice([1, 1, 3]),
+            content=rng.choice(["a", "b & c", "<d>", '"e"', ""]),
+        )
+        for row in range(row_count + 1)
+        for column in range(column_count)
+    ]
+    rng.shuffle(cells)
+    return SimpleNamespace(
+        row_count=row_count,
+        cells=cells,
+        bounding_regions=[SimpleNamespace(page_number=page_number)],
+        spans=[SimpleNamespace(offset=o, length=l) for o, l in spans],
+    )
+
+
+def make_form_result(seed: int):
+    rng = random.Random(seed)
+    pages = []
+    tables = []
+    content = ""
+    for page_number in range(1, rng.randint(1, 6) + 1):
+        page_length = rng.randint(0, 300)
+        page_offset = len(content)
+        content += "".join(rng.choice("abc .!?\n,") for _ in range(page_length))
+        pages.append(
+            SimpleNamespace(
+                spans=[SimpleNamespace(offset=page_offset, length=page_length)]
+            )
+        )
+        for _ in range(rng.randint(0, 4)):
+            spans = [
+                (page_offset + rng.randint(-20, page_length), rng.randint(0, 80))
+                for _ in range(rng.randint(1, 3))
+            ]
+            tables.append(make_table(rng, rng.choice([page_number] * 3 + [7]), spans))
+    return SimpleNamespace(pages=pages, tables=tables, content=content + "tail")
+
+
+def test_get_page_map_matches_legacy_implementation():
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    for seed in range(500):
+        form_result = make_form_result(seed)
+        assert index.get_page_map(form_result) == legacy_get_page_map(form_result)
+
+
+def test_get_page_map_replaces_table_spans_with_html():
+    content = "Intro text. A B C D. Outro."
+    table = SimpleNamespace(
+        row_count=1,
+        cells=[
+            SimpleNamespace(
+                row_index=0,
+                column_index=1,
+                kind="content",
+                column_span=1,
+                row_span=1,
+                content="B",
+            ),
+            SimpleNamespace(
+                row_index=0,
+                column_index=0,
+                kind="columnHeader",
+                column_span=2,
+                row_span=1,
+                content="A",
+            ),
+        ],
+        bounding_regions=[SimpleNamespace(page_number=1)],
+        spans=[SimpleNamespace(offset=12, length=7)],
+    )
+    form_result = SimpleNamespace(
+        pages=[SimpleNamespace(spans=[SimpleNamespace(offset=0, length=len(content))])],
+        tables=[table],
+        content=content,
+    )
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    assert index.get_page_map(form_result) == [
+        (
+            0,
+            0,
+            "Intro text. <table><tr><th colSpan=2>A</th><td>B</td></tr></table>. Outro. ",
+        )
+    ]
+
+
+def test_table_to_html_matches_legacy_implementation():
+    rng = random.Random(0)
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    for _ in range(200):
+        table = make_table(rng, 1, [])
+        assert index.table_to_html(table) == legacy_table_to_html(table)
+
+
+def test_split_text_matches_legacy_implementation():
+    rng = random.Random(0)
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    for _ in range(300):
+        page_map = make_page_map(rng)
+        assert list(index.split_text(page_map)) == list(legacy_split_text(page_map))
+
+
+def test_split_text_matches_legacy_implementation_with_options():
+    rng = random.Random(1)
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    for _ in range(300):
+        page_map = make_page_map(rng)
+        max_section_length = rng.randint(20, 600)
+        options = ChunkingOptions(
+            max_section_length=max_section_length,
+            sentence_search_limit=rng.randint(0, 120),
+            section_overlap=rng.randint(0, max_section_length - 1),
+        )
+        sections = list(index.split_text(page_map, options))
+        # The legacy chunker never terminates on some inputs; it repeats a
+        # section it already produced where split_text stops.
+        legacy = list(
+            itertools.islice(
+                legacy_split_text(page_map, **options.dict()), len(sections) + 1
+            )
+        )
+        assert legacy[: len(sections)] == sections
+        assert len(legacy) == len(sections) or legacy[-1] in sections
+
+
+def test_split_text_stops_on_unclosed_trailing_table():
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    text = "lorem ipsum. " * 100 + "dolor " * 40 + "<table><tr><td>" + "x " * 50
+    sections = list(index.split_text([(0, 0, text)]))
+    assert len(sections) == len(set(sections))
+    assert sections[-1][0].endswith(text[-20:])
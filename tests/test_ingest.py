@@ -0,0 +1,305 @@
+import io
+import time
+import threading
+
+import pytest
+
+from types import SimpleNamespace
+
+from pypdf import PdfReader, PdfWriter
+from azure.core.exceptions import ResourceNotFoundError, ServiceRequestError
+
+from athena.core.models import IngestJob
+from athena.libs.batch_indexer import BatchIndexer
+from athena.libs.ingest import (
+    BlobUploader,
+    ingest_file,
+    remove_file,
+    spool_upload,
+    upload_blobs,
+)
+from athena.libs.manifest import IngestManifest
+from tests.test_batch_indexer import FakeIndexClient, make_sections
+
+
+class FakeContainer:
+    def __init__(self, latency: float = 0.0, failures: dict[str, int] | None = None):
+        self.latency = latency
+        self.failures = dict(failures or {})
+        self.blobs = {}
+        self.attempts = 0
+        self.deletes = 0
+        self.listings = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def upload_blob(self, name, data, overwrite=False):
+        with self._lock:
+            self.attempts += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            with self._lock:
+                if self.failures.get(name, 0) > 0:
+                    self.failures[name] -= 1
+                    raise ServiceRequestError("connection reset")
+                self.blobs[name] = data if isinstance(data, bytes) else data.read()
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def delete_blob(self, name):
+        with self._lock:
+            self.deletes += 1
+            if name not in self.blobs:
+                raise ResourceNotFoundError(name)
+            del self.blobs[name]
+
+    def list_blob_names(self, name_starts_with=None):
+        self.listings += 1
+        return [n for n in self.blobs if n.startswith(name_starts_with or "")]
+
+
+def make_pdf(pages: int) -> io.BytesIO:
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=72, height=72)
+    f = io.BytesIO()
+    writer.write(f)
+    f.seek(0)
+    return f
+
+
+@pytest.fixture
+def uploader():
+    uploader = BlobUploader(workers=4, window=4, retries=2, backoff=0.0)
+    yield uploader
+    uploader.close()
+
+
+def test_pdf_pages_upload_concurrently_within_window(uploader):
+    container = FakeContainer(latency=0.02)
+    job = IngestJob(id="job", filename="manual.pdf")
+    upload_blobs(job, make_pdf(20), "application/pdf", container, uploader)
+
+    assert job.pages_total == 20
+    assert job.pages_uploaded == 20
+    assert sorted(container.blobs) == sorted(f"manual-{i}.pdf" for i in range(20))
+    assert 1 < container.max_active <= 4
+    for data in container.blobs.values():
+        assert len(PdfReader(io.BytesIO(data)).pages) == 1
+
+
+def test_non_pdf_uploads_single_blob(uploader):
+    container = FakeContainer()
+    job = IngestJob(id="job", filename="notes.txt")
+    upload_blobs(job, io.BytesIO(b"hello"), "text/plain", container, uploader)
+
+    assert container.blobs == {"notes.txt": b"hello"}
+    assert job.pages_uploaded == 1
+
+
+def test_failed_uploads_are_retried(uploader):
+    container = FakeContainer(failures={"manual-1.pdf": 2})
+    job = IngestJob(id="job", filename="manual.pdf")
+    upload_blobs(job, make_pdf(3), "application/pdf", container, uploader)
+
+    assert len(container.blobs) == 3
+    assert container.attempts == 5
+
+
+def test_upload_gives_up_after_retries(uploader):
+    container = FakeContainer(failures={"manual-1.pdf": 3})
+    job = IngestJob(id="job", filename="manual.pdf")
+    with pytest.raises(ServiceRequestError):
+        upload_blobs(job, make_pdf(3), "application/pdf", container, uploader)
+    assert "manual-1.pdf" not in container.blobs
+
+
+def test_unchanged_pages_are_skipped(uploader):
+    container = FakeContainer()
+    job = IngestJob(id="job", filename="manual.pdf")
+    pages = upload_blobs(job, make_pdf(4), "application/pdf", container, uploader)
+
+    container.blobs.clear()
+    job = IngestJob(id="job", filename="manual.pdf")
+    upload_blobs(job, make_pdf(3), "application/pdf", container, uploader, pages)
+
+    assert job.pages_skipped == 3
+    assert job.pages_uploaded == 0
+    assert container.blobs == {}
+
+
+def test_retried_stream_uploads_restart_from_the_beginning(uploader):
+    class PartialReadContainer(FakeContainer):
+        def upload_blob(self, name, data, overwrite=False):
+            if self.attempts == 0:
+                self.attempts += 1
+                data.read(3)
+                raise ServiceRequestError("connection reset")
+            super().upload_blob(name, data, overwrite)
+
+    container = PartialReadContainer()
+    job = IngestJob(id="job", filename="notes.txt")
+    upload_blobs(job, io.BytesIO(b"hello"), "text/plain", container, uploader)
+    assert container.blobs == {"notes.txt": b"hello"}
+
+
+def test_spool_upload_copies_to_a_temporary_file(tmp_path):
+    path = spool_upload(io.BytesIO(b"x" * 3_000_000), directory=str(tmp_path))
+    with open(path, "rb") as f:
+        assert f.read() == b"x" * 3_000_000
+
+
+class FakeFormRecognizer:
+    def __init__(self):
+        self.calls = 0
+
+    def begin_analyze_document(self, model_id, document):
+        self.calls += 1
+        content = document.read().decode("utf-8")
+        page = SimpleNamespace(spans=[SimpleNamespace(offset=0, length=len(content))])
+        result = SimpleNamespace(content=content, pages=[page], tables=[])
+        return SimpleNamespace(result=lambda: result)
+
+
+class Backends:
+    def __init__(self, uploader, tmp_path):
+        self.tmp_path = tmp_path
+        self.container = FakeContainer()
+        self.formrecognizer = FakeFormRecognizer()
+        self.search = FakeIndexClient()
+        self.uploader = uploader
+        self.indexer = BatchIndexer(max_documents=100, backoff=0.0)
+        self.manifest = IngestManifest(tmp_path / "manifest.sqlite3")
+
+    def ingest(self, text, filename="handbook.txt"):
+        path = self.tmp_path / "upload"
+        path.write_text(text)
+        job = IngestJob(id="job", filename=filename)
+        self.search.requests.clear()
+        ingest_file(
+            job=job,
+            path=str(path),
+            content_type="text/plain",
+            blob_container=self.container,
+            formrecognizer=self.formrecognizer,
+            cognitive_search=self.search,
+            uploader=self.uploader,
+            indexer=self.indexer,
+            manifest=self.manifest,
+        )
+        assert not path.exists()
+        return job
+
+    def remove(self, sourcefile, manifest=True):
+        return remove_file(
+            sourcefile=sourcefile,
+            blob_container=self.container,
+            cognitive_search=self.search,
+            uploader=self.uploader,
+            indexer=self.indexer,
+            manifest=self.manifest if manifest else None,
+        )
+
+    def close(self):
+        self.indexer.close()
+        self.manifest.close()
+
+
+@pytest.fixture
+def backends(uploader, tmp_path):
+    backends = Backends(uploader, tmp_path)
+    yield backends
+    backends.close()
+
+
+def handbook(sentences=400, name="handbook"):
+    return [f"Sentence {i} of the {name} covers policy {i}." for i in range(sentences)]
+
+
+def test_reingest_only_sends_changed_sections(backends):
+    search = backends.search
+    formrecognizer = backends.formrecognizer
+    manifest = backends.manifest
+    ingest = backends.ingest
+    sentences = handbook()
+
+    first = ingest(" ".join(sentences))
+    sections = set(search.documents)
+    assert first.sections_indexed == len(sections)
+    assert set(manifest.get("handbook.txt").sections) == sections
+
+    unchanged = ingest(" ".join(sentences))
+    assert formrecognizer.calls == 1
+    assert search.requests == []
+    assert unchanged.sections_unchanged == len(sections)
+
+    sentences[-1] = "The final policy was rewritten."
+    edited = ingest(" ".join(sentences))
+    assert formrecognizer.calls == 2
+    assert 0 < edited.sections_indexed < len(sections) / 4
+    assert edited.sections_deleted == edited.sections_indexed
+    assert edited.sections_unchanged == len(sections) - edited.sections_deleted
+    assert set(search.documents) == set(manifest.get("handbook.txt").sections)
+    assert any("rewritten" in d["content"] for d in search.documents.values())
+
+
+def test_remove_deletes_from_manifest_without_lookups(backends):
+    backends.ingest(" ".join(handbook()))
+    backends.ingest(" ".join(handbook(name="guide")), filename="guide.txt")
+    guide_sections = {k for k in backends.search.documents if k.startswith("guide")}
+
+    removed = backends.remove("handbook.txt")
+
+    assert removed["blobs"] == 1
+    assert backends.container.listings == 0
+    assert set(backends.container.blobs) == {"guide.txt"}
+    assert set(backends.search.documents) == guide_sections
+    assert backends.manifest.get("handbook.txt") is None
+
+
+def test_remove_without_manifest_entry_searches_once(backends):
+    backends.ingest(" ".join(handbook()))
+    sections = len(backends.search.documents)
+    searches = backends.search.searches
+
+    removed = backends.remove("handbook.txt", manifest=False)
+
+    assert removed == {"blobs": 1, "sections": sections}
+    assert backends.search.searches == searches + 1
+    assert backends.container.blobs == {}
+    assert backends.search.documents == {}
+
+
+def test_first_ingest_replaces_sections_indexed_before_the_manifest(backends):
+    legacy = make_sections(5, sourcefile="handbook.txt")
+    other = make_sections(2, sourcefile="guide.txt")
+    backends.search.documents = {doc["id"]: doc for doc in legacy + other}
+
+    job = backends.ingest(" ".join(handbook()))
+
+    sections = set(backends.manifest.get("handbook.txt").sections)
+    assert job.sections_deleted == len(legacy)
+    assert set(backends.search.documents) == sections | {d["id"] for d in other}
+
+    backends.remove("handbook.txt")
+    assert set(backends.search.documents) == {d["id"] for d in other}
+
+
+def test_failed_ingest_still_records_what_it_wrote(backends):
+    sentences = " ".join(handbook())
+    backends.search.errors = 100
+    with pytest.raises(Exception, match="Cognitive indexer error"):
+        backends.ingest(sentences)
+    recorded = backends.manifest.get("handbook.txt")
+    assert not recorded.complete
+    assert recorded.sections and recorded.pages
+
+    backends.search.errors = 0
+    job = backends.ingest(sentences)
+    assert job.sections_unchanged == 0
+    assert job.sections_indexed == len(recorded.sections)
+    assert backends.manifest.get("handbook.txt").complete
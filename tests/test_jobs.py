@@ -0,0 +1,181 @@
+import io
+import os
+import asyncio
+import threading
+
+import pytest
+
+from functools import partial
+from types import SimpleNamespace
+from fastapi import HTTPException
+from starlette.datastructures import Headers, UploadFile
+from starlette.requests import Request
+
+from athena.libs.jobs import IngestQueue, QueueFull, track
+from athena.routers.file_handler import get_job, upload
+
+
+async def wait_until(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.001)
+
+
+def blocked(gate, calls=None):
+    def fn(job):
+        if calls is not None:
+            calls.append(job.filename)
+        gate.wait(5)
+
+    return fn
+
+
+def app_request(**state):
+    return Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/file/upload",
+            "headers": [],
+            "app": SimpleNamespace(state=SimpleNamespace(**state)),
+        }
+    )
+
+
+def test_jobs_report_stages_progress_and_failures():
+    def ingest(job):
+        with track(job, "chunking"):
+            job.sections_indexed = 3
+
+    def broken(job):
+        with track(job, "analyzing"):
+            raise ValueError("bad pdf")
+
+    async def main():
+        queue = IngestQueue(workers=2, queue_size=4, job_history=10)
+        await queue.start()
+        good = queue.submit("handbook.pdf", "hr", fn=ingest)
+        bad = queue.submit("broken.pdf", None, fn=broken)
+        assert good.stage == "queued" and queue.get(good.id) is good
+        await wait_until(lambda: good.finished_at and bad.finished_at)
+        await queue.stop()
+        return good, bad
+
+    good, bad = asyncio.run(main())
+    assert good.stage == "done" and good.category == "hr"
+    assert good.sections_indexed == 3 and good.error is None
+    assert {"queued", "chunking", "total"} <= good.timings.keys()
+    assert bad.stage == "failed" and bad.error == "bad pdf"
+    assert "analyzing" in bad.timings
+
+
+def test_full_queue_is_rejected_and_stop_cleans_up_queued_jobs(tmp_path):
+    gate = threading.Event()
+    calls = []
+    paths = [tmp_path / f"upload-{i}" for i in range(2)]
+    for path in paths:
+        path.write_bytes(b"%PDF")
+
+    async def main():
+        queue = IngestQueue(workers=1, queue_size=1, job_history=10)
+        await queue.start()
+        running = queue.submit(
+            "a.pdf", None, fn=blocked(gate, calls), cleanup=partial(os.remove, paths[0])
+        )
+        await wait_until(lambda: calls)
+        queued = queue.submit(
+            "b.pdf", None, fn=blocked(gate, calls), cleanup=partial(os.remove, paths[1])
+        )
+        with pytest.raises(QueueFull):
+            queue.submit("c.pdf", None, fn=blocked(gate))
+        gate.set()
+        await queue.stop()
+        return running, queued
+
+    running, queued = asyncio.run(main())
+    assert calls == ["a.pdf"]
+    assert queued.stage == "failed" and "stopped" in queued.error
+    assert paths[0].exists() and not paths[1].exists()
+
+
+def test_history_evicts_only_finished_jobs():
+    gate = threading.Event()
+
+    async def main():
+        queue = IngestQueue(workers=1, queue_size=4, job_history=1)
+        await queue.start()
+        first = queue.submit("a.pdf", None, fn=blocked(gate))
+        second = queue.submit("b.pdf", None, fn=blocked(gate))
+        assert list(queue.jobs) == [first.id, second.id]
+        gate.set()
+        await wait_until(lambda: second.finished_at)
+        third = queue.submit("c.pdf", None, fn=blocked(gate))
+        assert list(queue.jobs) == [third.id]
+        await queue.stop()
+
+    asyncio.run(main())
+
+
+def test_upload_returns_503_and_removes_the_spool_when_the_queue_is_full(tmp_path):
+    gate = threading.Event()
+    spool = tmp_path / "spool"
+    spool.mkdir()
+
+    async def main():
+        queue = IngestQueue(workers=1, queue_size=1, job_history=10)
+        await queue.start()
+        queue.submit("a.pdf", None, fn=blocked(gate))
+        await wait_until(lambda: queue._queue.empty())
+        queue.submit("b.pdf", None, fn=blocked(gate))
+        request = app_request(
+            ingest_queue=queue,
+            upload_spool_dir=str(spool),
+            **dict.fromkeys(
+                (
+                    "blob_container",
+                    "formrecognizer",
+                    "cognitive_search",
+                    "blob_uploader",
+                    "search_indexer",
+                    "ingest_manifest",
+                    "search_cache",
+                    "file_list",
+                    "content_cache",
+                    "vector_store",
+                )
+            ),
+        )
+        uploaded = UploadFile(
+            io.BytesIO(b"%PDF"),
+            filename="c.pdf",
+            headers=Headers({"content-type": "application/pdf"}),
+        )
+        try:
+            with pytest.raises(HTTPException) as e:
+                await upload(request, uploaded)
+        finally:
+            gate.set()
+            await queue.stop()
+        return e.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 503
+    assert list(spool.iterdir()) == []
+
+
+def test_job_endpoint_returns_the_job_or_404():
+    async def main():
+        queue = IngestQueue(workers=1, queue_size=1, job_history=10)
+        await queue.start()
+        job = queue.submit("a.pdf", None, fn=lambda job: None)
+        request = app_request(ingest_queue=queue)
+        found = await get_job(request, job.id)
+        with pytest.raises(HTTPException) as e:
+            await get_job(request, "missing")
+        await queue.stop()
+        return job, found, e.value
+
+    job, found, error = asyncio.run(main())
+    assert found is job
+    assert error.status_code == 404
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from datetime import datetime, timedelta
+
+from athena.libs.listing import FileListCache, logical_name
+
+
+class FakeContainer:
+    def __init__(self, names):
+        self.names = list(names)
+        self.listings = 0
+
+    def list_blobs(self):
+        self.listings += 1
+        start = datetime(2023, 6, 1)
+        return [
+            SimpleNamespace(name=name, size=10, last_modified=start + timedelta(i))
+            for i, name in enumerate(self.names)
+        ]
+
+
+def test_logical_name_groups_page_blobs():
+    assert logical_name("manual-12.pdf") == "manual.pdf"
+    assert logical_name("report-2-0.pdf") == "report-2.pdf"
+    assert logical_name("notes.txt") == "notes.txt"
+    assert logical_name("manual.pdf") == "manual.pdf"
+
+
+def test_page_blobs_are_listed_as_one_file():
+    container = FakeContainer(
+        [f"manual-{i}.pdf" for i in range(500)] + ["notes.txt", "guide-0.pdf"]
+    )
+    listing = FileListCache().page(container, limit=10)
+
+    assert [f.name for f in listing.files] == ["guide.pdf", "manual.pdf", "notes.txt"]
+    manual = listing.files[1]
+    assert manual.blobs == 500
+    assert manual.size == 5000
+    assert manual.last_modified == datetime(2023, 6, 1) + timedelta(499)
+    assert listing.continuation_token is None
+
+
+def test_continuation_tokens_walk_every_file():
+    names = [f"doc{i:03}.txt" for i in range(25)]
+    container = FakeContainer(names)
+    cache = FileListCache()
+
+    seen = []
+    token = None
+    while True:
+        listing = cache.page(container, limit=10, continuation_token=token)
+        seen.extend(f.name for f in listing.files)
+        token = listing.continuation_token
+        if token is None:
+            break
+
+    assert seen == names
+    assert container.listings == 1
+
+
+def test_invalidate_forces_a_fresh_listing():
+    container = FakeContainer(["a.txt"])
+    cache = FileListCache(ttl=60)
+    cache.page(container, limit=10)
+    container.names.append("b.txt")
+    assert len(cache.page(container, limit=10).files) == 1
+
+    cache.invalidate()
+    assert len(cache.page(container, limit=10).files) == 2
+    assert container.listings == 2
@@ -0,0 +1,67 @@
+import sys
+import json
+import logging
+import threading
+
+from athena.core.logger import (
+    JsonFormatter,
+    SamplingFilter,
+    start_queue_listener,
+    stop_queue_listener,
+)
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((threading.current_thread(), self.format(record), record))
+
+
+def make_record(level=logging.INFO, msg="Searched %s", args=("policy",), exc=None):
+    return logging.LogRecord("athena", level, __file__, 1, msg, args, exc)
+
+
+def test_json_formatter_includes_exceptions():
+    try:
+        raise ValueError("bad page")
+    except ValueError:
+        record = make_record(logging.ERROR, exc=sys.exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["level"] == "ERROR" and entry["logger"] == "athena"
+    assert entry["message"] == "Searched policy"
+    assert "ValueError: bad page" in entry["exception"]
+
+
+def test_sampling_keeps_warnings():
+    sampler = SamplingFilter(rate=0.0)
+    assert not sampler.filter(make_record(logging.INFO))
+    assert sampler.filter(make_record(logging.WARNING))
+    assert SamplingFilter(rate=1.0).filter(make_record(logging.DEBUG))
+
+
+def test_queue_handler_formats_on_the_listener_thread():
+    handler = RecordingHandler()
+    queue_handler = start_queue_listener([handler])
+    logger = logging.getLogger("athena.test_logger")
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    try:
+        logger.warning("Indexed %d sections", 3)
+        try:
+            raise RuntimeError("upstream")
+        except RuntimeError:
+            logger.exception("Search failed")
+    finally:
+        stop_queue_listener()
+        logger.removeHandler(queue_handler)
+
+    assert [message for _, message, _ in handler.records][0] == "Indexed 3 sections"
+    assert all(
+        thread is not threading.current_thread() for thread, _, _ in handler.records
+    )
+    # The traceback stays attached for the listener's handlers to render.
+    assert handler.records[1][2].exc_info[0] is RuntimeError
+    assert "RuntimeError: upstream" in handler.records[1][1]
@@ -0,0 +1,105 @@
+import time
+import asyncio
+
+import pytest
+
+from athena.core.models import ChatHistory, IngestJob, Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import FakeAsyncSearchClient, FakeOpenAI
+from athena.libs.jobs import StageTimer, track
+from athena.libs.metrics import (
+    CHAT_STAGE_SECONDS,
+    INGEST_STAGE_SECONDS,
+    OPENAI_TOKENS,
+    Counter,
+    Histogram,
+    Registry,
+)
+
+CHAT_STAGES = ("query_rewrite", "search", "prompt", "completion", "total")
+
+
+def test_histogram_and_counter_render_prometheus_text():
+    registry = Registry()
+    latency = registry.register(
+        Histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1))
+    )
+    tokens = registry.register(Counter("tokens_total", 'Tokens "used"', ("kind",)))
+    for value in (0.05, 0.1, 0.5, 3):
+        latency.observe(value, stage="search")
+    tokens.inc(12, kind='pro"mpt')
+
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{stage="search",le="0.1"} 2',
+        'latency_seconds_bucket{stage="search",le="1"} 3',
+        'latency_seconds_bucket{stage="search",le="+Inf"} 4',
+        'latency_seconds_sum{stage="search"} 3.65',
+        'latency_seconds_count{stage="search"} 4',
+        '# HELP tokens_total Tokens "used"',
+        "# TYPE tokens_total counter",
+        'tokens_total{kind="pro\\"mpt"} 12',
+    ]
+    with pytest.raises(ValueError):
+        latency.observe(1.0)
+    with pytest.raises(ValueError):
+        registry.register(Counter("tokens_total", "Again"))
+
+
+def test_chat_records_stage_spans_tokens_and_optional_timings():
+    rrr = ReadRetrieveReadApproach("sourcepage", "content", openai_client=FakeOpenAI())
+    before = {stage: CHAT_STAGE_SECONDS.count(stage=stage) for stage in CHAT_STAGES}
+    prompt_tokens = OPENAI_TOKENS.value(model="gpt-3.5-turbo", kind="prompt")
+
+    def ask(question, **overrides):
+        return asyncio.run(
+            rrr.arun(
+                search_client=FakeAsyncSearchClient(),
+                history=[ChatHistory(user=question)],
+                overrides=Overrides(**overrides),
+            )
+        )
+
+    plain = ask("What is policy 3?")
+    timed = ask("What is policy 4?", include_timings=True)
+
+    for stage in CHAT_STAGES:
+        assert CHAT_STAGE_SECONDS.count(stage=stage) == before[stage] + 2
+    assert OPENAI_TOKENS.value(model="gpt-3.5-turbo", kind="prompt") > prompt_tokens
+    assert "Timings" not in plain.thoughts
+    assert all(f"{stage} " in timed.thoughts for stage in CHAT_STAGES)
+
+
+def test_track_records_ingest_stages_with_and_without_a_job():
+    before = INGEST_STAGE_SECONDS.count(stage="chunking")
+    job = IngestJob(id="job", filename="handbook.pdf")
+    with track(job, "chunking"):
+        pass
+    with track(None, "chunking"):
+        pass
+    assert job.stage == "chunking" and "chunking" in job.timings
+    assert INGEST_STAGE_SECONDS.count(stage="chunking") == before + 2
+
+
+def test_stage_timer_charges_lazy_generators_to_their_own_stage():
+    job = IngestJob(id="job", filename="handbook.pdf")
+    timer = StageTimer(job)
+    stages = []
+
+    def chunks():
+        for i in range(3):
+            time.sleep(0.02)
+            yield i
+
+    with timer.stage("indexing"):
+        for _ in timer.iterate("chunking", chunks()):
+            stages.append(job.stage)
+            time.sleep(0.01)
+    before = INGEST_STAGE_SECONDS.count(stage="chunking")
+    timer.record()
+
+    assert stages == ["indexing"] * 3
+    assert job.timings["chunking"] >= 0.06
+    assert 0.03 <= job.timings["indexing"] < job.timings["chunking"]
+    assert INGEST_STAGE_SECONDS.count(stage="chunking") == before + 1
@@ -0,0 +1,126 @@
+from athena.core.models import ChatHistory, Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import FakeOpenAI
+from athena.libs.tokens import TokenCounter, context_window
+
+
+class WordEncoding:
+    """One token per whitespace-separated word."""
+
+    name = "words"
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return text.split()
+
+
+def approach(context_windows=None, **kwargs):
+    approach = ReadRetrieveReadApproach(
+        "sourcepage",
+        "content",
+        openai_client=FakeOpenAI(),
+        context_windows=context_windows,
+        **kwargs,
+    )
+    for counter in (approach.gpt_tokens, approach.chatgpt_tokens):
+        counter._encoding = WordEncoding()
+        counter._loaded = True
+    return approach
+
+
+def history(turns):
+    return [
+        ChatHistory(user=f"question {i} " + "word " * 20, bot=f"answer {i}")
+        for i in range(turns)
+    ] + [ChatHistory(user="last question")]
+
+
+def test_token_counts_are_cached():
+    counter = TokenCounter("gpt-3.5-turbo")
+    counter._encoding = WordEncoding()
+    counter._loaded = True
+    assert counter.count("one two three") == 3
+    assert counter.count("one two three") == 3
+    assert counter._encoding.calls == 1
+    assert counter.count("") == 0
+
+
+def test_counter_estimates_without_an_encoding():
+    counter = TokenCounter("gpt-3.5-turbo")
+    counter._loaded = True
+    assert counter.count("x" * 40) == 11
+
+
+def test_load_fetches_the_encoding_before_the_first_count(monkeypatch):
+    loads = []
+    monkeypatch.setattr(
+        TokenCounter,
+        "load_encoding",
+        staticmethod(lambda model: loads.append(model) or WordEncoding()),
+    )
+    counter = TokenCounter("gpt-4")
+    counter.load()
+    assert loads == ["gpt-4"]
+    assert counter.count("one two") == 2
+    assert loads == ["gpt-4"]
+
+
+def test_context_window_is_configurable_per_model():
+    assert context_window("gpt-4") == 8192
+    assert context_window("gpt-4", {"gpt-4": 1000}) == 1000
+    assert context_window("unknown-model") == 4096
+
+
+def test_prompt_fits_the_context_window():
+    rrr = approach(
+        context_windows={"gpt-3.5-turbo": 600}, answer_tokens=100, history_tokens=80
+    )
+    sources = [f"doc{i}.pdf: " + "content " * 50 for i in range(10)]
+    prompt = rrr.build_chat_prompt(sources, history(10), Overrides())
+
+    assert rrr.chatgpt_tokens.messages(prompt) <= 600 - 100
+    assert prompt[-2]["content"] == "last question"
+    system = prompt[0]["content"]
+    assert "doc0.pdf" in system and "doc9.pdf" not in system
+    assert "question 0" not in [message["content"] for message in prompt]
+
+
+def test_history_keeps_the_most_recent_turns():
+    rrr = approach(history_tokens=80)
+    prompt = rrr.build_chat_prompt([], history(10), Overrides())
+    users = [message["content"] for message in prompt if message["role"] == "user"]
+
+    assert users[-1] == "last question"
+    assert users[0].startswith("question 8")
+    assert len(users) == 3
+
+
+def test_oversized_source_is_skipped_for_smaller_ones():
+    rrr = approach()
+    assert rrr.fit_sources(["a " * 10, "b " * 100, "c " * 10], max_tokens=30) == [
+        "a " * 10,
+        "c " * 10,
+    ]
+
+
+def test_chat_history_text_is_trimmed_by_tokens():
+    rrr = approach()
+    turns = history(10)
+    text = rrr.get_chat_history_as_text(turns, include_last_turn=False, max_tokens=60)
+
+    assert text.startswith("<|im_start|>user\nquestion 8")
+    assert text.count("<|im_start|>user") == 2
+    full = rrr.get_chat_history_as_text(turns[:1], include_last_turn=True)
+    assert full == (
+        "<|im_start|>user\n" + turns[0].user + "\n<|im_end|>\n"
+        "<|im_start|>assistant\nanswer 0<|im_end|>\n"
+    )
+
+
+def test_completion_reserves_answer_tokens():
+    rrr = approach(answer_tokens=256)
+    args = rrr.chat_completion_args(chat_prompt=[], overrides=Overrides())
+    assert args["max_tokens"] == 256
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from athena.core.models import ChatHistory, Overrides
+from athena.libs.cache import make_key
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import FakeAsyncSearchClient, FakeOpenAI, FakeSearchClient
+
+HISTORY = [
+    ChatHistory(
+        user="What is policy 3?", bot="Policy 3 covers leave [handbook-3.pdf]."
+    ),
+    ChatHistory(user="And policy 4?"),
+]
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        Overrides(),
+        Overrides(top=5, exclude_category="hr", temperature=0.0),
+        Overrides(deduplicate_sources=False, suggest_followup_questions=False),
+    ],
+)
+def test_arun_matches_run(overrides):
+    openai = FakeOpenAI()
+    rrr = ReadRetrieveReadApproach("sourcepage", "content", openai_client=openai)
+
+    sync = rrr.run(
+        search_client=FakeSearchClient(), history=HISTORY, overrides=overrides
+    )
+    async_ = asyncio.run(
+        rrr.arun(
+            search_client=FakeAsyncSearchClient(),
+            history=HISTORY,
+            overrides=overrides,
+        )
+    )
+
+    assert async_ == sync
+    assert openai.Completion.calls == 2 and openai.ChatCompletion.calls == 2
+
+
+def test_search_keys_fold_the_query_but_not_the_category():
+    def key(query, category):
+        return make_key(
+            *ReadRetrieveReadApproach.search_params(
+                query, Overrides(exclude_category=category)
+            )
+        )
+
+    assert key(" Policy  3", "HR") == key("policy 3", "HR")
+    assert key("policy 3", "HR") != key("policy 3", "hr")
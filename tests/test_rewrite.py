@@ -0,0 +1,144 @@
+import time
+import asyncio
+
+import pytest
+
+from athena.core.models import ChatHistory, Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import FakeAsyncSearchClient, FakeOpenAI
+
+
+class RecordingSearchClient(FakeAsyncSearchClient):
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        self.searches = []
+
+    async def search(self, search_text, filter=None, top=None, **kwargs):
+        self.searches.append((search_text, time.perf_counter()))
+        return await super().search(search_text, filter=filter, top=top, **kwargs)
+
+
+FOLLOW_UP = [
+    ChatHistory(user="What is policy 3?", bot="Policy 3 covers leave."),
+    ChatHistory(user="And policy 4?"),
+]
+
+
+def ask(openai, client, history, mode):
+    rrr = ReadRetrieveReadApproach("sourcepage", "content", openai_client=openai)
+    return asyncio.run(
+        rrr.arun(
+            search_client=client,
+            history=history,
+            overrides=Overrides(query_rewrite=mode),
+        )
+    )
+
+
+def test_first_turn_skips_the_rewrite():
+    openai = FakeOpenAI()
+    client = RecordingSearchClient()
+    response = ask(
+        openai, client, [ChatHistory(user="What is policy 3?")], "speculative"
+    )
+    assert openai.Completion.calls == 0
+    assert [query for query, _ in client.searches] == ["What is policy 3?"]
+    assert "What is policy 3?" in response.thoughts
+
+
+def test_later_turns_search_while_rewriting_and_fuse():
+    openai = FakeOpenAI(latency=0.05, search_query="policy 4 section")
+    client = RecordingSearchClient()
+    start = time.perf_counter()
+    response = ask(openai, client, FOLLOW_UP, "speculative")
+
+    (raw, raw_at), (rewritten, _) = client.searches
+    assert (raw, rewritten) == ("And policy 4?", "policy 4 section")
+    assert raw_at - start < 0.05
+    assert any(point.startswith("handbook-4.pdf") for point in response.data_points)
+
+    always = RecordingSearchClient()
+    ask(FakeOpenAI(search_query="policy 4 section"), always, FOLLOW_UP, "always")
+    assert [query for query, _ in always.searches] == ["policy 4 section"]
+
+
+def test_rewrite_with_the_same_words_keeps_the_speculative_results():
+    openai = FakeOpenAI(search_query="and Policy 4")
+    client = RecordingSearchClient()
+    ask(openai, client, FOLLOW_UP, "speculative")
+    assert openai.Completion.calls == 1
+    assert [query for query, _ in client.searches] == ["And policy 4?"]
+
+
+def test_speculative_search_has_its_own_stage():
+    rrr = ReadRetrieveReadApproach(
+        "sourcepage",
+        "content",
+        openai_client=FakeOpenAI(search_query="policy 4 section"),
+    )
+    timings = {}
+    asyncio.run(
+        rrr.aretrieve(
+            search_client=RecordingSearchClient(),
+            history=FOLLOW_UP,
+            overrides=Overrides(query_rewrite="speculative"),
+            timings=timings,
+        )
+    )
+    assert {"query_rewrite", "search", "speculative_search"} <= timings.keys()
+
+
+def test_failed_search_cancels_the_other_one(monkeypatch):
+    rrr = ReadRetrieveReadApproach(
+        "sourcepage",
+        "content",
+        openai_client=FakeOpenAI(search_query="policy 4 section"),
+    )
+    cancelled = []
+
+    async def acognitive_search(query, **kwargs):
+        if query == "policy 4 section":
+            raise RuntimeError("search failed")
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    monkeypatch.setattr(rrr, "acognitive_search", acognitive_search)
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await rrr.aretrieve(
+                search_client=RecordingSearchClient(),
+                history=FOLLOW_UP,
+                overrides=Overrides(query_rewrite="speculative"),
+            )
+        await asyncio.sleep(0)
+        assert cancelled == ["And policy 4?"]
+
+    asyncio.run(main())
+
+
+def test_speculative_fusion_works_with_custom_field_names():
+    class RenamedFieldsClient(FakeAsyncSearchClient):
+        def query(self, search_text, filter, top):
+            return [
+                {"page": d["sourcepage"], "text": d["content"], "file": d["sourcefile"]}
+                for d in super().query(search_text, filter, top)
+            ]
+
+    rrr = ReadRetrieveReadApproach(
+        "page",
+        "text",
+        openai_client=FakeOpenAI(search_query="policy 4 section"),
+        sourcefile_field="file",
+    )
+    response = asyncio.run(
+        rrr.arun(
+            search_client=RenamedFieldsClient(),
+            history=FOLLOW_UP,
+            overrides=Overrides(query_rewrite="speculative"),
+        )
+    )
+    assert any(point.startswith("handbook-4.pdf") for point in response.data_points)
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from athena.libs.batch_indexer import BatchIndexer
+from athena.libs.ingest import file_section_ids
+from athena.libs.search import (
+    AsyncLocalSearchIndex,
+    LocalSearchIndex,
+    SearchBackend,
+    parse_filter,
+)
+
+SECTIONS = [
+    {
+        "id": "handbook-0",
+        "content": "Employees accrue vacation days every month of service.",
+        "category": "hr",
+        "sourcepage": "handbook-1.pdf",
+        "sourcefile": "handbook.pdf",
+    },
+    {
+        "id": "handbook-1",
+        "content": "Vacation requests go to your manager. Vacation vacation.",
+        "category": "hr",
+        "sourcepage": "handbook-2.pdf",
+        "sourcefile": "handbook.pdf",
+    },
+    {
+        "id": "expenses-0",
+        "content": "Travel expenses need receipts and a manager's approval.",
+        "category": "finance",
+        "sourcepage": "expenses-1.pdf",
+        "sourcefile": "expenses.pdf",
+    },
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalSearchIndex(tmp_path / "index")
+    index.upload_documents(SECTIONS)
+    yield index
+    index.close()
+
+
+def ids(results):
+    return [doc["id"] for doc in results]
+
+
+def test_bm25_ranks_by_term_frequency_and_rarity(index):
+    assert ids(index.search("vacation")) == ["handbook-1", "handbook-0"]
+    assert ids(index.search("manager receipts", top=1)) == ["expenses-0"]
+    assert index.search("nothing matches this") == []
+
+
+def test_filters(index):
+    assert ids(index.search("manager", filter="category ne 'hr'")) == ["expenses-0"]
+    assert ids(index.search("", filter="sourcefile eq 'handbook.pdf'")) == [
+        "handbook-0",
+        "handbook-1",
+    ]
+    assert parse_filter("category ne 'it''s' and sourcefile eq 'a.pdf'") == [
+        ("category", False, "it's"),
+        ("sourcefile", True, "a.pdf"),
+    ]
+    with pytest.raises(ValueError):
+        parse_filter("category gt 'a'")
+
+
+def test_select_and_captions(index):
+    doc = index.search("receipts", select=["id"])[0]
+    assert set(doc) == {"id", "@search.score"}
+    doc = index.search("receipts", query_caption="extractive")[0]
+    assert doc["@search.captions"][0].text == SECTIONS[2]["content"]
+
+
+def test_upload_replaces_and_delete_removes(index):
+    index.upload_documents([{**SECTIONS[0], "content": "Parking is free."}])
+    index.delete_documents([{"id": "handbook-1"}])
+    assert index.search("vacation") == []
+    assert ids(index.search("parking")) == ["handbook-0"]
+    assert len(index) == 2
+
+
+def test_log_is_replayed_and_segments_persist(tmp_path):
+    index = LocalSearchIndex(tmp_path, flush_every=2)
+    index.upload_documents(SECTIONS[:2])
+    assert index.segments.generation == 1 and not index.delta
+    index.upload_documents(SECTIONS[2:])
+    index.delete_documents([{"id": "handbook-0"}])
+
+    # Opening the directory again replays the log as it would after a crash.
+    reopened = LocalSearchIndex(tmp_path)
+    assert ids(reopened.search("vacation manager")) == ids(
+        index.search("vacation manager")
+    )
+    index.close()
+    reopened.close()
+
+    reopened = LocalSearchIndex(tmp_path)
+    assert reopened.segments.pending == 0
+    assert ids(reopened.search("vacation manager")) == ["handbook-1", "expenses-0"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "CURRENT",
+        "log.jsonl",
+        "postings-2.bin",
+        "segment-2.json",
+    ]
+    reopened.close()
+
+
+def test_works_as_a_search_backend(tmp_path):
+    index = LocalSearchIndex(tmp_path)
+    assert isinstance(index, SearchBackend)
+    report = BatchIndexer(max_documents=2).index(client=index, sections=SECTIONS)
+    assert report.batches == 2 and not report.failed
+    assert sorted(file_section_ids(index, "handbook.pdf")) == [
+        "handbook-0",
+        "handbook-1",
+    ]
+    index.close()
+
+
+def test_async_search(index):
+    async def search():
+        results = await AsyncLocalSearchIndex(index).search("receipts", top=3)
+        return [doc async for doc in results]
+
+    assert ids(asyncio.run(search())) == ["expenses-0"]
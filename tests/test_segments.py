@@ -0,0 +1,45 @@
+from athena.libs.segments import SegmentLog
+
+NAMES = ("segment-{}.json", "data-{}.bin")
+
+
+def test_commit_swaps_generations_and_truncates_the_log(tmp_path):
+    log = SegmentLog(tmp_path, NAMES)
+    assert log.generation == 0 and list(log.replay()) == []
+    log.append([{"upload": "a"}, {"delete": "b"}])
+    for path in log.paths(1):
+        path.write_text("1")
+    log.commit(1)
+    log.append([{"upload": "c"}])
+    for path in log.paths(2):
+        path.write_text("2")
+    log.commit(2)
+    log.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "CURRENT",
+        "data-2.bin",
+        "log.jsonl",
+        "segment-2.json",
+    ]
+    reopened = SegmentLog(tmp_path, NAMES)
+    assert reopened.generation == 2 and list(reopened.replay()) == []
+    reopened.close()
+
+
+def test_a_torn_last_line_is_dropped_before_new_appends(tmp_path):
+    log = SegmentLog(tmp_path, NAMES)
+    log.append([{"upload": "a"}])
+    log.close()
+    with open(log.path, "a", encoding="utf-8") as f:
+        f.write('{"upload": "b"')
+
+    reopened = SegmentLog(tmp_path, NAMES)
+    assert list(reopened.replay()) == [{"upload": "a"}]
+    reopened.append([{"delete": "a"}])
+    reopened.close()
+
+    reopened = SegmentLog(tmp_path, NAMES)
+    assert list(reopened.replay()) == [{"upload": "a"}, {"delete": "a"}]
+    assert reopened.pending == 2
+    reopened.close()
@@ -0,0 +1,62 @@
+from athena.core.models import Overrides
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import FakeOpenAI
+from athena.libs.indexer import CognitiveIndex
+from athena.libs.sources import deduplicate, merge_overlap
+
+TEXT = " ".join(
+    f"Sentence {i} of the travel policy covers claim number {i * 7}." for i in range(60)
+)
+
+
+def sections(text=TEXT):
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    return [section for section, _ in index.split_text([(0, 0, text)])]
+
+
+def doc(content, page="policy-1.pdf"):
+    return {"sourcepage": page, "sourcefile": "policy.pdf", "content": content}
+
+
+def test_neighbouring_sections_merge_back_into_the_text():
+    first, second, *_ = sections()
+    merged = merge_overlap(first, second)
+    assert merged == TEXT[: len(merged)]
+    assert merge_overlap(second, first) is None
+    assert merge_overlap(first, "unrelated text that does not overlap") is None
+
+
+def test_overlapping_chunks_of_a_page_are_merged_in_rank_order():
+    chunks = sections()
+    docs = [doc(chunks[1]), doc("other page", "other-1.pdf"), doc(chunks[0])]
+    merged = deduplicate(docs)
+
+    assert [d["sourcepage"] for d in merged] == ["policy-1.pdf", "other-1.pdf"]
+    assert merged[0]["content"] == TEXT[: len(merged[0]["content"])]
+
+
+def test_chunks_of_different_pages_are_not_merged():
+    first, second, *_ = sections()
+    docs = [doc(first, "policy-1.pdf"), doc(second, "policy-2.pdf")]
+    assert deduplicate(docs) == docs
+
+
+def test_near_duplicates_are_dropped():
+    text = sections()[0]
+    docs = [doc(text), doc(text.replace("Sentence 3 ", "Clause 3 "), "copy-1.pdf")]
+    assert deduplicate(docs) == docs[:1]
+    assert deduplicate(docs, threshold=1.0) == docs
+
+
+def test_pack_sources_reports_tokens_saved():
+    rrr = ReadRetrieveReadApproach("sourcepage", "content", openai_client=FakeOpenAI())
+    rrr.chatgpt_tokens._loaded = True
+    chunks = sections()
+    docs = [doc(chunks[0]), doc(chunks[1])]
+
+    sources, saved = rrr.pack_sources(docs, Overrides())
+    assert len(sources) == 1 and saved > 0
+    assert "saving" in rrr.thoughts("query", saved)
+
+    sources, saved = rrr.pack_sources(docs, Overrides(deduplicate_sources=False))
+    assert len(sources) == 2 and saved == 0
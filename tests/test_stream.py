@@ -0,0 +1,83 @@
+import json
+import asyncio
+
+from types import SimpleNamespace
+from starlette.requests import Request
+
+from athena.core.models import Chat
+from athena.routers.chat import chat_approaches, chat_stream
+from tests.fakes import FakeAsyncSearchClient, FakeChatCompletion, FakeOpenAI
+
+
+class FailingSearchClient(FakeAsyncSearchClient):
+    async def search(self, search_text, filter=None, top=None, **kwargs):
+        raise RuntimeError("search is down")
+
+
+class FailingStream(FakeChatCompletion):
+    async def astream(self):
+        async for chunk in super().astream():
+            yield chunk
+            raise RuntimeError("connection reset")
+
+
+def stream(search_client, **overrides):
+    state = SimpleNamespace(
+        async_cognitive_search=search_client,
+        query_cache=None,
+        search_cache=None,
+        vector_store=None,
+    )
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/chat/stream",
+            "headers": [],
+            "app": SimpleNamespace(state=state),
+        }
+    )
+    chat = Chat(
+        history=[{"user": "What is policy 3?"}], approach="rrr", overrides=overrides
+    )
+
+    async def main():
+        response = await chat_stream(request, chat)
+        return response, "".join([chunk async for chunk in response.body_iterator])
+
+    response, body = asyncio.run(main())
+    assert response.media_type == "text/event-stream"
+    assert body.endswith("\n\n")
+    events = []
+    for frame in body[:-2].split("\n\n"):
+        event, data = frame.split("\n")
+        assert event.startswith("event: ") and data.startswith("data: ")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def test_stream_sends_data_points_before_answer_tokens(monkeypatch):
+    openai = FakeOpenAI()
+    monkeypatch.setattr(chat_approaches["rrr"], "openai", openai)
+
+    events = stream(FakeAsyncSearchClient(), suggest_followup_questions=False)
+
+    names = [name for name, _ in events]
+    assert names[0] == "data_points" and names[-1] == "done"
+    assert set(names[1:-1]) == {"answer"}
+    assert events[0][1]["data_points"]
+    answer = "".join(data["content"] for name, data in events if name == "answer")
+    assert answer == openai.ChatCompletion.text
+
+
+def test_stream_reports_failures_as_an_error_event(monkeypatch):
+    openai = FakeOpenAI()
+    monkeypatch.setattr(chat_approaches["rrr"], "openai", openai)
+
+    events = stream(FailingSearchClient())
+    assert events == [("error", {"detail": "search is down"})]
+
+    openai.ChatCompletion = FailingStream(latency=0.0, text="Policy 3 covers leave.")
+    events = stream(FakeAsyncSearchClient(), suggest_followup_questions=False)
+    assert [name for name, _ in events] == ["data_points", "answer", "error"]
+    assert events[-1][1] == {"detail": "connection reset"}
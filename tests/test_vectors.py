@@ -0,0 +1,186 @@
+import asyncio
+import threading
+
+import numpy as np
+import pytest
+
+from athena.core.models import IngestJob, Overrides
+from athena.libs.cache import build_cache
+from athena.libs.chat.readretrieveread import ReadRetrieveReadApproach
+from tests.fakes import SAMPLE_SECTIONS, FakeOpenAI, FakeSearchClient
+from athena.libs.indexer import CognitiveIndex
+from athena.libs.vectors import (
+    Embedder,
+    VectorIndex,
+    VectorStore,
+    normalize,
+    reciprocal_rank_fusion,
+)
+
+
+def docs(count):
+    return [{"id": f"doc-{i}", "category": "a" if i % 2 else "b"} for i in range(count)]
+
+
+def random_vectors(count, dimensions=32, seed=0):
+    return normalize(np.random.default_rng(seed).normal(size=(count, dimensions)))
+
+
+@pytest.fixture
+def store(tmp_path):
+    openai = FakeOpenAI()
+    store = VectorStore(
+        embedder=Embedder(openai_client=openai, batch_size=8),
+        index=VectorIndex(tmp_path),
+    )
+    store.add(SAMPLE_SECTIONS)
+    yield store
+    store.close()
+
+
+def test_embedder_batches_and_caches_by_content():
+    openai = FakeOpenAI()
+    embedder = Embedder(
+        openai_client=openai, batch_size=4, cache=build_cache("memory", 100, None)
+    )
+    texts = [f"text {i}" for i in range(10)] + ["text 0"]
+    vectors = embedder.embed(texts)
+
+    assert vectors.shape == (11, 64)
+    assert openai.Embedding.calls == 3
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1)
+    assert np.array_equal(vectors[0], vectors[10])
+    embedder.embed(texts[:5])
+    assert openai.Embedding.calls == 3
+
+
+def test_async_embedder_reads_a_disk_cache_off_the_event_loop(tmp_path):
+    openai = FakeOpenAI()
+    cache = build_cache("disk", 100, None, path=tmp_path / "embeddings.db")
+    embedder = Embedder(openai_client=openai, batch_size=4, cache=cache)
+    threads = []
+    get = cache.get
+    cache.get = lambda key: threads.append(threading.current_thread()) or get(key)
+
+    texts = [f"text {i}" for i in range(6)]
+    vectors = asyncio.run(embedder.aembed(texts))
+    assert np.array_equal(asyncio.run(embedder.aembed(texts)), vectors)
+    assert np.array_equal(embedder.embed(texts), vectors)
+
+    assert openai.Embedding.calls == 2
+    assert threading.main_thread() not in threads[:12]
+    cache.close()
+
+
+def test_query_embeddings_are_not_cached(tmp_path):
+    cache = build_cache("memory", 100, None)
+    store = VectorStore(
+        embedder=Embedder(openai_client=FakeOpenAI(), batch_size=8, cache=cache),
+        index=VectorIndex(tmp_path),
+    )
+    store.add(SAMPLE_SECTIONS)
+    size = len(cache)
+    store.search("What is policy 3?")
+    asyncio.run(store.asearch("What is policy 4?"))
+
+    assert size == len(SAMPLE_SECTIONS) and len(cache) == size
+    store.close()
+
+
+def test_exhaustive_search_filters_and_deletes(tmp_path):
+    vectors = random_vectors(100)
+    index = VectorIndex(tmp_path, dtype="float32")
+    index.add(docs(100), vectors)
+
+    hits = index.search(vectors[7], top=3)
+    assert hits[0][0]["id"] == "doc-7"
+    assert hits[0][1] == pytest.approx(1.0)
+    assert [score for _, score in hits] == sorted(
+        (score for _, score in hits), reverse=True
+    )
+    assert index.search(vectors[7], top=3, filter="category ne 'b'")[0][0]["id"] == (
+        "doc-7"
+    )
+    assert index.search(vectors[7], top=3, filter="category eq 'b'")[0][0]["id"] != (
+        "doc-7"
+    )
+    index.delete(["doc-7"])
+    assert "doc-7" not in index
+    assert index.search(vectors[7], top=1)[0][0]["id"] != "doc-7"
+    index.close()
+
+
+def test_segments_are_memory_mapped_and_log_is_replayed(tmp_path):
+    vectors = random_vectors(60)
+    index = VectorIndex(tmp_path, flush_every=50)
+    index.add(docs(50), vectors[:50])
+    assert index.segments.generation == 1 and isinstance(index.matrix, np.memmap)
+    assert index.matrix.dtype == np.float16
+    index.add(docs(60)[50:], vectors[50:])
+    index.delete(["doc-3"])
+
+    reopened = VectorIndex(tmp_path)
+    assert len(reopened) == 59
+    assert reopened.search(vectors[55], top=1)[0][0]["id"] == "doc-55"
+    index.close()
+    reopened.close()
+
+    reopened = VectorIndex(tmp_path)
+    assert reopened.segments.generation == 2 and len(reopened.matrix) == 59
+    assert reopened.search(vectors[3], top=1)[0][0]["id"] != "doc-3"
+    reopened.close()
+
+
+def test_ivf_partitions_keep_recall(tmp_path):
+    vectors = random_vectors(2000, dimensions=16)
+    index = VectorIndex(tmp_path, partitions=16, probes=4, flush_every=2000)
+    index.add(docs(2000), vectors)
+    assert index.centroids.shape == (16, 16)
+    assert index.offsets[-1] == 2000
+
+    queries = range(0, 2000, 20)
+    found = sum(
+        index.search(vectors[i], top=1)[0][0]["id"] == f"doc-{i}" for i in queries
+    )
+    assert found / len(queries) >= 0.9
+    index.close()
+
+
+def test_reciprocal_rank_fusion():
+    first = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    second = [{"id": "c"}, {"id": "b"}, {"id": "d"}]
+    fused = reciprocal_rank_fusion([first, second], key=lambda doc: doc["id"], top=3)
+    assert [doc["id"] for doc in fused] == ["c", "b", "a"]
+
+
+def test_retrieval_modes(store):
+    rrr = ReadRetrieveReadApproach("sourcepage", "content", openai_client=FakeOpenAI())
+    client = FakeSearchClient()
+    query = "Section 25 of the employee handbook"
+
+    def search(mode):
+        return rrr.cognitive_search(
+            query=query,
+            client=client,
+            overrides=Overrides(retrieval_mode=mode),
+            vectors=store,
+        )
+
+    assert search("vector")[0]["sourcepage"] == "handbook-25.pdf"
+    hybrid = search("hybrid")
+    assert len(hybrid) == 3
+    assert "handbook-25.pdf" in [doc["sourcepage"] for doc in hybrid]
+    assert rrr.cognitive_search(
+        query=query, client=client, overrides=Overrides(retrieval_mode="vector")
+    ) == search("text")
+
+
+def test_ingest_embeds_only_sections_missing_from_the_index(store):
+    index = CognitiveIndex.__new__(CognitiveIndex)
+    index.job = IngestJob(id="job", filename="handbook.pdf")
+    sections = SAMPLE_SECTIONS[:5] + [
+        {**SAMPLE_SECTIONS[0], "id": "new-section", "content": "A new policy."}
+    ]
+    assert list(index.embed_sections(sections, store)) == sections
+    assert index.job.sections_embedded == 1
+    assert "new-section" in store